@@ -0,0 +1,272 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bump when the bundle layout changes
+BUNDLE_FORMAT = 1
+
+# Bundle loaded by the API when it exists, overridable with ARTIFACT_BUNDLE
+DEFAULT_BUNDLE_DIR = 'model_bundle'
+
+# Reference tables shipped with the model, by CSV file stem
+TABLE_NAMES = ('city_center_coords', 'encoded_neighb_city', 'Regions_capitals')
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_bundle(output_dir: str = DEFAULT_BUNDLE_DIR, model_path: str = 'gbm_optuna_model.pkl',
+                 target_scaler_path: str = 'target_scaler.pkl',
+                 standard_scaler_path: str = 'standard_scaler.pkl') -> Dict[str, Any]:
+    """
+    Compile the model, scalers, encoders, reference tables and flattened trees into one
+    versioned directory that the API can load without re-reading or refitting anything.
+
+    Layout:
+        manifest.json     version, column layouts, tree metadata, the reference tables and
+                          the keys of the precomputed location table
+        arrays/*.npy      flattened tree node arrays and the location table's transformed and
+                          scaled per-neighborhood features, memory-mapped at load
+        transformers.pkl  fitted target scaler, feature scaler and one-hot encoders
+        model.pkl         the GradientBoostingRegressor, only unpickled when needed
+
+    Args:
+        output_dir (str, optional): Bundle directory, replaced if it exists. Defaults to DEFAULT_BUNDLE_DIR.
+        model_path (str, optional): Path to the pickled model. Defaults to 'gbm_optuna_model.pkl'.
+        target_scaler_path (str, optional): Path to the target scaler. Defaults to 'target_scaler.pkl'.
+        standard_scaler_path (str, optional): Path to the feature scaler. Defaults to 'standard_scaler.pkl'.
+
+    Returns:
+        Dict[str, Any]: The written manifest
+    """
+    from model_loader import ModelLoader
+
+    # Load through the regular path so the bundle holds exactly what the service would use
+    loader = ModelLoader(model_path, target_scaler_path, standard_scaler_path, cache_size=0)
+    preprocessor = loader.preprocessor
+
+    staging = tempfile.mkdtemp(prefix='.bundle-', dir=os.path.dirname(os.path.abspath(output_dir)))
+    try:
+        os.makedirs(os.path.join(staging, 'arrays'))
+        arrays = {}
+        tree_engine = None
+        if loader.tree_engine is not None:
+            tree_engine = {
+                'init_value': loader.tree_engine.init_value,
+                'max_depth': loader.tree_engine.max_depth,
+                'n_features': loader.tree_engine.n_features,
+                'n_trees': loader.tree_engine.n_trees,
+            }
+            arrays.update({f'tree_{name}': array for name, array in loader.tree_engine.arrays().items()})
+        arrays['location_values'] = preprocessor.location_values
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, 'arrays', f'{name}.npy'), np.ascontiguousarray(array))
+
+        shutil.copyfile(model_path, os.path.join(staging, 'model.pkl'))
+        with open(os.path.join(staging, 'transformers.pkl'), 'wb') as f:
+            pickle.dump({
+                'target_scaler': loader.target_scaler,
+                'standard_scaler': preprocessor.scaler,
+                'encoders': preprocessor.encoders,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'sources': {os.path.basename(path): _sha256(path) for path in
+                        (model_path, target_scaler_path, standard_scaler_path)},
+            'training_columns': preprocessor.training_columns,
+            'scaled_columns': preprocessor.scaled_columns,
+            'encoder_categories': {col: [str(cat) for cat in encoder.categories_[0]]
+                                   for col, encoder in preprocessor.encoders.items()},
+            'tree_engine': tree_engine,
+            'arrays': sorted(arrays),
+            'tables': {name: pd.read_csv(f'{name}.csv').to_dict(orient='list') for name in TABLE_NAMES},
+            'location_keys': preprocessor.location_table['keys'],
+            'feature_reference': preprocessor.feature_reference,
+        }
+
+        # The version is a digest of everything in the bundle, so rebuilding the same inputs keeps it
+        digest = hashlib.sha256(json.dumps(manifest, sort_keys=True, ensure_ascii=False).encode())
+        for name in ['model.pkl', 'transformers.pkl'] + [f'arrays/{name}.npy' for name in sorted(arrays)]:
+            digest.update(_sha256(os.path.join(staging, name)).encode())
+        manifest['version'] = digest.hexdigest()[:16]
+        manifest['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+        with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        # Swap the finished bundle into place
+        os.chmod(staging, 0o755)
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(staging, output_dir)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    logger.info("Built artifact bundle %s (version %s)", output_dir, manifest['version'])
+    return manifest
+
+
+class ArtifactBundle:
+    def __init__(self, path: str):
+        """
+        Open a bundle written by build_bundle. Arrays are memory-mapped read-only, so
+        processes loading the same bundle share their pages; the model is unpickled lazily,
+        but from a file descriptor opened here, so a bundle rebuilt in place meanwhile cannot
+        pair its model with this bundle's arrays and scalers.
+
+        Args:
+            path (str): Bundle directory
+
+        Raises:
+            ValueError: If the bundle was written in another format
+        """
+        self.path = path
+        with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format {self.manifest.get('format')} in {path}")
+        self.version = self.manifest['version']
+        self.training_columns = self.manifest['training_columns']
+
+        self.arrays = {
+            name: np.load(os.path.join(path, 'arrays', f'{name}.npy'), mmap_mode='r')
+            for name in self.manifest['arrays']
+        }
+        with open(os.path.join(path, 'transformers.pkl'), 'rb') as f:
+            transformers = pickle.load(f)
+        self.target_scaler = transformers['target_scaler']
+        self.standard_scaler = transformers['standard_scaler']
+        self.encoders = transformers['encoders']
+
+        # Bundles built before the location table existed leave it to FeaturePreprocessor
+        self.location_table = None
+        if 'location_keys' in self.manifest:
+            self.location_table = {'keys': self.manifest['location_keys'], 'values': self.arrays['location_values']}
+
+        self._tables = {}
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._model_fd = os.open(os.path.join(path, 'model.pkl'), os.O_RDONLY)
+
+    @property
+    def model(self):
+        """The GradientBoostingRegressor, unpickled on first access."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    # pread leaves the descriptor's offset alone, which forked workers share
+                    data = os.pread(self._model_fd, os.fstat(self._model_fd).st_size, 0)
+                    self._model = pickle.loads(data)
+                    os.close(self._model_fd)
+        return self._model
+
+    def tree_engine(self):
+        """
+        Rebuild the compiled tree engine over the memory-mapped node arrays.
+
+        Returns:
+            CompiledTreeEnsemble: The engine, or None if the model could not be compiled at build time
+        """
+        from tree_engine import CompiledTreeEnsemble
+
+        meta = self.manifest['tree_engine']
+        if meta is None:
+            return None
+        arrays = {name: self.arrays[f'tree_{name}'] for name in CompiledTreeEnsemble.ARRAY_NAMES}
+        return CompiledTreeEnsemble.from_arrays(arrays, meta['init_value'], meta['max_depth'], meta['n_features'])
+
+    def table(self, name: str) -> pd.DataFrame:
+        """
+        Return a reference table, e.g. 'city_center_coords', as it was read from its CSV.
+
+        Args:
+            name (str): CSV file stem
+
+        Returns:
+            pd.DataFrame: The table
+        """
+        if name not in self._tables:
+            self._tables[name] = pd.DataFrame(self.manifest['tables'][name])
+        return self._tables[name]
+
+
+@lru_cache(maxsize=8)
+def _open_bundle(path: str, manifest_stat: tuple) -> ArtifactBundle:
+    return ArtifactBundle(path)
+
+
+def open_bundle(path: str) -> ArtifactBundle:
+    """
+    Open a bundle once per process and build: a bundle rebuilt in place has a new manifest
+    file, so it is opened again instead of served from the cache.
+    """
+    stat = os.stat(os.path.join(path, 'manifest.json'))
+    return _open_bundle(os.path.abspath(path), (stat.st_ino, stat.st_mtime_ns))
+
+
+def default_bundle_path() -> Optional[str]:
+    """
+    Return the bundle the service should load, or None to fall back to the loose artifacts.
+
+    Returns:
+        Optional[str]: ARTIFACT_BUNDLE, else DEFAULT_BUNDLE_DIR, if it holds a manifest
+    """
+    path = os.getenv('ARTIFACT_BUNDLE', DEFAULT_BUNDLE_DIR)
+    if path and os.path.exists(os.path.join(path, 'manifest.json')):
+        return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def read_table(name: str) -> pd.DataFrame:
+    """
+    Read a reference table once per process, from the default bundle when there is one
+    and from its CSV otherwise; ModelRegistry.load clears the cache to pick up rewritten
+    artifacts. Callers must not modify the returned frame.
+
+    Args:
+        name (str): CSV file stem, e.g. 'city_center_coords'
+
+    Returns:
+        pd.DataFrame: The table
+    """
+    path = default_bundle_path()
+    if path is not None:
+        return open_bundle(path).table(name)
+    return pd.read_csv(f'{name}.csv')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the model artifacts into one versioned bundle")
+    parser.add_argument('--output', default=DEFAULT_BUNDLE_DIR, help="Bundle directory")
+    parser.add_argument('--model', default='gbm_optuna_model.pkl', help="Pickled GradientBoostingRegressor")
+    parser.add_argument('--target-scaler', default='target_scaler.pkl', help="Pickled target scaler")
+    parser.add_argument('--standard-scaler', default='standard_scaler.pkl', help="Pickled feature scaler")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Build from the loose CSVs, not from a bundle that is about to be replaced
+    os.environ['ARTIFACT_BUNDLE'] = ''
+    manifest = build_bundle(args.output, args.model, args.target_scaler, args.standard_scaler)
+    print(f"{args.output}: version {manifest['version']}")
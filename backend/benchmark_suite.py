@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from artifact_bundle import default_bundle_path
+from benchmarks import border_corpus
+from model_loader import COMPILED_MAX_ROWS, ModelLoader
+from tree_engine import StackedTreeEnsembles
+
+logger = logging.getLogger(__name__)
+
+# Batch sizes ModelLoader.predict_batch is measured at
+PREDICT_BATCH_SIZES = (1, 10, 100, 10000)
+
+# Largest number of extra models stacked on the point model by bench_intervals
+MAX_EXTRA_MODELS = 4
+
+# Median slowdown, as a fraction of the baseline, reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.2
+
+
+def measure(func: Callable, setup: Optional[Callable] = None, rounds: int = 50,
+            min_time: float = 0.2, warmup: int = 2) -> Dict[str, Any]:
+    """
+    Time func over several rounds and summarize the timings.
+
+    Args:
+        func (Callable): Called with setup's result, or without arguments if there is no setup
+        setup (Callable, optional): Builds the argument of every round outside of the timing,
+            e.g. a fresh copy of a DataFrame that func modifies
+        rounds (int, optional): Minimum number of timed rounds. Defaults to 50.
+        min_time (float, optional): Keep timing until this many seconds have passed. Defaults to 0.2.
+        warmup (int, optional): Untimed rounds run first. Defaults to 2.
+
+    Returns:
+        Dict[str, Any]: rounds and min/median/mean/p95/max/stdev in microseconds
+    """
+    def run_once() -> float:
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run_once()
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < rounds or time.perf_counter() < deadline:
+        timings.append(run_once())
+
+    timings = np.array(timings) * 1e6
+    return {
+        'rounds': len(timings),
+        'min_us': float(timings.min()),
+        'median_us': float(np.median(timings)),
+        'mean_us': float(timings.mean()),
+        'p95_us': float(np.percentile(timings, 95)),
+        'max_us': float(timings.max()),
+        'stdev_us': float(timings.std()),
+    }
+
+
+def bench_preprocessing(loader: ModelLoader, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Time preprocess_features, each of its stages on a 100-row frame, and the pandas-free builders."""
+    preprocessor = loader.preprocessor
+    frame = pd.DataFrame(records[:100])
+    engineered = preprocessor._apply_feature_engineering(frame.copy())
+    categorical = preprocessor._preprocess_categorical_features(engineered.copy())
+    numeric = preprocessor._preprocess_numeric_features(categorical.copy())
+
+    return {
+        'preprocess_features': measure(lambda: preprocessor.preprocess_features(records[0])),
+        'stage.feature_engineering[100]': measure(preprocessor._apply_feature_engineering, frame.copy),
+        'stage.categorical[100]': measure(preprocessor._preprocess_categorical_features, engineered.copy),
+        'stage.numeric[100]': measure(preprocessor._preprocess_numeric_features, categorical.copy),
+        'stage.combine[100]': measure(preprocessor._combine_features, numeric.copy),
+        'build_feature_vector': measure(lambda: preprocessor.build_feature_vector(records[0])),
+        'build_feature_matrix[100]': measure(lambda: preprocessor.build_feature_matrix(records[:100])),
+    }
+
+
+def bench_border_types(loader: ModelLoader) -> Dict[str, Dict[str, Any]]:
+    """Time get_border_type over realistic descriptions, without and with the memo."""
+    preprocessor = loader.preprocessor
+    corpus = border_corpus(size=2000)
+
+    def classify_all(*_):
+        for text in corpus:
+            preprocessor.get_border_type(text)
+
+    # Per 2000 descriptions; divide by 2000 for the per-call cost
+    return {
+        'get_border_type[2000].cold_memo': measure(classify_all, setup=preprocessor._classify_border.cache_clear,
+                                                   rounds=10),
+        'get_border_type[2000].warm_memo': measure(classify_all, rounds=10),
+    }
+
+
+def bench_predict(loader: ModelLoader, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Time ModelLoader.predict, predict_batch at every size in PREDICT_BATCH_SIZES, and explain_batch."""
+    results = {'predict': measure(lambda: loader.predict(records[0]))}
+    for size in PREDICT_BATCH_SIZES:
+        batch = records[:size]
+        results[f'predict_batch[{size}]'] = measure(lambda: loader.predict_batch(batch),
+                                                    rounds=5 if size >= 1000 else 50)
+    if loader.tree_engine is not None:
+        for size in (1, 100):
+            batch = records[:size]
+            results[f'explain_batch[{size}]'] = measure(lambda: loader.explain_batch(batch))
+    return results
+
+
+def bench_intervals(loader: ModelLoader, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Time one compiled pass with 0 to MAX_EXTRA_MODELS extra ensembles stacked on the point model,
+    the cost of every quantile model, and predict_intervals with the configured quantile models.
+    Copies of the point model's trees stand in for quantile models of the same size.
+    """
+    results = {}
+    if loader.tree_engine is None:
+        return results
+    features = loader.preprocessor.build_feature_matrix(records[:COMPILED_MAX_ROWS])
+    for extra in range(MAX_EXTRA_MODELS + 1):
+        stacked = StackedTreeEnsembles([loader.tree_engine] * (extra + 1))
+        for size in (1, COMPILED_MAX_ROWS):
+            results[f'stacked_predict[{size}].extra_models[{extra}]'] = measure(lambda: stacked.predict(features[:size]))
+    if loader.quantile_model_paths:
+        for size in (1, COMPILED_MAX_ROWS):
+            batch = records[:size]
+            results[f'predict_intervals[{size}]'] = measure(lambda: loader.predict_intervals(batch))
+    return results
+
+
+def bench_monitoring(loader: ModelLoader, records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Time adding feature rows to the drift sketches and reading the drift scores and the report."""
+    results = {}
+    features = loader.preprocessor.build_feature_matrix(records[:100])
+    for size in (1, 100):
+        results[f'monitor_observe[{size}]'] = measure(lambda: loader.monitor.observe(features[:size]))
+    results['monitor_drift'] = measure(loader.monitor.drift)
+    results['monitor_report'] = measure(loader.monitor.report)
+    return results
+
+
+async def _load_api(app, records: List[Dict[str, Any]], concurrency: int, requests: int) -> Dict[str, Any]:
+    import httpx
+
+    latencies = []
+    statuses = {}
+    pending = iter(range(requests))
+
+    async def client_loop(client):
+        for i in pending:
+            start = time.perf_counter()
+            response = await client.post('/predict', json=records[i % len(records)])
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            # Warm up the worker pool and the routes outside of the measurement
+            await asyncio.gather(*[client.post('/predict', json=record) for record in records[:concurrency]])
+            start = time.perf_counter()
+            await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+            elapsed = time.perf_counter() - start
+    finally:
+        await app.router.shutdown()
+
+    latencies = np.array(latencies) * 1e6
+    return {
+        'rounds': len(latencies),
+        'concurrency': concurrency,
+        'requests_per_second': requests / elapsed,
+        'median_us': float(np.median(latencies)),
+        'p95_us': float(np.percentile(latencies, 95)),
+        'p99_us': float(np.percentile(latencies, 99)),
+        'max_us': float(latencies.max()),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def bench_api(records: List[Dict[str, Any]], concurrency: int = 32, requests: int = 1000) -> Dict[str, Dict[str, Any]]:
+    """Drive POST /predict of the full app through an in-process ASGI client with concurrent callers."""
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        logger.warning("Skipping the api benchmarks: they require httpx (pip install httpx)")
+        return {}
+    # Every record is scored, not served from the cache
+    os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+    import main
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    return {f'api.predict[concurrency={concurrency}]': asyncio.run(_load_api(main.app, records, concurrency, requests))}
+
+
+def environment() -> Dict[str, Any]:
+    """Describe the machine and code a run was made on, so results are only compared like for like."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'bundle': default_bundle_path(),
+    }
+
+
+def run_suite(groups: List[str], seed: int = 0) -> Dict[str, Any]:
+    """
+    Run the selected benchmark groups on synthetic records drawn from the reference tables.
+
+    Args:
+        groups (List[str]): Any of 'preprocessing', 'border_types', 'predict', 'intervals', 'monitoring' and 'api'
+        seed (int, optional): Seed of the synthetic records. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: {'environment': ..., 'results': {benchmark name: statistics}}
+    """
+    loader = ModelLoader(model_path='gbm_optuna_model.pkl', target_scaler_path='target_scaler.pkl',
+                         standard_scaler_path='standard_scaler.pkl', cache_size=0,
+                         bundle_path=default_bundle_path(),
+                         quantile_model_paths=[path.strip() for path in os.getenv('QUANTILE_MODEL_PATHS', '').split(',')
+                                               if path.strip()])
+    records = loader.preprocessor.synthetic_inputs(max(PREDICT_BATCH_SIZES), seed=seed)
+
+    results = {}
+    for group in groups:
+        logger.info("Running %s benchmarks", group)
+        if group == 'preprocessing':
+            results.update(bench_preprocessing(loader, records))
+        elif group == 'border_types':
+            results.update(bench_border_types(loader))
+        elif group == 'predict':
+            results.update(bench_predict(loader, records))
+        elif group == 'intervals':
+            results.update(bench_intervals(loader, records))
+        elif group == 'monitoring':
+            results.update(bench_monitoring(loader, records))
+        elif group == 'api':
+            results.update(bench_api(records))
+    return {'environment': environment(), 'results': results}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """
+    Compare median timings with a baseline run.
+
+    Args:
+        results (Dict[str, Any]): Output of run_suite
+        baseline (Dict[str, Any]): Earlier output of run_suite
+        threshold (float, optional): Relative slowdown reported as a regression. Defaults to REGRESSION_THRESHOLD.
+
+    Returns:
+        List[str]: Names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, stats in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = stats['median_us'] / before['median_us'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"  {name:45} {before['median_us']:12.1f}us -> {stats['median_us']:12.1f}us  {change:+7.1%}{flag}")
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    for name, stats in results['results'].items():
+        extra = f", {stats['requests_per_second']:.0f} req/s" if 'requests_per_second' in stats else ''
+        print(f"  {name:45} median {stats['median_us']:12.1f}us, p95 {stats['p95_us']:12.1f}us{extra}")
+
+
+if __name__ == '__main__':
+    groups = ['preprocessing', 'border_types', 'predict', 'intervals', 'monitoring', 'api']
+    parser = argparse.ArgumentParser(description="Benchmark the prediction pipeline end to end")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file the results are written to")
+    parser.add_argument('--compare', help="Earlier results to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative median slowdown that fails the comparison")
+    parser.add_argument('--only', nargs='+', choices=groups, default=groups, help="Benchmark groups to run")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic records")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run_suite(args.only, seed=args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results written to {args.output}:")
+    print_results(results)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} ({baseline['environment'].get('commit')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
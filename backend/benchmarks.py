@@ -0,0 +1,142 @@
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+from preprocessing import FeaturePreprocessor
+from artifact_bundle import default_bundle_path
+
+# Border descriptions as they appear in valuation deeds; numbers are varied per sample
+BORDER_TEMPLATES = [
+    "شارع عرض {n} م", "شارع عرض {n}م", "طريق الملك فهد", "قطعة رقم {n}", "قطعة رقم بدون",
+    "قطعة رقم {n}وشارع عرض 12 م", "جار", "منزل المواطن", "مبنى تجاري", "محل", "مسجد",
+    "أرض فضاء", "ارض فضاء", "ساحة", "الــقـــطــعــة رقم {n}", "ممر مشاة عرض {n} م",
+    "مواقف سيارات", "حديقة عامة", "ميدان", "Street {n}m", "Neighbor", "Governmental facility",
+    "Parking", "part of plot {n}", "بدون", "غير محدد", "مزرعة", "فناء", "برحة",
+]
+
+
+def border_corpus(size: int = 20000, seed: int = 0) -> list:
+    """Generate border descriptions with the repetition seen in real requests."""
+    rng = random.Random(seed)
+    return [rng.choice(BORDER_TEMPLATES).format(n=rng.randint(1, 60)) for _ in range(size)]
+
+
+def get_border_type_loop(border_keywords: dict, border_description: str) -> str:
+    """The original keyword loop, kept as the baseline for comparison."""
+    if pd.isna(border_description):
+        return 'Other'
+    border_description_lower = str(border_description).lower()
+    for type_name, keywords in border_keywords.items():
+        if any(keyword in border_description_lower for keyword in keywords):
+            return type_name
+    return 'Other'
+
+
+def time_per_call(func, inputs: list) -> float:
+    """Return the mean time per call in microseconds."""
+    start = time.perf_counter()
+    for value in inputs:
+        func(value)
+    return (time.perf_counter() - start) / len(inputs) * 1e6
+
+
+def bench_border_types(preprocessor: FeaturePreprocessor):
+    """Compare the compiled border matcher with the original keyword loop."""
+    corpus = border_corpus()
+    keywords = preprocessor.border_keywords
+
+    mismatches = [text for text in corpus
+                  if preprocessor.get_border_type(text) != get_border_type_loop(keywords, text)]
+    assert not mismatches, f"Border type mismatch for: {mismatches[:5]}"
+
+    loop = time_per_call(lambda text: get_border_type_loop(keywords, text), corpus)
+    preprocessor._classify_border.cache_clear()
+    uncached = time_per_call(lambda text: preprocessor._match_border_type(text.lower()), corpus)
+    cached = time_per_call(preprocessor.get_border_type, corpus)
+
+    print(f"get_border_type over {len(corpus)} descriptions:")
+    print(f"  keyword loop:      {loop:.2f}us/call")
+    print(f"  compiled matcher:  {uncached:.2f}us/call")
+    print(f"  matcher + memo:    {cached:.2f}us/call ({preprocessor._classify_border.cache_info()})")
+
+
+def bench_feature_build(preprocessor: FeaturePreprocessor, sizes=(1, 100, 5000)):
+    """Compare the DataFrame pipeline, the row builder and the batch builder over the location table."""
+    print("Feature build per batch (median of 5):")
+    for size in sizes:
+        records = preprocessor.synthetic_inputs(size)
+        timings = {}
+        for label, build in (("DataFrame", preprocessor.preprocess_batch),
+                             ("row by row", lambda batch: [preprocessor.build_feature_vector(r) for r in batch]),
+                             ("matrix", preprocessor.build_feature_matrix)):
+            runs = []
+            for _ in range(5):
+                start = time.perf_counter()
+                build(records)
+                runs.append(time.perf_counter() - start)
+            timings[label] = np.median(runs) * 1000
+        print(f"  {size:>5} rows: " + ", ".join(f"{label} {ms:.2f}ms" for label, ms in timings.items()))
+
+
+# Run in a fresh interpreter: import the libraries, then load the input model and the predictor
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import pandas, pydantic, sklearn.ensemble, sklearn.preprocessing
+imported = time.perf_counter()
+import models
+from model_loader import ModelLoader
+validation = time.perf_counter()
+ModelLoader(model_path='gbm_optuna_model.pkl', bundle_path={bundle_path!r})
+print(imported - start, validation - imported, time.perf_counter() - validation)
+"""
+
+
+def bench_startup(bundle_path: str, repeats: int = 5):
+    """Compare cold-start time from the loose artifacts and from the compiled bundle."""
+    print(f"Cold start over {repeats} fresh processes (median):")
+    for label, path in (("loose artifacts", None), ("artifact bundle", bundle_path)):
+        # An empty ARTIFACT_BUNDLE keeps models.py on the CSVs for the baseline
+        env = dict(os.environ, ARTIFACT_BUNDLE=path or "",
+                   PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.abspath(__file__))] + sys.path))
+        timings = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT.format(bundle_path=path)],
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            timings.append([float(value) for value in output.split()])
+        imports, validation, load = np.median(timings, axis=0) * 1000
+        print(f"  {label + ':':17}  libraries {imports:.1f}ms, models.py {validation:.1f}ms, "
+              f"ModelLoader {load:.1f}ms")
+
+
+def bench_bulk(rows: int = 50000, chunk_size: int = 5000):
+    """Measure bulk valuation throughput and peak memory on a synthetic CSV."""
+    from bulk import run_bulk
+    from model_loader import ModelLoader
+
+    loader = ModelLoader(model_path='gbm_optuna_model.pkl', cache_size=0, bundle_path=default_bundle_path())
+    source = io.BytesIO(pd.DataFrame(loader.preprocessor.synthetic_inputs(rows)).to_csv(index=False).encode())
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    output_bytes = sum(len(text) for text in run_bulk(source, loader.predict_batch, 'csv', 'csv', chunk_size))
+    elapsed = time.perf_counter() - start
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Bulk valuation of {rows} CSV rows in chunks of {chunk_size}:")
+    print(f"  {rows / elapsed:.0f} rows/s, {output_bytes / 1e6:.1f}MB written, "
+          f"peak RSS {rss_after / 1024:.0f}MB (+{(rss_after - rss_before) / 1024:.0f}MB)")
+
+
+if __name__ == "__main__":
+    preprocessor = FeaturePreprocessor()
+    bench_border_types(preprocessor)
+    bench_feature_build(preprocessor)
+    bench_bulk()
+    if default_bundle_path() is not None:
+        bench_startup(default_bundle_path())
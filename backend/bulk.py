@@ -0,0 +1,254 @@
+import csv
+import io
+import json
+import logging
+import math
+import time
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from metrics import BULK_ROWS
+from models import validate_records
+
+logger = logging.getLogger(__name__)
+
+INPUT_FORMATS = ('csv', 'ndjson', 'parquet')
+OUTPUT_FORMATS = ('ndjson', 'csv')
+MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+# Rows read, validated and scored at a time; bounds memory regardless of the file size
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class InvalidLine:
+    """Placeholder for an input line that could not be parsed into a record."""
+
+    __slots__ = ('error',)
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Guess the input format from a file name or a Content-Type header.
+
+    Returns:
+        Optional[str]: One of INPUT_FORMATS, or None if unknown
+    """
+    if filename:
+        extension = filename.rsplit('.', 1)[-1].lower()
+        if extension in ('csv', 'parquet'):
+            return extension
+        if extension in ('ndjson', 'jsonl'):
+            return 'ndjson'
+    if content_type:
+        content_type = content_type.split(';')[0].strip().lower()
+        if content_type in ('text/csv', 'application/csv'):
+            return 'csv'
+        if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+            return 'ndjson'
+        if content_type in ('application/vnd.apache.parquet', 'application/x-parquet'):
+            return 'parquet'
+    return None
+
+
+def read_chunks(file: BinaryIO, input_format: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Any]]:
+    """
+    Read an input file as lists of at most chunk_size records.
+
+    CSV cells are read as text and left to PredictionInput to coerce, so a bad value fails
+    only its own row. Unparseable NDJSON lines become InvalidLine entries.
+
+    Args:
+        file (BinaryIO): Seekable binary file
+        input_format (str): One of INPUT_FORMATS
+        chunk_size (int, optional): Records per chunk. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Yields:
+        List[Any]: Record dicts, or InvalidLine for lines that could not be parsed
+
+    Raises:
+        ValueError: If the format is unknown or its reader is not installed
+    """
+    if input_format == 'csv':
+        reader = pd.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+        for frame in reader:
+            yield frame.to_dict(orient='records')
+    elif input_format == 'ndjson':
+        records = []
+        for line in io.TextIOWrapper(file, encoding='utf-8-sig'):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                records.append(InvalidLine(f"Invalid JSON: {e}"))
+            if len(records) >= chunk_size:
+                yield records
+                records = []
+        if records:
+            yield records
+    elif input_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet input requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+    else:
+        raise ValueError(f"Unknown input format: {input_format}")
+
+
+def validate_chunk(records: List[Any]) -> tuple:
+    """
+    Validate a chunk, reporting unparseable lines like validation errors.
+
+    Returns:
+        tuple: (valid_indices, valid_records, errors) as returned by models.validate_records
+    """
+    parsed = [i for i, record in enumerate(records) if not isinstance(record, InvalidLine)]
+    if len(parsed) == len(records):
+        return validate_records(records)
+
+    indices, valid_records, parsed_errors = validate_records([records[i] for i in parsed])
+    errors = [[{"loc": [], "msg": record.error, "type": "json_invalid"}] if isinstance(record, InvalidLine) else None
+              for record in records]
+    for i, error in zip(parsed, parsed_errors):
+        errors[i] = error
+    return [parsed[i] for i in indices], valid_records, errors
+
+
+def chunk_results(records: List[Any], first_row: int, valid_indices: List[int], errors: List[Any],
+                  predictions, prediction_errors: List[Optional[str]], id_column: Optional[str] = None,
+                  enrichment: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+    """
+    Merge validation and prediction outcomes into one result per input row.
+
+    Args:
+        records (List[Any]): The chunk as read
+        first_row (int): Input row number of the chunk's first record
+        valid_indices (List[int]): Chunk positions that were scored
+        errors (List[Any]): Validation errors per chunk position
+        predictions: Predictions for the scored positions
+        prediction_errors (List[Optional[str]]): Prediction errors for the scored positions
+        id_column (str, optional): Input field echoed back with every result
+        enrichment (List[Optional[Dict[str, Any]]], optional): Fields enrichment replaced, for the
+            scored positions; reported with every result when given
+
+    Returns:
+        List[Dict[str, Any]]: {row, [id], prediction, error, [enrichment]} in input order
+    """
+    results = [{"row": first_row + i, "prediction": None, "error": error} for i, error in enumerate(errors)]
+    for i, prediction, error in zip(valid_indices, predictions, prediction_errors):
+        if error is None:
+            results[i]["prediction"] = float(prediction)
+        else:
+            results[i]["error"] = error
+    if id_column is not None:
+        for result, record in zip(results, records):
+            result["id"] = record.get(id_column) if isinstance(record, dict) else None
+    if enrichment is not None:
+        for result in results:
+            result["enrichment"] = None
+        for i, changes in zip(valid_indices, enrichment):
+            results[i]["enrichment"] = changes
+    failed = sum(result["error"] is not None for result in results)
+    BULK_ROWS.inc("scored", len(results) - failed)
+    BULK_ROWS.inc("failed", failed)
+    return results
+
+
+def format_results(results: List[Dict[str, Any]], output_format: str, header: bool = False,
+                   id_column: Optional[str] = None, enrichment: bool = False) -> str:
+    """
+    Serialize results as NDJSON lines or CSV rows.
+
+    Args:
+        results (List[Dict[str, Any]]): Results from chunk_results
+        output_format (str): One of OUTPUT_FORMATS
+        header (bool, optional): Start with the CSV header. Defaults to False.
+        id_column (str, optional): Whether results carry an id. Defaults to None.
+        enrichment (bool, optional): Whether results carry enrichment changes. Defaults to False.
+
+    Returns:
+        str: Serialized results
+    """
+    if output_format == 'ndjson':
+        return ''.join(json.dumps(result, ensure_ascii=False) + '\n' for result in results)
+
+    fields = ['row'] + (['id'] if id_column is not None else []) + ['prediction', 'error']
+    if enrichment:
+        fields.append('enrichment')
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    if header:
+        writer.writeheader()
+    for result in results:
+        error = result["error"]
+        row = {**result, "error": json.dumps(error, ensure_ascii=False) if isinstance(error, list) else error}
+        if result.get("enrichment") is not None:
+            row["enrichment"] = json.dumps(result["enrichment"], ensure_ascii=False)
+        writer.writerow(row)
+    return buffer.getvalue()
+
+
+class BulkProgress:
+    def __init__(self, log_every: float = 5.0):
+        """
+        Track rows processed and throughput, logging at most every log_every seconds.
+
+        Args:
+            log_every (float, optional): Seconds between progress log lines. Defaults to 5.0.
+        """
+        self.rows = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self.log_every = log_every
+        self._last_log = self.start
+
+    def update(self, results: List[Dict[str, Any]]):
+        self.rows += len(results)
+        self.failed += sum(result["error"] is not None for result in results)
+        now = time.perf_counter()
+        if now - self._last_log >= self.log_every:
+            self._last_log = now
+            logger.info("Bulk valuation: %s", self)
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.rows / elapsed if elapsed > 0 else math.nan
+
+    def __str__(self) -> str:
+        return f"{self.rows} rows ({self.failed} failed), {self.rows_per_second:.0f} rows/s"
+
+
+def run_bulk(file: BinaryIO, predict_batch: Callable, input_format: str, output_format: str = 'ndjson',
+             chunk_size: int = DEFAULT_CHUNK_SIZE, id_column: Optional[str] = None,
+             progress: Optional[BulkProgress] = None) -> Iterator[str]:
+    """
+    Value every row of a file chunk by chunk, in-process.
+
+    Args:
+        file (BinaryIO): Input file
+        predict_batch (Callable): Scores a list of validated records, e.g. ModelLoader.predict_batch
+        input_format (str): One of INPUT_FORMATS
+        output_format (str, optional): One of OUTPUT_FORMATS. Defaults to 'ndjson'.
+        chunk_size (int, optional): Records per chunk. Defaults to DEFAULT_CHUNK_SIZE.
+        id_column (str, optional): Input field echoed back with every result
+        progress (BulkProgress, optional): Progress tracker to update
+
+    Yields:
+        str: Serialized results of one chunk
+    """
+    first_row = 0
+    for records in read_chunks(file, input_format, chunk_size):
+        valid_indices, valid_records, errors = validate_chunk(records)
+        predictions, prediction_errors = predict_batch(valid_records)[:2]
+        results = chunk_results(records, first_row, valid_indices, errors, predictions, prediction_errors, id_column)
+        if progress is not None:
+            progress.update(results)
+        yield format_results(results, output_format, header=first_row == 0, id_column=id_column)
+        first_row += len(records)
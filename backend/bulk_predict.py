@@ -0,0 +1,52 @@
+import argparse
+import logging
+import os
+import sys
+from model_loader import ModelLoader
+from artifact_bundle import default_bundle_path
+from bulk import DEFAULT_CHUNK_SIZE, INPUT_FORMATS, OUTPUT_FORMATS, BulkProgress, detect_format, run_bulk
+from logging_config import configure_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Value every plot in a CSV, Parquet or NDJSON file")
+    parser.add_argument('input', help="Input file")
+    parser.add_argument('-o', '--output', help="Output file (default: standard output)")
+    parser.add_argument('--input-format', choices=INPUT_FORMATS, help="Input format (default: from the file extension)")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, help="Output format (default: from the output "
+                        "file extension, else ndjson)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Rows scored at a time")
+    parser.add_argument('--id-column', help="Input column echoed back with every result")
+    parser.add_argument('--bundle', default=default_bundle_path(), help="Artifact bundle directory")
+    args = parser.parse_args(argv)
+
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+    input_format = args.input_format or detect_format(filename=args.input)
+    if input_format is None:
+        parser.error("cannot tell the input format from the file name; pass --input-format")
+    output_format = args.output_format or ('csv' if args.output and args.output.endswith('.csv') else 'ndjson')
+
+    # Bulk rows rarely repeat, so skip the prediction cache
+    loader = ModelLoader(
+        model_path="gbm_optuna_model.pkl",
+        target_scaler_path="target_scaler.pkl",
+        standard_scaler_path="standard_scaler.pkl",
+        cache_size=0,
+        bundle_path=args.bundle
+    )
+
+    progress = BulkProgress()
+    with open(args.input, 'rb') as source:
+        output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for text in run_bulk(source, loader.predict_batch, input_format, output_format,
+                                 args.chunk_size, args.id_column, progress):
+                output.write(text)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    logging.getLogger(__name__).info("Done: %s", progress)
+
+
+if __name__ == "__main__":
+    main()
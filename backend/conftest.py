@@ -0,0 +1,131 @@
+import contextlib
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+
+from artifact_bundle import read_table
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# test_api.py is a manual script against a running server, not a pytest module
+collect_ignore = ["test_api.py"]
+
+# City centers of every region, with a second city for Makkah
+CITIES = [
+    ("Riyadh", 24.7136, 46.6753, "Riyadh"),
+    ("Jeddah", 21.4858, 39.1925, "Makkah"),
+    ("Makkah", 21.3891, 39.8579, "Makkah"),
+    ("Madinah", 24.5247, 39.5692, "Madinah"),
+    ("Dammam", 26.4207, 50.0888, "Eastern Province"),
+    ("Abha", 18.2164, 42.5053, "Asir"),
+    ("Tabuk", 28.3838, 36.5550, "Tabuk"),
+    ("Hail", 27.5114, 41.7208, "Hail"),
+    ("Arar", 30.9753, 41.0381, "Northern Borders"),
+    ("Jazan", 16.8892, 42.5511, "Jazan"),
+    ("Najran", 17.5656, 44.2289, "Najran"),
+    ("Al Baha", 20.0129, 41.4677, "Al Baha"),
+    ("Sakaka", 29.9697, 40.2064, "Al Jawf"),
+    ("Buraydah", 26.3260, 43.9750, "Al Qassim"),
+]
+# The first city listed for a region is its capital
+CAPITALS = {region: city for city, _, _, region in reversed(CITIES)}
+
+# Neighborhood names, some with the "حي " prefix the preprocessor strips
+NEIGHBORHOODS = ["العزيزية", "حي الشفا", "النرجس", "الملقا", "الروضة", "حي السلامة"]
+
+# Cities without encoded neighborhoods, so their plots fall back to the unknown location
+UNENCODED_CITIES = ("Sakaka",)
+
+# Artifacts of the fixture model, relative to the artifact_dir working directory
+LOADER_KWARGS = dict(
+    model_path="gbm_optuna_model.pkl",
+    target_scaler_path="target_scaler.pkl",
+    standard_scaler_path="standard_scaler.pkl",
+)
+
+PROPERTY = {
+    "PropAssetNeighborhoodName": "حي الشفا", "PropAssetCityName": "Riyadh", "PropAssetRegionName": "Riyadh",
+    "Area": 500.0, "LengthFromNorth": 20.0, "LengthFromSouth": 20.0, "LengthFromEast": 25.0,
+    "LengthFromWest": 25.0, "NorthBorder": "شارع", "SouthBorder": "مبنى", "East_order": "قطعة ارض",
+    "WestBorder": "حديقة", "StreetWidth": 15.0, "Latitude": 24.7136, "Longitude": 46.6753,
+    "EvaluationAssetTypeName": "Housing Land", "AssetLevelId": "A",
+}
+
+
+def reference_tables(seed: int = 0) -> dict:
+    """Synthetic city_center_coords, encoded_neighb_city and Regions_capitals tables, by CSV stem."""
+    rng = np.random.default_rng(seed)
+    hoods = []
+    for city, _, _, _ in CITIES:
+        if city in UNENCODED_CITIES:
+            continue
+        encoded_city = rng.uniform(200, 1500)
+        for hood in rng.choice(NEIGHBORHOODS, size=int(rng.integers(3, len(NEIGHBORHOODS) + 1)), replace=False):
+            hoods.append((hood, city, rng.uniform(5, 60), encoded_city))
+    return {
+        'city_center_coords': pd.DataFrame(CITIES, columns=['City_en', 'Latitude', 'Longitude', 'Region']),
+        'encoded_neighb_city': pd.DataFrame(
+            hoods, columns=['PropAssetNeighborhoodName', 'PropAssetCityName', 'Encoded_Hood', 'Encoded_City']),
+        'Regions_capitals': pd.DataFrame(list(CAPITALS.items()), columns=['Region', 'Capital']),
+    }
+
+
+def write_reference_tables(directory) -> dict:
+    """Write the synthetic tables and the tracked scalers to a directory laid out like backend/."""
+    tables = reference_tables()
+    for name, table in tables.items():
+        table.to_csv(os.path.join(directory, f'{name}.csv'), index=False)
+    for name in ('standard_scaler.pkl', 'target_scaler.pkl'):
+        shutil.copy(os.path.join(BACKEND_DIR, name), os.path.join(directory, name))
+    return tables
+
+
+def clear_table_caches():
+    """Forget the tables read so far, so the next reads come from the working directory."""
+    read_table.cache_clear()
+
+
+@pytest.fixture
+def artifact_dir(tmp_path, monkeypatch):
+    """A working directory holding the synthetic reference tables and the tracked scalers."""
+    write_reference_tables(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('ARTIFACT_BUNDLE', raising=False)
+    clear_table_caches()
+    yield tmp_path
+    clear_table_caches()
+
+
+@pytest.fixture(scope="session")
+def fitted_model_path(tmp_path_factory) -> str:
+    """A small model fitted once per session on synthetic records, like gbm_optuna_model.pkl."""
+    from preprocessing import FeaturePreprocessor
+
+    directory = tmp_path_factory.mktemp("fitted_model")
+    write_reference_tables(directory)
+    with contextlib.chdir(directory):
+        clear_table_caches()
+        preprocessor = FeaturePreprocessor()
+        records = preprocessor.synthetic_inputs(400, seed=0)
+        X = pd.DataFrame(preprocessor.build_feature_matrix(records), columns=preprocessor.training_columns)
+    clear_table_caches()
+    # Scaled log prices driven by the area, the location encodings and noise
+    rng = np.random.default_rng(0)
+    y = X['Area'] + 0.5 * X.filter(like='Encoded').sum(axis=1) + rng.normal(scale=0.1, size=len(X))
+    model = GradientBoostingRegressor(n_estimators=200, max_depth=5, random_state=0).fit(X, y)
+    path = directory / LOADER_KWARGS["model_path"]
+    with open(path, 'wb') as f:
+        pickle.dump(model, f)
+    return str(path)
+
+
+@pytest.fixture
+def model_dir(artifact_dir, fitted_model_path):
+    """artifact_dir with the fitted fixture model, so LOADER_KWARGS load from the working directory."""
+    shutil.copy(fitted_model_path, artifact_dir / LOADER_KWARGS["model_path"])
+    return artifact_dir
@@ -0,0 +1,427 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter as TallyCounter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import ENRICHMENT_CHANGES, STAGE_LATENCY
+from models import city_lookups
+from preprocessing import FeaturePreprocessor, normalize_name
+
+logger = logging.getLogger(__name__)
+
+# Columns of a gazetteer file; rows without a Neighborhood describe the city itself
+GAZETTEER_COLUMNS = ['City', 'Neighborhood', 'Latitude', 'Longitude']
+
+# Lowest Dice similarity of character trigrams accepted as a fuzzy match
+MIN_SIMILARITY = 0.6
+
+# Coordinates farther than this from the resolved place are replaced by the place's coordinates
+MAX_CITY_DISTANCE_KM = 75.0
+MAX_NEIGHBORHOOD_DISTANCE_KM = 10.0
+
+# Coordinates outside Saudi Arabia (min/max latitude, min/max longitude), e.g. a default 0, 0, are always replaced
+COUNTRY_BOUNDS = (16.0, 33.0, 34.0, 56.0)
+
+# Prefix meaning "district" that the neighborhood tables use inconsistently
+_DISTRICT_PREFIX = 'حي '
+
+
+def match_key(name: Any) -> str:
+    """Normalize a place name for fuzzy matching: normalize_name without the district prefix."""
+    key = normalize_name(name)
+    return key[len(_DISTRICT_PREFIX):] if key.startswith(_DISTRICT_PREFIX) else key
+
+
+class NgramIndex:
+    def __init__(self, n: int = 3):
+        """
+        Inverted index of names by character n-gram, to find the most similar name without
+        comparing against every entry.
+
+        Args:
+            n (int, optional): Gram length. Defaults to 3.
+        """
+        self.n = n
+        self.names = []
+        self._gram_counts = []
+        self._postings = {}
+
+    def _grams(self, text: str) -> set:
+        padded = f' {text} '
+        return {padded[i:i + self.n] for i in range(max(len(padded) - self.n + 1, 1))}
+
+    def add(self, text: str) -> int:
+        """Index a name and return its entry id."""
+        entry = len(self.names)
+        grams = self._grams(text)
+        self.names.append(text)
+        self._gram_counts.append(len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(entry)
+        return entry
+
+    def search(self, text: str, min_similarity: float = MIN_SIMILARITY) -> Tuple[Optional[int], float]:
+        """
+        Find the entry sharing the most n-grams with text, scored by the Dice coefficient
+        2 * shared / (grams of text + grams of entry).
+
+        Returns:
+            tuple: (entry id, similarity), or (None, best similarity) when no entry reaches min_similarity
+        """
+        grams = self._grams(text)
+        shared = TallyCounter(entry for gram in grams for entry in self._postings.get(gram, ()))
+        best, best_score = None, 0.0
+        for entry, count in shared.items():
+            score = 2 * count / (len(grams) + self._gram_counts[entry])
+            # Ties go to the earlier entry so results do not depend on set order
+            if score > best_score or (score == best_score and best is not None and entry < best):
+                best, best_score = entry, score
+        return (best, best_score) if best_score >= min_similarity else (None, best_score)
+
+
+class Gazetteer:
+    def __init__(self, places: pd.DataFrame):
+        """
+        Canonical city and neighborhood names with their coordinates, indexed for exact,
+        normalized and fuzzy lookups.
+
+        Args:
+            places (pd.DataFrame): GAZETTEER_COLUMNS; Latitude and Longitude may be NaN where
+                unknown. A neighborhood's city gets a row of its own if it has none.
+        """
+        places = places[GAZETTEER_COLUMNS].copy()
+        places['Neighborhood'] = places['Neighborhood'].fillna('').astype(str)
+        places['City'] = places['City'].astype(str)
+        self.version = hashlib.sha256(places.to_csv(index=False).encode()).hexdigest()[:16]
+
+        self.cities = {}
+        self.city_index = NgramIndex()
+        self._city_names = []
+        self.neighborhoods = {}
+        self._neighborhood_indexes = {}
+        self._neighborhood_names = {}
+        for city, hood, latitude, longitude in places.itertuples(index=False):
+            coordinates = (float(latitude), float(longitude))
+            if city not in self.cities:
+                self.cities[city] = (np.nan, np.nan)
+                self.city_index.add(match_key(city))
+                self._city_names.append(city)
+                self.neighborhoods[city] = {}
+                self._neighborhood_indexes[city] = NgramIndex()
+                self._neighborhood_names[city] = []
+            if not hood:
+                self.cities[city] = coordinates
+            elif hood not in self.neighborhoods[city]:
+                self.neighborhoods[city][hood] = coordinates
+                self._neighborhood_indexes[city].add(match_key(hood))
+                self._neighborhood_names[city].append(hood)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Gazetteer':
+        """Read a gazetteer CSV with GAZETTEER_COLUMNS."""
+        places = pd.read_csv(path, dtype={'City': str, 'Neighborhood': str}, encoding='utf-8')
+        missing = [col for col in GAZETTEER_COLUMNS if col not in places.columns]
+        if missing:
+            raise ValueError(f"Gazetteer {path} lacks columns {missing}")
+        return cls(places)
+
+    @classmethod
+    def from_tables(cls, city_centers: pd.DataFrame, encoded_neighb_city: pd.DataFrame) -> 'Gazetteer':
+        """
+        Build a gazetteer from the model's reference tables: city centers with their coordinates and
+        the neighborhoods the model has encodings for, without coordinates of their own.
+
+        Args:
+            city_centers (pd.DataFrame): FeaturePreprocessor.city_centers
+            encoded_neighb_city (pd.DataFrame): FeaturePreprocessor.encoded_neighb_city
+        """
+        cities = pd.DataFrame({
+            'City': city_centers['City_en'],
+            'Neighborhood': '',
+            'Latitude': city_centers['City_Center_Lat'],
+            'Longitude': city_centers['City_Center_Lon'],
+        })
+        neighborhoods = pd.DataFrame({
+            'City': encoded_neighb_city['PropAssetCityName'],
+            'Neighborhood': encoded_neighb_city['PropAssetNeighborhoodName'],
+            'Latitude': np.nan,
+            'Longitude': np.nan,
+        })
+        return cls(pd.concat([cities, neighborhoods], ignore_index=True))
+
+    @staticmethod
+    def _match(name: str, known: Dict[str, Any], names: List[str], index: NgramIndex) -> Tuple[Optional[str], float]:
+        """Match a name exactly, then by match_key, then by n-gram similarity, among the names of an index."""
+        if name in known:
+            return name, 1.0
+        key = match_key(name)
+        entry, score = index.search(key)
+        if entry is None:
+            return None, score
+        return names[entry], 1.0 if index.names[entry] == key else score
+
+    def resolve(self, city: str, neighborhood: str) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a city and neighborhood to canonical names and the most precise known coordinates.
+
+        Args:
+            city (str): City name
+            neighborhood (str): Neighborhood name
+
+        Returns:
+            Dict[str, Any]: city, neighborhood (None if it was not matched), latitude and longitude
+                (NaN if unknown), level ('neighborhood' or 'city', the place the coordinates belong
+                to) and similarity of the neighborhood match; None if the city was not matched
+        """
+        canonical_city, _ = self._match(city, self.cities, self._city_names, self.city_index)
+        if canonical_city is None:
+            return None
+        hood, similarity = self._match(neighborhood, self.neighborhoods[canonical_city],
+                                       self._neighborhood_names[canonical_city], self._neighborhood_indexes[canonical_city])
+        coordinates, level = self.cities[canonical_city], 'city'
+        if hood is not None and np.isfinite(self.neighborhoods[canonical_city][hood]).all():
+            coordinates, level = self.neighborhoods[canonical_city][hood], 'neighborhood'
+        return {
+            'city': canonical_city,
+            'neighborhood': hood,
+            'latitude': coordinates[0],
+            'longitude': coordinates[1],
+            'level': level,
+            'similarity': similarity,
+        }
+
+
+class Enricher:
+    """
+    Stage that corrects input records before they reach FeaturePreprocessor. This base class
+    leaves records unchanged; subclasses implement enrich_records.
+    """
+
+    def enrich_records(self, records: List[Dict[str, Any]]) -> tuple:
+        """
+        Correct records.
+
+        Args:
+            records (List[Dict[str, Any]]): Validated input records
+
+        Returns:
+            tuple: (records, changes) - corrected copies of the records, and per record a dict of
+                the fields that were replaced and their new values, or None
+        """
+        return records, [None] * len(records)
+
+    async def enrich(self, records: List[Dict[str, Any]]) -> tuple:
+        """Run enrich_records in a worker thread so the event loop keeps serving other requests."""
+        if not records:
+            return records, []
+        return await asyncio.to_thread(self.enrich_records, records)
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        pass
+
+
+class GazetteerEnricher(Enricher):
+    def __init__(self, gazetteer: Gazetteer, cache_path: Optional[str] = None):
+        """
+        Replace misspelled neighborhood and city names with their gazetteer spelling, and
+        coordinates outside COUNTRY_BOUNDS or too far from the named place with the place's.
+
+        Resolutions are cached per normalized name pair in SQLite, which keeps them across
+        restarts; rows of other gazetteer versions are dropped when the cache is opened.
+
+        Args:
+            gazetteer (Gazetteer): Places to resolve names against
+            cache_path (str, optional): SQLite file of the resolution cache; in memory if None
+        """
+        self.cache_path = cache_path
+        self._connection = sqlite3.connect(cache_path or ':memory:', check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions (gazetteer TEXT, city TEXT, neighborhood TEXT, "
+                "result TEXT, PRIMARY KEY (gazetteer, city, neighborhood))"
+            )
+        self.set_gazetteer(gazetteer)
+        self.hits = 0
+        self.misses = 0
+
+    def set_gazetteer(self, gazetteer: Gazetteer):
+        """Resolve against a gazetteer from now on, dropping the cached resolutions of any other."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM resolutions WHERE gazetteer != ?", (gazetteer.version,))
+            self.gazetteer = gazetteer
+
+    def resolve_many(self, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[Dict[str, Any]]]:
+        """
+        Resolve (city, neighborhood) pairs through the cache, resolving and storing the misses.
+
+        Returns:
+            Dict[Tuple[str, str], Optional[Dict[str, Any]]]: Gazetteer.resolve result per pair
+        """
+        # Resolve the whole batch against one gazetteer, even if it is replaced meanwhile
+        gazetteer = self.gazetteer
+        keys = {pair: (normalize_name(pair[0]), normalize_name(pair[1])) for pair in dict.fromkeys(pairs)}
+        resolved = {}
+        with self._lock:
+            for pair, (city, hood) in keys.items():
+                row = self._connection.execute(
+                    "SELECT result FROM resolutions WHERE gazetteer = ? AND city = ? AND neighborhood = ?",
+                    (gazetteer.version, city, hood)
+                ).fetchone()
+                if row is not None:
+                    resolved[pair] = json.loads(row[0])
+            self.hits += len(resolved)
+            self.misses += len(keys) - len(resolved)
+
+        misses = [pair for pair in keys if pair not in resolved]
+        if misses:
+            # NaN coordinates are stored as null
+            results = {pair: gazetteer.resolve(*pair) for pair in misses}
+            rows = [(gazetteer.version, *keys[pair], json.dumps(
+                None if result is None else {k: (None if isinstance(v, float) and np.isnan(v) else v)
+                                             for k, v in result.items()},
+                ensure_ascii=False)) for pair, result in results.items()]
+            with self._lock, self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?)", rows)
+            resolved.update(results)
+        return resolved
+
+    def enrich_records(self, records: List[Dict[str, Any]]) -> tuple:
+        with STAGE_LATENCY.time('enrichment'):
+            pairs = [(record['PropAssetCityName'], record['PropAssetNeighborhoodName']) for record in records]
+            resolved = self.resolve_many(pairs)
+            places = [resolved[pair] for pair in pairs]
+
+            # Coordinate checks for the whole batch at once
+            latitude = np.array([float(record['Latitude']) for record in records])
+            longitude = np.array([float(record['Longitude']) for record in records])
+            place_latitude = np.array([np.nan if place is None or place['latitude'] is None else place['latitude']
+                                       for place in places], dtype=np.float64)
+            place_longitude = np.array([np.nan if place is None or place['longitude'] is None else place['longitude']
+                                        for place in places], dtype=np.float64)
+            limit = np.array([MAX_NEIGHBORHOOD_DISTANCE_KM if place is not None and place['level'] == 'neighborhood'
+                              else MAX_CITY_DISTANCE_KM for place in places])
+            min_lat, max_lat, min_lon, max_lon = COUNTRY_BOUNDS
+            outside = (latitude < min_lat) | (latitude > max_lat) | (longitude < min_lon) | (longitude > max_lon)
+            misplaced = np.isfinite(place_latitude) & (
+                outside | (FeaturePreprocessor.haversine(latitude, longitude, place_latitude, place_longitude) > limit)
+            )
+
+            enriched = []
+            changes = []
+            for i, (record, place) in enumerate(zip(records, places)):
+                change = {}
+                if place is not None and place['city'] != record['PropAssetCityName'] and not self._city_accepted(
+                        place['city'], record.get('PropAssetRegionName')):
+                    # The validators would reject the matched city; its neighborhood and coordinates go with it
+                    place = None
+                if place is not None:
+                    if place['city'] != record['PropAssetCityName']:
+                        change['PropAssetCityName'] = place['city']
+                    if place['neighborhood'] is not None and place['neighborhood'] != record['PropAssetNeighborhoodName']:
+                        change['PropAssetNeighborhoodName'] = place['neighborhood']
+                    if misplaced[i]:
+                        change['Latitude'] = float(place_latitude[i])
+                        change['Longitude'] = float(place_longitude[i])
+                for field in change:
+                    ENRICHMENT_CHANGES.inc(field)
+                enriched.append({**record, **change} if change else record)
+                changes.append(change or None)
+            return enriched, changes
+
+    @staticmethod
+    def _city_accepted(city: str, region: Optional[str]) -> bool:
+        """Whether PredictionInput accepts the city for the region, as a city change must not bypass it."""
+        valid_cities, city_region_map, _ = city_lookups()
+        return city in valid_cities and city_region_map[city] == region
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the gazetteer version and the resolution cache hits, misses and size."""
+        with self._lock:
+            size = self._connection.execute("SELECT COUNT(*) FROM resolutions WHERE gazetteer = ?",
+                                            (self.gazetteer.version,)).fetchone()[0]
+            return {'gazetteer_version': self.gazetteer.version, 'cache_hits': self.hits,
+                    'cache_misses': self.misses, 'cache_size': size}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ModelTablesEnricher(GazetteerEnricher):
+    def __init__(self, model_registry, cache_path: Optional[str] = None):
+        """
+        GazetteerEnricher over the reference tables of the model version currently served. The
+        gazetteer is rebuilt from the new version's tables on the first records enriched after
+        another version is activated; pinned, canary and shadow versions share the current one's.
+
+        Args:
+            model_registry (ModelRegistry): Registry whose current version supplies the tables
+            cache_path (str, optional): SQLite file of the resolution cache; in memory if None
+        """
+        self.model_registry = model_registry
+        self._rebuild_lock = threading.Lock()
+        loader = model_registry.current
+        self.model_version = loader.version
+        super().__init__(self._gazetteer_of(loader), cache_path)
+
+    @staticmethod
+    def _gazetteer_of(loader) -> Gazetteer:
+        return Gazetteer.from_tables(loader.preprocessor.city_centers, loader.preprocessor.encoded_neighb_city)
+
+    def enrich_records(self, records: List[Dict[str, Any]]) -> tuple:
+        if self.model_registry.current_version != self.model_version:
+            with self._rebuild_lock:
+                loader = self.model_registry.current
+                if loader.version != self.model_version:
+                    gazetteer = self._gazetteer_of(loader)
+                    self.set_gazetteer(gazetteer)
+                    self.model_version = loader.version
+                    logger.info("Rebuilt gazetteer %s for model version %s", gazetteer.version, loader.version)
+        return super().enrich_records(records)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return GazetteerEnricher.stats and the model version the gazetteer was built from."""
+        return {**super().stats(), 'model_version': self.model_version}
+
+
+def create_enricher(kind: str, model_registry=None, gazetteer_path: Optional[str] = None,
+                    cache_path: Optional[str] = None) -> Optional[Enricher]:
+    """
+    Create the configured enrichment stage.
+
+    Args:
+        kind (str): 'none' for no enrichment, or 'gazetteer'
+        model_registry (ModelRegistry, optional): Its current version supplies the tables of the
+            gazetteer when gazetteer_path is not given, see ModelTablesEnricher
+        gazetteer_path (str, optional): Gazetteer CSV, see Gazetteer.from_file
+        cache_path (str, optional): SQLite file of the resolution cache
+
+    Returns:
+        Optional[Enricher]: The stage, or None for 'none'
+
+    Raises:
+        ValueError: For an unknown kind
+    """
+    if kind == 'none':
+        return None
+    if kind != 'gazetteer':
+        raise ValueError(f"Unknown enrichment {kind}; expected 'none' or 'gazetteer'")
+    if gazetteer_path:
+        enricher = GazetteerEnricher(Gazetteer.from_file(gazetteer_path), cache_path)
+    else:
+        enricher = ModelTablesEnricher(model_registry, cache_path)
+    gazetteer = enricher.gazetteer
+    logger.info("Enriching inputs with gazetteer %s (%d cities, %d neighborhoods)", gazetteer.version,
+                len(gazetteer.cities), sum(len(hoods) for hoods in gazetteer.neighborhoods.values()))
+    return enricher
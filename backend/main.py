@@ -1,14 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from typing import Any, Dict, List, Optional
 import numpy as np
-from model_loader import ModelLoader
+import asyncio
+import struct
+import tempfile
+import time
+from model_loader import ModelRegistry, UnknownModelVersion
+from artifact_bundle import default_bundle_path
+from models import (GridRequest, ModelLoadRequest, ModelRoutingRequest, PredictionInput, SensitivityRequest,
+                    validate_records)
+from prediction_executor import ExecutorSaturated, PredictionExecutor
+from micro_batcher import MicroBatcher
+from enrichment import create_enricher
+from bulk import (DEFAULT_CHUNK_SIZE, INPUT_FORMATS, MEDIA_TYPES, OUTPUT_FORMATS, BulkProgress,
+                  chunk_results, detect_format, format_results, read_chunks, validate_chunk)
+from metrics import FEATURE_FALLBACKS, REQUESTS, REQUEST_ERRORS, instrument_endpoint, render_metrics
 import os
+import logging
 from dotenv import load_dotenv
+from logging_config import configure_logging
 
 # Load environment variables
 load_dotenv()
 
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Property Value Prediction API",
     description="API for making property value predictions using a GradientBoostingRegressor model",
@@ -26,60 +47,531 @@ app.add_middleware(
 )
 
 
-# Initialize model loader
-model_loader = ModelLoader(
+# Maximum number of records accepted by the batch endpoint
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+# Maximum number of points evaluated by the grid endpoint
+MAX_GRID_POINTS = int(os.getenv("MAX_GRID_POINTS", "250000"))
+
+# Little-endian uint32 rows and cols ahead of the float32 values of a grid response
+GRID_HEADER = struct.Struct("<II")
+
+# Bulk uploads are kept in memory up to this size and spooled to disk beyond it
+BULK_SPOOL_BYTES = int(os.getenv("BULK_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Seconds a bulk chunk waits for room in a saturated prediction queue before the upload fails
+BULK_SATURATION_TIMEOUT = float(os.getenv("BULK_SATURATION_TIMEOUT", "60"))
+
+# Delay between attempts of a bulk chunk to enter a saturated prediction queue
+BULK_RETRY_DELAY = 0.05
+
+# Initialize model loader, from the compiled artifact bundle when one has been built
+loader_kwargs = dict(
     model_path="gbm_optuna_model.pkl",
     target_scaler_path="target_scaler.pkl",
-    standard_scaler_path="standard_scaler.pkl"
+    standard_scaler_path="standard_scaler.pkl",
+    cache_size=int(os.getenv("PREDICTION_CACHE_SIZE", "10000")),
+    cache_ttl=float(os.getenv("PREDICTION_CACHE_TTL", "3600")),
+    inference_engine=os.getenv("INFERENCE_ENGINE", "compiled"),
+    bundle_path=default_bundle_path(),
+    quantile_model_paths=[path.strip() for path in os.getenv("QUANTILE_MODEL_PATHS", "").split(",") if path.strip()]
+)
+EXECUTOR_MODE = os.getenv("PREDICTION_EXECUTOR", "thread")
+EXECUTOR_PRELOAD = os.getenv("PREDICTION_PRELOAD", "false").lower() in ("1", "true")
+
+# Process workers that load their own model leave this process only the version's metadata and
+# reference tables to serve; skipping the warm-up keeps a bundle's model.pkl from being unpickled here
+model_registry = ModelRegistry(
+    loader_kwargs,
+    max_versions=int(os.getenv("MODEL_MAX_VERSIONS", "2")),
+    warmup_rows=0 if EXECUTOR_MODE == "process" and not EXECUTOR_PRELOAD else 64
+)
+
+# Model management endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Run predictions in a worker pool so the event loop stays free for health and metrics
+prediction_executor = PredictionExecutor(
+    model_registry,
+    mode=EXECUTOR_MODE,
+    workers=int(os.getenv("PREDICTION_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    queue_depth=int(os.getenv("PREDICTION_QUEUE_DEPTH", "64")),
+    loader_kwargs=loader_kwargs,
+    preload=EXECUTOR_PRELOAD
 )
 
-class PropertyInput(BaseModel):
-    Area: float
-    AssetLevelId: str
-    East_order: str
-    EvaluationAssetTypeName: str
-    Latitude: float
-    LengthFromEast: float
-    LengthFromNorth: float
-    LengthFromSouth: float
-    LengthFromWest: float
-    Longitude: float
-    NorthBorder: str
-    PropAssetCityName: str
-    PropAssetNeighborhoodName: str
-    PropAssetRegionName: str
-    SouthBorder: str
-    StreetWidth: float
-    WestBorder: str
+# Coalesce concurrent /predict calls into vectorized batches; a window of 0 disables batching
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", "0"))
+micro_batcher = MicroBatcher(
+    prediction_executor,
+    window_ms=MICRO_BATCH_WINDOW_MS,
+    max_size=int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+) if MICRO_BATCH_WINDOW_MS > 0 else None
+
+# Correct names and coordinates against a local gazetteer before preprocessing; "none" disables it
+enricher = create_enricher(
+    os.getenv("ENRICHMENT", "none"),
+    model_registry=model_registry,
+    gazetteer_path=os.getenv("GAZETTEER_PATH") or None,
+    cache_path=os.getenv("ENRICHMENT_CACHE", "enrichment_cache.sqlite3")
+)
+
+async def enrich_records(records: List[Dict[str, Any]]) -> tuple:
+    """Run records through the enrichment stage, returning them with the changes made to each"""
+    if enricher is None:
+        return records, [None] * len(records)
+    return await enricher.enrich(records)
+
+async def run_prediction(method: str, *args, **kwargs):
+    """Dispatch a ModelRegistry call to the worker pool, answering 503 when the queue is full"""
+    try:
+        return await prediction_executor.run(method, *args, **kwargs)
+    except ExecutorSaturated as e:
+        logger.warning("Rejecting prediction: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def run_single_prediction(input_dict: Dict[str, Any], model_version: Optional[str] = None) -> tuple:
+    """Predict one record, through the micro-batcher when it is enabled and no version is pinned"""
+    if micro_batcher is None or model_version is not None:
+        return await run_prediction("predict", input_dict, model_version=model_version)
+    try:
+        return await micro_batcher.predict(input_dict)
+    except ExecutorSaturated as e:
+        logger.warning("Rejecting prediction: %s", e)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def run_extended(method: str, features_list: List[Dict[str, Any]], model_version: Optional[str] = None) -> tuple:
+    """Score records with explanations or intervals, answering 409 when the served model cannot provide them"""
+    try:
+        return await run_prediction(method, features_list, model_version=model_version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def require_admin(token: Optional[str]):
+    """Reject model management calls without the configured admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if prediction_executor.mode == "process":
+        raise HTTPException(status_code=409, detail="Model versions can only be managed with the thread executor")
+
+@app.on_event("startup")
+async def start_micro_batcher():
+    if micro_batcher is not None:
+        micro_batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    if micro_batcher is not None:
+        await micro_batcher.stop()
+    prediction_executor.shutdown()
+    model_registry.shutdown()
+    if enricher is not None:
+        enricher.close()
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """Count requests rejected by input validation before they reach an endpoint"""
+    REQUESTS.inc(request.url.path)
+    REQUEST_ERRORS.inc(request.url.path)
+    return await request_validation_exception_handler(request, exc)
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "Property Value Prediction API is running"}
+    return {
+        "status": "healthy",
+        "message": "Property Value Prediction API is running",
+        "model": model_registry.stats(),
+        "cache": model_registry.current.cache.stats(),
+        "executor": prediction_executor.stats(),
+        "micro_batching": micro_batcher.stats() if micro_batcher is not None else None,
+        "enrichment": enricher.stats() if enricher is not None else None
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, error, per-stage latency and cache metrics in Prometheus text format"""
+    return PlainTextResponse(
+        render_metrics(model_registry.current.cache.stats(), prediction_executor.stats(),
+                       model_registry.current.monitor.drift()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/monitoring")
+async def monitoring():
+    """Feature fallback counts and drift of recent model inputs against the training distributions"""
+    current = model_registry.current
+    return {
+        "model_version": current.version,
+        "fallbacks": FEATURE_FALLBACKS.snapshot(),
+        "drift": current.monitor.report(),
+    }
 
 @app.post("/predict")
-async def predict(property_input: PropertyInput):
+@instrument_endpoint("/predict")
+async def predict(
+    property_input: PredictionInput,
+    debug: bool = Query(False, description="Return the intermediate features of every pipeline stage"),
+    x_debug_trace: Optional[str] = Header(None),
+    model_version: Optional[str] = Query(None, description="Score with this resident model version"),
+    explain: bool = Query(False, description="Return the contribution of every input field to the prediction"),
+    intervals: bool = Query(False, description="Return the prediction interval of the quantile models")
+):
     """
     Make predictions using the GradientBoostingRegressor model
     
     Args:
-        property_input (PropertyInput): Input features for prediction
+        property_input (PredictionInput): Validated input features for prediction
+        debug (bool): Opt-in per-request debug trace
+        x_debug_trace (str, optional): X-Debug-Trace header, an alternative to the debug flag
+        model_version (str, optional): Pinned model version, instead of the routed one
+        explain (bool): Opt-in per-field contributions, in SAR, around the model's base value
+        intervals (bool): Opt-in quantile predictions, e.g. p10 and p90, scored in the same pass
         
     Returns:
-        dict: Model prediction
+        dict: Model prediction and the version that made it, plus the pipeline trace, the
+            explanation or the interval when requested, and the fields enrichment replaced
     """
     try:
         # Convert input to dictionary
         input_dict = property_input.dict()
         
-        # Make prediction
-        prediction, _ = model_loader.predict(input_dict)
+        # Correct the names and coordinates ahead of preprocessing
+        (input_dict,), (changes,) = await enrich_records([input_dict])
+        enrichment = {"enrichment": changes} if enricher is not None else {}
+        
+        if explain or intervals:
+            response = {}
+            if explain:
+                predictions, explanations, errors, model_version = await run_extended(
+                    "explain_batch", [input_dict], model_version)
+                if errors[0] is not None:
+                    raise HTTPException(status_code=500, detail=errors[0])
+                response["explanation"] = explanations[0]
+            if intervals:
+                # Pinned to the explained version so both describe the same prediction
+                predictions, interval_list, errors, model_version = await run_extended(
+                    "predict_intervals", [input_dict], model_version)
+                if errors[0] is not None:
+                    raise HTTPException(status_code=500, detail=errors[0])
+                response["interval"] = interval_list[0]
+            return {"prediction": float(predictions[0]), "model_version": model_version, **response, **enrichment}
+        
+        # Make prediction, tracing every stage if requested
+        if debug or x_debug_trace in ("1", "true"):
+            prediction, trace = await run_prediction("predict_with_trace", input_dict, model_version=model_version)
+            return {"prediction": prediction, "model_version": trace["model_version"], "trace": trace, **enrichment}
+        
+        prediction, version = await run_single_prediction(input_dict, model_version)
+        logger.debug("API prediction: %s (model %s)", prediction, version)
+        return {"prediction": prediction, "model_version": version, **enrichment}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("API error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/batch")
+@instrument_endpoint("/predict/batch")
+async def predict_batch(
+    property_inputs: List[Dict[str, Any]],
+    model_version: Optional[str] = Query(None, description="Score with this resident model version"),
+    explain: bool = Query(False, description="Return the contribution of every input field to each prediction"),
+    intervals: bool = Query(False, description="Return the prediction interval of the quantile models")
+):
+    """
+    Make predictions for a list of properties in a single vectorized pass
+    
+    Args:
+        property_inputs (List[Dict[str, Any]]): Input features for each property, validated
+            individually against PredictionInput
+        model_version (str, optional): Pinned model version, instead of the routed one
+        explain (bool): Opt-in per-field contributions for every scored input
+        intervals (bool): Opt-in quantile predictions for every scored input
+        
+    Returns:
+        dict: One result per input, in input order, holding either a prediction (and its
+            explanation and interval when requested, and the fields enrichment replaced) or an
+            error, and the model version that scored the batch
+    """
+    if len(property_inputs) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch size {len(property_inputs)} exceeds the limit of {MAX_BATCH_SIZE}"
+        )
+    
+    # Validate each record so one invalid row does not reject the whole batch
+    valid_indices, valid_records, validation_errors = validate_records(property_inputs)
+    results = [None if error is None else {"prediction": None, "error": error} for error in validation_errors]
+    
+    extras = {}
+    try:
+        valid_records, changes = await enrich_records(valid_records)
+        if enricher is not None:
+            extras["enrichment"] = changes
+        if explain:
+            predictions, extras["explanation"], errors, model_version = await run_extended(
+                "explain_batch", valid_records, model_version)
+        if intervals:
+            explain_errors = errors if explain else [None] * len(valid_records)
+            predictions, extras["interval"], errors, model_version = await run_extended(
+                "predict_intervals", valid_records, model_version)
+            # A record the explanation failed for stays failed
+            errors = [explain_error or error for explain_error, error in zip(explain_errors, errors)]
+        if not explain and not intervals:
+            predictions, errors, model_version = await run_prediction("predict_batch", valid_records,
+                                                                       model_version=model_version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("API error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    for j, (i, prediction, error) in enumerate(zip(valid_indices, predictions, errors)):
+        results[i] = {"prediction": None, "error": error} if error is not None else {"prediction": float(prediction)}
+        if error is None:
+            results[i].update({name: values[j] for name, values in extras.items()})
+    return {"predictions": results, "model_version": model_version}
+
+@app.post("/predict/grid", response_class=Response)
+@instrument_endpoint("/predict/grid")
+async def predict_grid(
+    request: GridRequest,
+    model_version: Optional[str] = Query(None, description="Score with this resident model version")
+):
+    """
+    Value one plot at every point of a latitude/longitude grid, e.g. for a price heatmap
+    
+    Args:
+        request (GridRequest): Template plot, bounding box, resolution and the value to return
+        model_version (str, optional): Pinned model version, instead of the routed one
+        
+    Returns:
+        Response: GRID_HEADER followed by rows x cols little-endian float32 values in row-major
+            order, the first row at min_latitude and the first column at min_longitude; NaN
+            marks points that could not be scored
+    """
+    points = request.rows * request.cols
+    if points > MAX_GRID_POINTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Grid of {points} points exceeds the limit of {MAX_GRID_POINTS}"
+        )
+    
+    latitudes = np.linspace(request.min_latitude, request.max_latitude, request.rows)
+    longitudes = np.linspace(request.min_longitude, request.max_longitude, request.cols)
+    template = request.template.model_dump()
+    try:
+        predictions, version = await run_prediction("predict_grid", template, latitudes, longitudes,
+                                                    model_version=model_version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("API error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if request.value == "price_per_m2":
+        predictions = predictions / template["Area"]
+    body = GRID_HEADER.pack(request.rows, request.cols) + predictions.astype("<f4").tobytes()
+    return Response(
+        content=body,
+        media_type="application/octet-stream",
+        headers={"X-Model-Version": version, "X-Grid-Shape": f"{request.rows},{request.cols}"}
+    )
+
+@app.post("/predict/sensitivity")
+@instrument_endpoint("/predict/sensitivity")
+async def predict_sensitivity(
+    request: SensitivityRequest,
+    model_version: Optional[str] = Query(None, description="Score with this resident model version")
+):
+    """
+    Value a plot and what-if variants of it, e.g. a wider street or a street on the north border,
+    in a single model call
+    
+    Args:
+        request (SensitivityRequest): Base plot and the sweeps to value, one field each
+        model_version (str, optional): Pinned model version, instead of the routed one
         
-        print(f"API prediction: {prediction}")
-        return {"prediction": prediction}
+    Returns:
+        dict: The base prediction and, for every sweep, each value's prediction and its change
+            from the base
+    """
+    variants = sum(len(perturbation.values) for perturbation in request.perturbations)
+    if variants > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{variants} variants exceed the limit of {MAX_BATCH_SIZE}"
+        )
+    
+    sweeps = [(perturbation.field, perturbation.values) for perturbation in request.perturbations]
+    try:
+        base_prediction, sweep_predictions, version = await run_prediction(
+            "predict_sensitivity", request.base.model_dump(), sweeps, model_version=model_version
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"API error: {str(e)}")
+        logger.error("API error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    sensitivities = []
+    for (field, values), predictions in zip(sweeps, sweep_predictions):
+        sensitivities.append({"field": field, "variants": [
+            {
+                "value": value,
+                "prediction": float(prediction),
+                "change": float(prediction - base_prediction),
+                "change_pct": float((prediction - base_prediction) / base_prediction * 100) if base_prediction else None,
+            }
+            for value, prediction in zip(values, predictions)
+        ]})
+    return {"base_prediction": base_prediction, "sensitivities": sensitivities, "model_version": version}
+
+@app.post("/predict/bulk")
+@instrument_endpoint("/predict/bulk")
+async def predict_bulk(
+    request: Request,
+    input_format: Optional[str] = Query(None, description="csv, ndjson or parquet; taken from Content-Type if omitted"),
+    output_format: str = Query("ndjson", description="ndjson or csv"),
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, ge=1, le=MAX_BATCH_SIZE, description="Rows scored at a time"),
+    id_column: Optional[str] = Query(None, description="Input column echoed back with every result"),
+    model_version: Optional[str] = Query(None, description="Score with this resident model version")
+):
+    """
+    Value every row of an uploaded CSV, Parquet or NDJSON file, streaming results back as they are made
+    
+    Args:
+        request (Request): The raw file as the request body
+        input_format (str, optional): Input format
+        output_format (str): Result format
+        chunk_size (int): Rows read, validated and scored at a time
+        id_column (str, optional): Input column echoed back with every result
+        model_version (str, optional): Pinned model version; by default the current version scores the whole file
+        
+    Returns:
+        StreamingResponse: One {row, prediction, error} result per input row, in input order
+    """
+    input_format = input_format or detect_format(content_type=request.headers.get("content-type"))
+    if input_format not in INPUT_FORMATS:
+        raise HTTPException(status_code=415, detail=f"Input format must be one of: {', '.join(INPUT_FORMATS)}")
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Output format must be one of: {', '.join(OUTPUT_FORMATS)}")
+    try:
+        # One version values the whole file, even if the routing changes meanwhile
+        model_version, _ = model_registry.select(model_version or model_registry.current_version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    # Spool the upload so memory stays flat however large the file is
+    upload = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_BYTES)
+    async for block in request.stream():
+        upload.write(block)
+    upload.seek(0)
+    
+    return StreamingResponse(
+        stream_bulk(upload, input_format, output_format, chunk_size, id_column, model_version),
+        media_type=MEDIA_TYPES[output_format],
+        headers={"X-Model-Version": model_version}
+    )
+
+async def stream_bulk(upload, input_format: str, output_format: str, chunk_size: int,
+                      id_column: Optional[str], model_version: str):
+    """Read, validate and score an upload chunk by chunk, yielding serialized results"""
+    chunks = read_chunks(upload, input_format, chunk_size)
+    
+    def next_chunk():
+        records = next(chunks, None)
+        return None if records is None else (records, validate_chunk(records))
+    
+    progress = BulkProgress()
+    first_row = 0
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next_chunk)
+            if chunk is None:
+                break
+            records, (valid_indices, valid_records, errors) = chunk
+            valid_records, changes = await enrich_records(valid_records)
+            deadline = time.monotonic() + BULK_SATURATION_TIMEOUT
+            while True:
+                try:
+                    predictions, prediction_errors, _ = await prediction_executor.run(
+                        "predict_batch", valid_records, model_version=model_version
+                    )
+                    break
+                except ExecutorSaturated:
+                    # Bulk work yields to interactive traffic instead of failing mid-stream,
+                    # up to a deadline after which the failure is reported in the stream
+                    if time.monotonic() >= deadline:
+                        raise
+                    await asyncio.sleep(BULK_RETRY_DELAY)
+            results = chunk_results(records, first_row, valid_indices, errors, predictions, prediction_errors, id_column,
+                                    enrichment=changes if enricher is not None else None)
+            progress.update(results)
+            yield format_results(results, output_format, header=first_row == 0, id_column=id_column,
+                                 enrichment=enricher is not None)
+            first_row += len(records)
+    except Exception as e:
+        # The status line has been sent; report the failure in the stream itself
+        logger.error("Bulk valuation failed after %d rows: %s", first_row, e)
+        yield format_results([{"row": None, "prediction": None, "error": f"Bulk valuation failed: {e}"}],
+                             output_format, header=first_row == 0, id_column=id_column, enrichment=enricher is not None)
+    finally:
+        upload.close()
+        logger.info("Bulk valuation finished: %s", progress)
+
+@app.get("/models")
+async def list_models(x_admin_token: Optional[str] = Header(None)):
+    """Resident model versions, their load latency and the traffic routing"""
+    require_admin(x_admin_token)
+    return model_registry.stats()
+
+@app.post("/models/load", status_code=202)
+async def load_model(request: ModelLoadRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Load, warm up and (by default) activate a new model version in the background
+    
+    Args:
+        request (ModelLoadRequest): Artifact paths overriding those of the running version
+        
+    Returns:
+        dict: Acknowledgement; poll GET /models for the outcome
+    """
+    require_admin(x_admin_token)
+    overrides = request.dict(exclude_unset=True, exclude={"activate"})
+    if "model_path" in overrides and "bundle_path" not in overrides:
+        # Loose artifacts replace the bundle the service started from
+        overrides["bundle_path"] = None
+    try:
+        model_registry.load_in_background(activate=request.activate, **overrides)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "loading"}
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str, x_admin_token: Optional[str] = Header(None)):
+    """Serve unpinned requests with a resident model version"""
+    require_admin(x_admin_token)
+    try:
+        model_registry.activate(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return model_registry.stats()
+
+@app.post("/models/routing")
+async def route_models(request: ModelRoutingRequest, x_admin_token: Optional[str] = Header(None)):
+    """Split unpinned traffic to a canary version and/or mirror it to a shadow version"""
+    require_admin(x_admin_token)
+    try:
+        model_registry.route(request.canary_version, request.canary_fraction, request.shadow_version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return model_registry.stats()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,247 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+# Latency buckets in seconds, from 10us to 10s
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Timer:
+    """Context manager that records its elapsed time into a histogram."""
+
+    __slots__ = ('histogram', 'label', 'start')
+
+    def __init__(self, histogram: 'Histogram', label: str):
+        self.histogram = histogram
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(self.label, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Histogram with one label, rendered in the Prometheus text exposition format.
+
+        Args:
+            name (str): Metric name
+            documentation (str): HELP text
+            label_name (str): Name of the single label
+            buckets (Tuple[float, ...], optional): Upper bounds of the buckets. Defaults to LATENCY_BUCKETS.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label: str, value: float):
+        """
+        Record one observation.
+
+        Args:
+            label (str): Label value, e.g. the stage name
+            value (float): Observed value
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, label: str) -> _Timer:
+        """Return a context manager that observes the duration of its block."""
+        return _Timer(self, label)
+
+    def snapshot(self) -> Dict[str, Tuple[List[int], float, int]]:
+        """Return (bucket counts, sum, count) per label value."""
+        with self._lock:
+            return {label: (list(counts), total, count) for label, (counts, total, count) in self._series.items()}
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{self.label_name}="{label}",le="{_format_value(bound)}"}} {cumulative}'
+            yield f'{self.name}_sum{{{self.label_name}="{label}"}} {_format_value(total)}'
+            yield f'{self.name}_count{{{self.label_name}="{label}"}} {count}'
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_name: str):
+        """
+        Counter with one label, rendered in the Prometheus text exposition format.
+
+        Args:
+            name (str): Metric name, conventionally ending in _total
+            documentation (str): HELP text
+            label_name (str): Name of the single label
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label: str, amount: float = 1):
+        """Increase the counter for a label value."""
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label, value in sorted(self.snapshot().items()):
+            yield f'{self.name}{{{self.label_name}="{label}"}} {_format_value(value)}'
+
+
+def render_sample(name: str, documentation: str, metric_type: str, value: float) -> Iterable[str]:
+    """
+    Render a single unlabelled value read at scrape time, e.g. from cache statistics.
+
+    Args:
+        name (str): Metric name
+        documentation (str): HELP text
+        metric_type (str): "counter" or "gauge"
+        value (float): Current value
+    """
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} {metric_type}"
+    yield f"{name} {_format_value(value)}"
+
+
+# Pipeline metrics shared by the preprocessor, the model loader and the API
+STAGE_LATENCY = Histogram(
+    "infath_stage_duration_seconds",
+    "Time spent in each prediction pipeline stage.",
+    "stage",
+)
+REQUEST_LATENCY = Histogram(
+    "infath_request_duration_seconds",
+    "Time spent handling API requests.",
+    "endpoint",
+)
+MICRO_BATCH_SIZE = Histogram(
+    "infath_micro_batch_size",
+    "Rows per micro-batch dispatched to the model.",
+    "endpoint",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+SHADOW_DIFFERENCE = Histogram(
+    "infath_shadow_relative_difference",
+    "Relative difference between shadow and served predictions.",
+    "version",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+MODEL_PREDICTIONS = Counter("infath_model_predictions_total", "Rows scored by each model version.", "version")
+BULK_ROWS = Counter("infath_bulk_rows_total", "Rows processed by bulk valuation.", "outcome")
+REQUESTS = Counter("infath_requests_total", "API requests received.", "endpoint")
+REQUEST_ERRORS = Counter("infath_request_errors_total", "API requests that failed.", "endpoint")
+FEATURE_FALLBACKS = Counter("infath_feature_fallbacks_total",
+                            "Rows on which preprocessing fell back from the input value.", "event")
+ENRICHMENT_CHANGES = Counter("infath_enrichment_changes_total", "Input fields replaced by enrichment.", "field")
+
+
+def render_gauge(name: str, documentation: str, label_name: str, values: Dict[str, float]) -> Iterable[str]:
+    """
+    Render a gauge with one label whose values are read at scrape time, e.g. drift scores.
+
+    Args:
+        name (str): Metric name
+        documentation (str): HELP text
+        label_name (str): Name of the single label
+        values (Dict[str, float]): Current value per label value
+    """
+    yield f"# HELP {name} {documentation}"
+    yield f"# TYPE {name} gauge"
+    for label, value in sorted(values.items()):
+        yield f'{name}{{{label_name}="{label}"}} {_format_value(value)}'
+
+
+def instrument_endpoint(endpoint: str):
+    """
+    Decorate an async API endpoint to count its requests and errors and time it.
+
+    Args:
+        endpoint (str): Endpoint label, e.g. "/predict"
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            REQUESTS.inc(endpoint)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                REQUEST_ERRORS.inc(endpoint)
+                raise
+            finally:
+                REQUEST_LATENCY.observe(endpoint, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def render_metrics(cache_stats: Dict[str, float] = None, executor_stats: Dict[str, float] = None,
+                   drift: Dict[str, float] = None) -> str:
+    """
+    Render all pipeline metrics in the Prometheus text exposition format.
+
+    Args:
+        cache_stats (Dict[str, float], optional): PredictionCache.stats() to expose alongside
+        executor_stats (Dict[str, float], optional): PredictionExecutor.stats() to expose alongside
+        drift (Dict[str, float], optional): FeatureMonitor.drift() to expose alongside; None, as
+            without a training reference, omits the gauge
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for metric in (REQUESTS, REQUEST_ERRORS, REQUEST_LATENCY, STAGE_LATENCY, MICRO_BATCH_SIZE,
+                   MODEL_PREDICTIONS, SHADOW_DIFFERENCE, BULK_ROWS, FEATURE_FALLBACKS,
+                   ENRICHMENT_CHANGES):
+        lines.extend(metric.render())
+    if cache_stats is not None:
+        for key in ("hits", "misses", "evictions", "expirations"):
+            lines.extend(render_sample(f"infath_prediction_cache_{key}_total", f"Prediction cache {key}.",
+                                       "counter", cache_stats[key]))
+        lines.extend(render_sample("infath_prediction_cache_size", "Entries in the prediction cache.",
+                                   "gauge", cache_stats["size"]))
+    if executor_stats is not None:
+        lines.extend(render_sample("infath_executor_in_flight", "Prediction calls running or queued.",
+                                   "gauge", executor_stats["in_flight"]))
+        lines.extend(render_sample("infath_executor_rejected_total", "Prediction calls rejected with 503.",
+                                   "counter", executor_stats["rejected"]))
+    if drift is not None:
+        lines.extend(render_gauge("infath_feature_drift_psi",
+                                  "Population stability index of recent inputs against training, per feature.",
+                                  "feature", drift))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from metrics import MICRO_BATCH_SIZE, STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    def __init__(self, executor, window_ms: float = 2.0, max_size: int = 64, endpoint: str = "/predict"):
+        """
+        Coalesce concurrent single-row predictions into one vectorized ModelRegistry.predict_batch call.
+
+        The first request to arrive opens a window; every request arriving within window_ms
+        (or until max_size rows are waiting) joins the same batch.
+
+        Args:
+            executor (PredictionExecutor): Pool the batches are dispatched to
+            window_ms (float, optional): Longest time the first request of a batch waits for others. Defaults to 2.0.
+            max_size (int, optional): Rows that close a batch early. Defaults to 64.
+            endpoint (str, optional): Label for the batch size metric. Defaults to "/predict".
+        """
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self.endpoint = endpoint
+        self.batches = 0
+        self.rows = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._dispatches = set()
+
+    def start(self):
+        """Start collecting batches on the running event loop."""
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        """Stop collecting and wait for dispatched batches to finish."""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def predict(self, features: Dict[str, Any]) -> tuple:
+        """
+        Queue one record and wait for its prediction.
+
+        Args:
+            features (Dict[str, Any]): Dictionary containing feature values
+
+        Returns:
+            tuple: (prediction, version of the model that scored the batch)
+
+        Raises:
+            ExecutorSaturated: If the batch could not be dispatched to the pool
+            Exception: If the record could not be scored
+        """
+        if self._collector is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((features, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch without waiting so the next window opens while this batch runs
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        now = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            STAGE_LATENCY.observe("batch_queue_wait", now - enqueued_at)
+        MICRO_BATCH_SIZE.observe(self.endpoint, len(batch))
+        self.batches += 1
+        self.rows += len(batch)
+
+        try:
+            predictions, errors, version = await self.executor.run(
+                "predict_batch", [features for features, _, _ in batch]
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        logger.debug("Micro-batch of %d rows scored", len(batch))
+        for (_, future, _), prediction, error in zip(batch, predictions, errors):
+            if future.done():
+                # The caller went away
+                continue
+            if error is not None:
+                future.set_exception(Exception(error))
+            else:
+                future.set_result((float(prediction), version))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batching configuration and counters."""
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_size": self.max_size,
+            "batches": self.batches,
+            "rows": self.rows,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
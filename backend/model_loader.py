@@ -1,11 +1,51 @@
+import hashlib
 import pickle
+import logging
+import random
+import threading
+import time
+import warnings
 import numpy as np
-from typing import Dict, Any
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 from sklearn.ensemble import GradientBoostingRegressor
 from preprocessing import FeaturePreprocessor
+from prediction_cache import PredictionCache, artifact_fingerprint, canonical_key
+from tree_engine import CompiledTreeEnsemble, StackedTreeEnsembles
+from artifact_bundle import open_bundle, read_table
+from metrics import MODEL_PREDICTIONS, SHADOW_DIFFERENCE, STAGE_LATENCY
+from monitoring import FeatureMonitor
+
+logger = logging.getLogger(__name__)
+
+# Above this many rows sklearn's Cython traversal beats the NumPy tree engine
+COMPILED_MAX_ROWS = 32
+
+# Grid points preprocessed and scored at a time, bounding the memory of large grids
+GRID_CHUNK_POINTS = 16384
+
+# Shadow batches allowed to wait before further ones are skipped
+SHADOW_MAX_PENDING = 8
+
+
+def _predict_array(model: GradientBoostingRegressor, rows) -> np.ndarray:
+    """
+    Run a model fitted on a DataFrame on rows laid out by training_columns.
+
+    The fast path feeds plain arrays, which sklearn warns about on every call; the warning is
+    silenced for this call only.
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return model.predict(rows)
+
 
 class ModelLoader:
-    def __init__(self, model_path: str, target_scaler_path: str = None, standard_scaler_path: str = None):
+    def __init__(self, model_path: str = None, target_scaler_path: str = None, standard_scaler_path: str = None,
+                 use_fast_path: bool = True, cache_size: int = 10000, cache_ttl: float = 3600.0,
+                 inference_engine: str = 'compiled', bundle_path: str = None,
+                 quantile_model_paths: Optional[List[str]] = None):
         """
         Initialize the model loader.
         
@@ -13,76 +53,903 @@ class ModelLoader:
             model_path (str): Path to the pickled GradientBoostingRegressor model file
             target_scaler_path (str, optional): Path to the target scaler file. If None, will look for target_scaler.pkl in the same directory.
             standard_scaler_path (str, optional): Path to the standard scaler file. If None, will look for standard_scaler.pkl in the same directory.
+            use_fast_path (bool, optional): Build features with the pandas-free builders. Defaults to True.
+            cache_size (int, optional): Maximum number of cached predictions; 0 disables caching. Defaults to 10000.
+            cache_ttl (float, optional): Lifetime of cached predictions in seconds; 0 keeps them until evicted. Defaults to 3600.
+            inference_engine (str, optional): 'compiled' to evaluate small inputs with the flattened tree arrays,
+                'sklearn' to always call model.predict. Defaults to 'compiled'.
+            bundle_path (str, optional): Artifact bundle built by artifact_bundle.build_bundle; when given,
+                the model and scaler paths are ignored and everything is loaded from the bundle.
+            quantile_model_paths (List[str], optional): Pickled quantile GradientBoostingRegressors, fitted
+                on the same features and scaled target, that bound predict_intervals. They are only
+                loaded when intervals are first requested.
         """
+        self.use_fast_path = use_fast_path
+        self.quantile_model_paths = list(quantile_model_paths or [])
+        self._quantiles = None
+        self._quantile_lock = threading.Lock()
+        # Cached predictions are only valid for this loader's artifacts; a new version gets its own cache
+        self.cache = PredictionCache(max_size=cache_size, ttl_seconds=cache_ttl)
+        self.bundle = None
+        self._model = None
+        if inference_engine not in ('compiled', 'sklearn'):
+            raise ValueError(f"Unknown inference engine: {inference_engine}")
         try:
-            # Load the model
-            with open(model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            # Verify model type and reinitialize if needed
-            if not isinstance(self.model, GradientBoostingRegressor):
-                raise ValueError("Loaded model is not a GradientBoostingRegressor")
-            
-            # Initialize preprocessor
-            self.preprocessor = FeaturePreprocessor()
-            
-            # Load the target scaler
-            target_scaler_path = target_scaler_path or 'target_scaler.pkl'
-            try:
-                with open(target_scaler_path, 'rb') as f:
-                    self.target_scaler = pickle.load(f)
-            except FileNotFoundError:
-                print(f"Warning: {target_scaler_path} not found. Predictions will not be inverse scaled.")
-                self.target_scaler = None
-
-            # Load the standard scaler
-            standard_scaler_path = standard_scaler_path or 'standard_scaler.pkl'
-            try:
-                with open(standard_scaler_path, 'rb') as f:
-                    self.standard_scaler = pickle.load(f)
-            except FileNotFoundError:
-                print(f"Warning: {standard_scaler_path} not found. Feature scaling may be affected.")
-                self.standard_scaler = None
-                
+            if bundle_path is not None:
+                self._load_bundle(bundle_path, inference_engine)
+            else:
+                self._load_artifacts(model_path, target_scaler_path, standard_scaler_path, inference_engine)
         except Exception as e:
             raise Exception(f"Error loading model: {str(e)}")
+        self.monitor = self._new_monitor()
+    
+    def _new_monitor(self) -> FeatureMonitor:
+        """Sketch the numeric model inputs against the training distributions shipped with the schema, if any."""
+        columns = [col for col in FeaturePreprocessor.MODEL_NUMERIC_COLUMNS
+                   if col in self.preprocessor.training_columns]
+        return FeatureMonitor(columns, [self.preprocessor.training_columns.index(col) for col in columns],
+                              self.preprocessor.feature_reference)
+    
+    def _observe(self, processed_features: np.ndarray):
+        """Add scored feature rows to the drift sketches."""
+        with STAGE_LATENCY.time('monitoring'):
+            self.monitor.observe(processed_features)
+    
+    def _load_artifacts(self, model_path: str, target_scaler_path: Optional[str],
+                        standard_scaler_path: Optional[str], inference_engine: str):
+        """Load the model, scalers and reference tables from their individual files."""
+        # Load the model
+        with open(model_path, 'rb') as f:
+            self._model = pickle.load(f)
+        
+        # Verify model type and reinitialize if needed
+        if not isinstance(self._model, GradientBoostingRegressor):
+            raise ValueError("Loaded model is not a GradientBoostingRegressor")
+        
+        # Load the target scaler
+        target_scaler_path = target_scaler_path or 'target_scaler.pkl'
+        try:
+            with open(target_scaler_path, 'rb') as f:
+                self.target_scaler = pickle.load(f)
+        except FileNotFoundError:
+            logger.warning("%s not found. Predictions will not be inverse scaled.", target_scaler_path)
+            self.target_scaler = None
+
+        # Load the standard scaler
+        standard_scaler_path = standard_scaler_path or 'standard_scaler.pkl'
+        try:
+            with open(standard_scaler_path, 'rb') as f:
+                self.standard_scaler = pickle.load(f)
+        except FileNotFoundError:
+            logger.warning("%s not found. Feature scaling may be affected.", standard_scaler_path)
+            self.standard_scaler = None
+        
+        # Initialize preprocessor, sharing the scaler loaded above
+        self.preprocessor = FeaturePreprocessor(scaler=self.standard_scaler)
+        
+        # Flatten the trees for fast small-batch inference
+        self.tree_engine = self._compile_trees(self._model) if inference_engine == 'compiled' else None
+        
+        fingerprint = artifact_fingerprint(model_path, target_scaler_path, standard_scaler_path)
+        self.version = hashlib.sha256(repr(fingerprint).encode()).hexdigest()[:16]
+    
+    def _load_bundle(self, bundle_path: str, inference_engine: str):
+        """Load everything from a bundle built by artifact_bundle.build_bundle."""
+        self.bundle = open_bundle(bundle_path)
+        self.target_scaler = self.bundle.target_scaler
+        self.standard_scaler = self.bundle.standard_scaler
+        self.preprocessor = FeaturePreprocessor(bundle=self.bundle)
+        
+        # The trees were flattened and checked against sklearn when the bundle was built
+        self.tree_engine = self.bundle.tree_engine() if inference_engine == 'compiled' else None
+        if self.tree_engine is None:
+            # No compiled engine: every call needs the sklearn model, so load it now
+            self._model = self.bundle.model
+        
+        self.version = self.bundle.version
+    
+    def warm_up(self, rows: int = 64) -> float:
+        """
+        Run synthetic inputs through every inference path so the first real requests do not
+        pay for lazy loading, and check that the model produces finite predictions.
+        
+        Args:
+            rows (int, optional): Number of synthetic records. Defaults to 64.
+            
+        Returns:
+            float: Seconds spent warming up
+            
+        Raises:
+            ValueError: If a synthetic record cannot be scored
+        """
+        start = time.perf_counter()
+        records = self.preprocessor.synthetic_inputs(rows)
+        # Small batches and single rows go through the compiled engine, large ones through sklearn,
+        # which is skipped while a bundle's model has not been unpickled yet
+        batches = [records[:COMPILED_MAX_ROWS], records[:1]]
+        if self._model is not None:
+            batches.insert(0, records)
+        for batch in batches:
+            predictions, errors = self.predict_batch(batch)
+            # Synthetic records should not occupy the cache, nor be served from it on the next pass
+            self.cache.clear()
+            failed = [error for error in errors if error is not None]
+            if failed or not np.isfinite(predictions).all():
+                raise ValueError(f"Warm-up predictions failed: {failed[0] if failed else 'non-finite output'}")
+        # Nor should they count as traffic in the drift sketches
+        self.monitor = self._new_monitor()
+        return time.perf_counter() - start
     
-    def predict(self, features: Dict[str, Any]) -> tuple:
+    def preload(self):
+        """Load everything that is otherwise loaded on first use, e.g. before forking workers."""
+        self._model = self.model
+        if self.quantile_model_paths:
+            self._load_quantile_models()
+    
+    @property
+    def model(self) -> GradientBoostingRegressor:
+        """The sklearn model; from a bundle it is only unpickled when first needed."""
+        if self._model is None:
+            self._model = self.bundle.model
+        return self._model
+    
+    def predict(self, features: Dict[str, Any], trace: Optional[Dict[str, Any]] = None) -> tuple:
         """
         Make predictions using the loaded model.
         
         Args:
             features (Dict[str, Any]): Dictionary containing feature values
+            trace (Dict[str, Any], optional): If given, intermediate features of every pipeline stage
+                are recorded in it; the cache and the fast path are bypassed
             
         Returns:
             tuple: (prediction, None) - GradientBoostingRegressor doesn't provide probabilities
         """
+        # Serve repeated inputs from the cache
+        cache_key = canonical_key(features) if self.cache.enabled and trace is None else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached, None
+        
+        processed_features = None
         try:
             # Preprocess features
-            processed_features = self.preprocessor.preprocess_features(features)
+            if self.use_fast_path and trace is None:
+                processed_features = self.preprocessor.build_feature_vector(features)
+            else:
+                processed_features = self.preprocessor.preprocess_features(features, trace=trace)
             
             # Ensure features are in the correct order
             if hasattr(processed_features, 'columns'):
                 processed_features = processed_features[self.preprocessor.training_columns]
             
             # Make prediction using DataFrame with feature names
-            prediction = self.model.predict(processed_features)[0]
-            
-            # Inverse transform the standard scaling if scaler exists
-            if self.target_scaler is not None:
-                prediction = self.target_scaler.inverse_transform([[prediction]])[0][0]
+            raw_prediction = self._predict_raw(processed_features)[0]
+            self._observe(np.asarray(processed_features, dtype=np.float64))
             
-            # Apply inverse log transformation (expm1) to get back to original scale
-            prediction = np.expm1(prediction)
+            # Undo target scaling and the log transform
+            prediction = self._inverse_target(np.array([raw_prediction]))[0]
             
             # Convert prediction to float to ensure JSON serialization
             prediction = float(prediction)
             
-            print(f"Raw prediction: {prediction}")
+            logger.debug("Prediction: %s (raw %s)", prediction, raw_prediction)
+            if trace is not None:
+                trace['raw_prediction'] = float(raw_prediction)
+                trace['prediction'] = prediction
+            if cache_key is not None:
+                self.cache.put(cache_key, prediction)
             return prediction, None
             
         except Exception as e:
-            print(f"Error in prediction: {str(e)}")
-            print(f"Processed features shape: {processed_features.shape}")
-            print(f"Processed features columns: {processed_features.columns if hasattr(processed_features, 'columns') else 'No columns'}")
-            raise Exception(f"Error making prediction: {str(e)}") 
\ No newline at end of file
+            logger.error("Error in prediction: %s (processed features shape: %s)", e,
+                         getattr(processed_features, 'shape', None))
+            raise Exception(f"Error making prediction: {str(e)}")
+    
+    def predict_with_trace(self, features: Dict[str, Any]) -> tuple:
+        """
+        Make a prediction and return the trace of every pipeline stage with it.
+        Unlike predict(..., trace=...), this works across process boundaries.
+        
+        Args:
+            features (Dict[str, Any]): Dictionary containing feature values
+            
+        Returns:
+            tuple: (prediction, trace)
+        """
+        trace = {}
+        prediction, _ = self.predict(features, trace=trace)
+        return prediction, trace
+    
+    def predict_batch(self, features_list: List[Dict[str, Any]]) -> tuple:
+        """
+        Make predictions for many records in one vectorized pass.
+        
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+            
+        Returns:
+            tuple: (predictions, errors) - predictions is a float array in input order with NaN
+                for failed rows, errors holds an error message (or None) for each row
+        """
+        predictions = np.full(len(features_list), np.nan)
+        errors = [None] * len(features_list)
+        if not self.cache.enabled:
+            return self._predict_rows(features_list)
+        
+        # Serve repeated inputs from the cache and score only the misses
+        cache_keys = [canonical_key(features) for features in features_list]
+        misses = []
+        for i, cache_key in enumerate(cache_keys):
+            cached = self.cache.get(cache_key)
+            if cached is None:
+                misses.append(i)
+            else:
+                predictions[i] = cached
+        
+        if misses:
+            miss_predictions, miss_errors = self._predict_rows([features_list[i] for i in misses])
+            for i, prediction, error in zip(misses, miss_predictions, miss_errors):
+                predictions[i] = prediction
+                errors[i] = error
+                if error is None:
+                    self.cache.put(cache_keys[i], float(prediction))
+        
+        return predictions, errors
+    
+    def predict_grid(self, template: Dict[str, Any], latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        """
+        Value one plot at every point of a latitude/longitude grid in batched model passes,
+        bypassing the cache.
+        
+        Args:
+            template (Dict[str, Any]): Plot features; Latitude and Longitude are replaced by the grid's
+            latitudes (np.ndarray): Latitude of every grid row
+            longitudes (np.ndarray): Longitude of every grid column
+            
+        Returns:
+            np.ndarray: Predictions of shape (len(latitudes), len(longitudes)), NaN where a point
+                could not be scored
+        """
+        latitude, longitude = np.meshgrid(latitudes, longitudes, indexing='ij')
+        latitude, longitude = latitude.ravel(), longitude.ravel()
+        predictions = np.full(len(latitude), np.nan)
+        for start in range(0, len(latitude), GRID_CHUNK_POINTS):
+            chunk = slice(start, start + GRID_CHUNK_POINTS)
+            processed_features = self.preprocessor.build_grid_matrix(template, latitude[chunk], longitude[chunk])
+            valid = np.isfinite(processed_features).all(axis=1)
+            if valid.any():
+                chunk_predictions = predictions[chunk]
+                chunk_predictions[valid] = self._inverse_target(self._predict_raw(processed_features[valid]))
+        return predictions.reshape(len(latitudes), len(longitudes))
+    
+    def predict_sensitivity(self, base: Dict[str, Any], sweeps: List[tuple]) -> tuple:
+        """
+        Value a plot and its variants, each differing from it in one field, in a single model
+        call, bypassing the cache.
+        
+        Args:
+            base (Dict[str, Any]): Plot features
+            sweeps (List[tuple]): (field, values) pairs, see FeaturePreprocessor.build_sensitivity_matrix
+            
+        Returns:
+            tuple: (base prediction, one prediction array per sweep)
+            
+        Raises:
+            ValueError: If a field cannot be varied or the features cannot be scored
+        """
+        # Every sweep patches the same base row, built (and its fallbacks counted) once
+        base_row = self.preprocessor.build_feature_vector(base)
+        processed_features = np.vstack(
+            [base_row] +
+            [self.preprocessor.build_sensitivity_matrix(base, field, values, base_row=base_row)
+             for field, values in sweeps]
+        )
+        if not np.isfinite(processed_features).all():
+            raise ValueError("Preprocessed features contain NaN or infinite values")
+        
+        predictions = self._inverse_target(self._predict_raw(processed_features))
+        bounds = np.cumsum([1] + [len(values) for _, values in sweeps])
+        return float(predictions[0]), np.split(predictions, bounds)[1:-1]
+    
+    def explain_batch(self, features_list: List[Dict[str, Any]]) -> tuple:
+        """
+        Score records and split every prediction into contributions of the input fields, bypassing
+        the cache.
+        
+        Contributions are computed per training column by the compiled tree engine, summed into
+        FeaturePreprocessor.explanation_fields and scaled to SAR so that base_value plus the
+        contributions equals the prediction.
+        
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+            
+        Returns:
+            tuple: (predictions, explanations, errors) - explanations hold a dict with base_value and
+                contributions, largest first, for every scored row and None elsewhere
+            
+        Raises:
+            ValueError: If the model is not served by the compiled tree engine
+        """
+        if self.tree_engine is None:
+            raise ValueError("Explanations require the compiled tree engine")
+        
+        predictions = np.full(len(features_list), np.nan)
+        explanations = [None] * len(features_list)
+        errors = [None] * len(features_list)
+        if not features_list:
+            return predictions, explanations, errors
+        
+        processed_features = self._build_matrix(features_list, errors)
+        valid = self._valid_rows(processed_features, errors)
+        if not valid.any():
+            return predictions, explanations, errors
+        
+        with STAGE_LATENCY.time('explanation'):
+            bias, contributions = self.tree_engine.contributions(processed_features[valid])
+        self._observe(processed_features[valid])
+        raw_predictions = bias + contributions.sum(axis=1)
+        predictions[valid] = self._inverse_target(raw_predictions)
+        base_value = float(self._inverse_target(np.array([bias]))[0])
+        
+        # The inverse target transform is not linear: share each row's price difference from
+        # base_value in proportion to the raw contributions (the secant of the transform), and use
+        # its slope where the prediction is too close to the bias for a stable secant
+        raw_change = raw_predictions - bias
+        price_change = predictions[valid] - base_value
+        flat = np.abs(raw_change) < 1e-9
+        step = 1e-6
+        slope = (self._inverse_target(raw_predictions + step) - self._inverse_target(raw_predictions - step)) / (2 * step)
+        ratio = np.where(flat, slope, price_change / np.where(flat, 1.0, raw_change))
+        field_contributions = self.preprocessor.aggregate_contributions(contributions) * ratio[:, None]
+        
+        fields = self.preprocessor.explanation_fields
+        for i, row in zip(np.flatnonzero(valid), field_contributions):
+            order = np.argsort(-np.abs(row), kind='stable')
+            explanations[i] = {
+                'base_value': base_value,
+                'contributions': {fields[j]: float(row[j]) for j in order},
+            }
+        return predictions, explanations, errors
+    
+    def predict_intervals(self, features_list: List[Dict[str, Any]]) -> tuple:
+        """
+        Score records with the point model and every quantile model on one preprocessed feature
+        matrix, bypassing the cache. Small batches are scored by a single traversal of all models'
+        trees; larger ones by each sklearn model in turn.
+        
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+            
+        Returns:
+            tuple: (predictions, intervals, errors) - intervals hold a dict of quantile name, e.g.
+                'p10', to price for every scored row and None elsewhere
+            
+        Raises:
+            ValueError: If no quantile models are configured or one of them cannot be used
+        """
+        if not self.quantile_model_paths:
+            raise ValueError("No quantile models are configured")
+        names, models, stacked = self._load_quantile_models()
+        
+        predictions = np.full(len(features_list), np.nan)
+        intervals = [None] * len(features_list)
+        errors = [None] * len(features_list)
+        if not features_list:
+            return predictions, intervals, errors
+        
+        processed_features = self._build_matrix(features_list, errors)
+        valid = self._valid_rows(processed_features, errors)
+        if not valid.any():
+            return predictions, intervals, errors
+        
+        rows = processed_features[valid]
+        with STAGE_LATENCY.time('inference'):
+            if stacked is not None and len(rows) <= COMPILED_MAX_ROWS:
+                raw_predictions = stacked.predict(rows)
+            else:
+                raw_predictions = np.column_stack([_predict_array(model, rows) for model in [self.model] + models])
+        self._observe(rows)
+        scored = self._inverse_target(raw_predictions.ravel()).reshape(raw_predictions.shape)
+        predictions[valid] = scored[:, 0]
+        # Separately fitted quantiles can cross; sorting each row restores their order
+        bounds = np.sort(scored[:, 1:], axis=1)
+        for i, row in zip(np.flatnonzero(valid), bounds):
+            intervals[i] = {name: float(value) for name, value in zip(names, row)}
+        return predictions, intervals, errors
+    
+    def _load_quantile_models(self) -> tuple:
+        """
+        Load, check and compile the quantile models on first use.
+        
+        Returns:
+            tuple: (names, models, stacked engine) ordered by quantile; the engine stacks the
+                point model first and is None when any model cannot be compiled
+        """
+        with self._quantile_lock:
+            if self._quantiles is not None:
+                return self._quantiles
+            
+            models = []
+            for path in self.quantile_model_paths:
+                with open(path, 'rb') as f:
+                    model = pickle.load(f)
+                if not isinstance(model, GradientBoostingRegressor) or model.loss != 'quantile':
+                    raise ValueError(f"{path} is not a quantile GradientBoostingRegressor")
+                if model.n_features_in_ != len(self.preprocessor.training_columns):
+                    raise ValueError(f"{path} expects {model.n_features_in_} features, "
+                                     f"not {len(self.preprocessor.training_columns)}")
+                models.append(model)
+            models.sort(key=lambda model: model.alpha)
+            names = [f"p{model.alpha * 100:g}" for model in models]
+            
+            stacked = None
+            if self.tree_engine is not None:
+                engines = [self._compile_trees(model) for model in models]
+                if all(engine is not None for engine in engines):
+                    stacked = StackedTreeEnsembles([self.tree_engine] + engines)
+            logger.info("Loaded quantile models %s (%s inference)", names,
+                        'stacked' if stacked is not None else 'sklearn')
+            self._quantiles = (names, models, stacked)
+            return self._quantiles
+    
+    def _predict_rows(self, features_list: List[Dict[str, Any]]) -> tuple:
+        """
+        Preprocess and score records in one vectorized pass, bypassing the cache.
+        
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+            
+        Returns:
+            tuple: (predictions, errors) as returned by predict_batch
+        """
+        predictions = np.full(len(features_list), np.nan)
+        errors = [None] * len(features_list)
+        if not features_list:
+            return predictions, errors
+        
+        if self.use_fast_path:
+            processed_features = self._build_matrix(features_list, errors)
+        else:
+            try:
+                # Large batches: preprocess the whole batch at once
+                processed_features = self.preprocessor.preprocess_batch(features_list)
+                processed_features = processed_features[self.preprocessor.training_columns].to_numpy(dtype=float)
+            except Exception as e:
+                # Fall back to row-by-row so a single bad record cannot fail the batch
+                logger.warning("Batch preprocessing failed, retrying row by row: %s", e)
+                for i, features in enumerate(features_list):
+                    try:
+                        predictions[i], _ = self.predict(features)
+                    except Exception as row_error:
+                        errors[i] = str(row_error)
+                return predictions, errors
+        
+        valid = self._valid_rows(processed_features, errors)
+        if valid.any():
+            # One model call and one inverse transform for all valid rows
+            raw_predictions = self._predict_raw(processed_features[valid])
+            predictions[valid] = self._inverse_target(raw_predictions)
+            self._observe(processed_features[valid])
+        
+        logger.debug("Batch prediction: %d of %d rows scored", valid.sum(), len(features_list))
+        return predictions, errors
+    
+    def _build_matrix(self, features_list: List[Dict[str, Any]], errors: List[Optional[str]]) -> np.ndarray:
+        """
+        Build the feature matrix of a batch without pandas, recording per-row errors in place.
+        
+        Returns:
+            np.ndarray: Features laid out by training_columns; rows that failed to build are NaN
+        """
+        try:
+            # Build the whole batch over the precomputed location table
+            return self.preprocessor.build_feature_matrix(features_list)
+        except Exception as e:
+            # Rebuild row by row so a single bad record cannot fail the batch
+            logger.warning("Batch feature build failed, retrying row by row: %s", e)
+        processed_features = np.zeros((len(features_list), len(self.preprocessor.training_columns)))
+        for i, features in enumerate(features_list):
+            try:
+                processed_features[i] = self.preprocessor.build_feature_vector(features)[0]
+            except Exception as row_error:
+                processed_features[i] = np.nan
+                errors[i] = f"Error making prediction: {str(row_error)}"
+        return processed_features
+    
+    @staticmethod
+    def _valid_rows(processed_features: np.ndarray, errors: List[Optional[str]]) -> np.ndarray:
+        """Mask rows with non-finite features, which cannot be scored, and record their errors in place."""
+        valid = np.isfinite(processed_features).all(axis=1)
+        for i in np.flatnonzero(~valid):
+            if errors[i] is None:
+                errors[i] = "Error making prediction: preprocessed features contain NaN or infinite values"
+        return valid
+    
+    def _compile_trees(self, model: GradientBoostingRegressor):
+        """
+        Build the compiled tree engine of a model and check it against sklearn on probe inputs.
+        
+        Args:
+            model (GradientBoostingRegressor): The point model or a quantile model
+        
+        Returns:
+            CompiledTreeEnsemble: The engine, or None if the model cannot be compiled faithfully
+        """
+        # The engine indexes features by position, so the model must use training_columns order
+        feature_names = getattr(model, 'feature_names_in_', None)
+        if feature_names is not None and list(feature_names) != self.preprocessor.training_columns:
+            logger.warning("Model feature order differs from training_columns. Using sklearn inference.")
+            return None
+        
+        try:
+            engine = CompiledTreeEnsemble(model)
+        except ValueError as e:
+            logger.warning("Cannot compile model (%s). Using sklearn inference.", e)
+            return None
+        
+        probe = np.random.default_rng(0).normal(size=(COMPILED_MAX_ROWS, engine.n_features))
+        for rows in (probe[:1], probe):
+            if not np.allclose(engine.predict(rows), _predict_array(model, rows), rtol=0, atol=1e-9):
+                logger.warning("Compiled trees disagree with sklearn. Using sklearn inference.")
+                return None
+        return engine
+    
+    def _predict_raw(self, processed_features) -> np.ndarray:
+        """
+        Run the model on preprocessed features.
+        
+        Args:
+            processed_features: Features laid out by training_columns (DataFrame or array)
+            
+        Returns:
+            np.ndarray: Raw model outputs in the scaled log space
+        """
+        with STAGE_LATENCY.time('inference'):
+            if self.tree_engine is not None and len(processed_features) <= COMPILED_MAX_ROWS:
+                return self.tree_engine.predict(np.asarray(processed_features, dtype=np.float64))
+            return _predict_array(self.model, processed_features)
+    
+    def _inverse_target(self, raw_predictions: np.ndarray) -> np.ndarray:
+        """
+        Map raw model outputs back to the original price scale.
+        
+        Args:
+            raw_predictions (np.ndarray): Model outputs in the scaled log space
+            
+        Returns:
+            np.ndarray: Predictions in the original scale
+        """
+        with STAGE_LATENCY.time('inverse_scaling'):
+            # Inverse transform the standard scaling if scaler exists
+            if self.target_scaler is not None:
+                raw_predictions = self.target_scaler.inverse_transform(
+                    np.asarray(raw_predictions).reshape(-1, 1)
+                ).ravel()
+            
+            # Apply inverse log transformation (expm1) to get back to original scale
+            return np.expm1(raw_predictions)
+
+
+class UnknownModelVersion(Exception):
+    """Raised when a request pins a model version that is not resident."""
+
+
+class ModelRegistry:
+    def __init__(self, loader_kwargs: Dict[str, Any], max_versions: int = 2, warmup_rows: int = 64):
+        """
+        Keep several ModelLoader versions resident, route requests between them and swap
+        in new versions without a restart.
+
+        Args:
+            loader_kwargs (Dict[str, Any]): ModelLoader arguments of the initial version; later
+                versions override some of them, e.g. bundle_path or model_path
+            max_versions (int, optional): Versions kept loaded; the oldest unused one is dropped
+                when a new version is loaded. Defaults to 2.
+            warmup_rows (int, optional): Synthetic records scored before a version is registered. Defaults to 64.
+        """
+        self.loader_kwargs = dict(loader_kwargs)
+        self.max_versions = max(1, max_versions)
+        self.warmup_rows = warmup_rows
+        self.versions = OrderedDict()
+        self.load_stats = {}
+        self.canary_version = None
+        self.canary_fraction = 0.0
+        self.shadow_version = None
+        self.loading = None
+        self.last_load_error = None
+        self.shadow_skipped = 0
+        self.current_version = None
+        self._shadow_pending = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._load_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-load')
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-shadow')
+
+        self.load()
+
+    @property
+    def current(self) -> ModelLoader:
+        """The loader serving unpinned requests."""
+        return self.versions[self.current_version]
+
+    def load(self, activate: bool = True, **overrides) -> str:
+        """
+        Load, warm up and register a model version.
+
+        Args:
+            activate (bool, optional): Make it the current version once warmed up. Defaults to True.
+            **overrides: ModelLoader arguments replacing those of the initial version
+
+        Returns:
+            str: The version identifier
+
+        Raises:
+            Exception: If the artifacts cannot be loaded or the warm-up fails
+        """
+        start = time.perf_counter()
+        # Rewritten CSVs must not be answered from the tables read for earlier versions
+        read_table.cache_clear()
+        loader = ModelLoader(**{**self.loader_kwargs, **overrides})
+        load_seconds = time.perf_counter() - start
+        warmup_seconds = loader.warm_up(self.warmup_rows) if self.warmup_rows else 0.0
+
+        with self._lock:
+            self.versions[loader.version] = loader
+            self.versions.move_to_end(loader.version)
+            self.load_stats[loader.version] = {
+                "load_seconds": round(load_seconds, 4),
+                "warmup_seconds": round(warmup_seconds, 4),
+                "loaded_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            }
+            if activate or self.current_version is None:
+                # Requests already holding the previous loader finish on it
+                self.current_version = loader.version
+            self._evict()
+        logger.info("Loaded model version %s in %.3fs (warm-up %.3fs)", loader.version, load_seconds, warmup_seconds)
+        return loader.version
+
+    def load_in_background(self, activate: bool = True, **overrides) -> Future:
+        """
+        Load a version on a background thread, see load.
+
+        Returns:
+            Future: Resolves to the version identifier
+
+        Raises:
+            RuntimeError: If another load is still running
+        """
+        with self._lock:
+            if self.loading is not None:
+                raise RuntimeError("A model version is already being loaded")
+            self.loading = overrides
+        return self._load_pool.submit(self._load_and_record, activate, overrides)
+
+    def _load_and_record(self, activate: bool, overrides: Dict[str, Any]) -> str:
+        try:
+            version = self.load(activate=activate, **overrides)
+            self.last_load_error = None
+            return version
+        except Exception as e:
+            logger.error("Loading model version failed: %s", e)
+            self.last_load_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.loading = None
+
+    def _evict(self):
+        """Drop the oldest versions that nothing routes to, beyond max_versions."""
+        in_use = {self.current_version, self.canary_version, self.shadow_version}
+        for version in list(self.versions):
+            if len(self.versions) <= self.max_versions:
+                break
+            if version not in in_use:
+                del self.versions[version]
+                del self.load_stats[version]
+                logger.info("Unloaded model version %s", version)
+
+    def activate(self, version: str):
+        """
+        Make a resident version the current one.
+
+        Raises:
+            UnknownModelVersion: If the version is not loaded
+        """
+        with self._lock:
+            if version not in self.versions:
+                raise UnknownModelVersion(f"Model version {version} is not loaded")
+            self.current_version = version
+
+    def route(self, canary_version: Optional[str] = None, canary_fraction: float = 0.0,
+              shadow_version: Optional[str] = None):
+        """
+        Configure traffic splitting for unpinned requests.
+
+        Args:
+            canary_version (str, optional): Version receiving canary_fraction of the requests
+            canary_fraction (float, optional): Share of requests, 0 to 1, sent to the canary. Defaults to 0.
+            shadow_version (str, optional): Version scored alongside every request for comparison only
+
+        Raises:
+            UnknownModelVersion: If a version is not loaded
+            ValueError: If canary_fraction is outside [0, 1]
+        """
+        if not 0.0 <= canary_fraction <= 1.0:
+            raise ValueError("canary_fraction must be between 0 and 1")
+        with self._lock:
+            for version in (canary_version, shadow_version):
+                if version is not None and version not in self.versions:
+                    raise UnknownModelVersion(f"Model version {version} is not loaded")
+            self.canary_version = canary_version
+            self.canary_fraction = canary_fraction if canary_version is not None else 0.0
+            self.shadow_version = shadow_version
+
+    def select(self, model_version: Optional[str] = None) -> tuple:
+        """
+        Pick the loader for a request.
+
+        Args:
+            model_version (str, optional): Pinned version; otherwise the canary split applies
+
+        Returns:
+            tuple: (version, loader)
+
+        Raises:
+            UnknownModelVersion: If the pinned version is not loaded
+        """
+        versions = self.versions
+        if model_version is not None:
+            loader = versions.get(model_version)
+            if loader is None:
+                raise UnknownModelVersion(f"Model version {model_version} is not loaded")
+            return model_version, loader
+        version = self.current_version
+        if self.canary_version is not None and self._random.random() < self.canary_fraction:
+            version = self.canary_version
+        return version, versions[version]
+
+    def predict(self, features: Dict[str, Any], model_version: Optional[str] = None) -> tuple:
+        """
+        Make a prediction with the routed version, see ModelLoader.predict.
+
+        Returns:
+            tuple: (prediction, version)
+        """
+        version, loader = self.select(model_version)
+        prediction, _ = loader.predict(features)
+        MODEL_PREDICTIONS.inc(version)
+        if model_version is None:
+            self._shadow(version, [features], np.array([prediction]))
+        return prediction, version
+
+    def predict_with_trace(self, features: Dict[str, Any], model_version: Optional[str] = None) -> tuple:
+        """
+        Make a traced prediction with the routed version, see ModelLoader.predict_with_trace.
+
+        Returns:
+            tuple: (prediction, trace), the trace recording the version
+        """
+        version, loader = self.select(model_version)
+        prediction, trace = loader.predict_with_trace(features)
+        trace['model_version'] = version
+        MODEL_PREDICTIONS.inc(version)
+        return prediction, trace
+
+    def predict_batch(self, features_list: List[Dict[str, Any]], model_version: Optional[str] = None) -> tuple:
+        """
+        Score a batch with one routed version, see ModelLoader.predict_batch.
+
+        Returns:
+            tuple: (predictions, errors, version)
+        """
+        version, loader = self.select(model_version)
+        predictions, errors = loader.predict_batch(features_list)
+        MODEL_PREDICTIONS.inc(version, len(features_list))
+        if model_version is None:
+            self._shadow(version, features_list, predictions)
+        return predictions, errors, version
+
+    def predict_grid(self, template: Dict[str, Any], latitudes: np.ndarray, longitudes: np.ndarray,
+                     model_version: Optional[str] = None) -> tuple:
+        """
+        Value a plot over a grid with one routed version, see ModelLoader.predict_grid.
+        Grids are not shadowed; shadow comparisons come from per-plot traffic.
+
+        Returns:
+            tuple: (predictions, version)
+        """
+        version, loader = self.select(model_version)
+        predictions = loader.predict_grid(template, latitudes, longitudes)
+        MODEL_PREDICTIONS.inc(version, predictions.size)
+        return predictions, version
+
+    def predict_sensitivity(self, base: Dict[str, Any], sweeps: List[tuple], model_version: Optional[str] = None) -> tuple:
+        """
+        Value a plot and its variants with one routed version, see ModelLoader.predict_sensitivity.
+
+        Returns:
+            tuple: (base prediction, sweep predictions, version)
+        """
+        version, loader = self.select(model_version)
+        base_prediction, sweep_predictions = loader.predict_sensitivity(base, sweeps)
+        MODEL_PREDICTIONS.inc(version, 1 + sum(len(predictions) for predictions in sweep_predictions))
+        return base_prediction, sweep_predictions, version
+
+    def explain_batch(self, features_list: List[Dict[str, Any]], model_version: Optional[str] = None) -> tuple:
+        """
+        Score and explain a batch with one routed version, see ModelLoader.explain_batch.
+
+        Returns:
+            tuple: (predictions, explanations, errors, version)
+        """
+        version, loader = self.select(model_version)
+        predictions, explanations, errors = loader.explain_batch(features_list)
+        MODEL_PREDICTIONS.inc(version, len(features_list))
+        return predictions, explanations, errors, version
+
+    def predict_intervals(self, features_list: List[Dict[str, Any]], model_version: Optional[str] = None) -> tuple:
+        """
+        Score a batch with prediction intervals with one routed version, see ModelLoader.predict_intervals.
+
+        Returns:
+            tuple: (predictions, intervals, errors, version)
+        """
+        version, loader = self.select(model_version)
+        predictions, intervals, errors = loader.predict_intervals(features_list)
+        MODEL_PREDICTIONS.inc(version, len(features_list))
+        return predictions, intervals, errors, version
+
+    def _shadow(self, served_version: str, features_list: List[Dict[str, Any]], predictions: np.ndarray):
+        """Score the same inputs with the shadow version off the request path."""
+        shadow_version = self.shadow_version
+        if shadow_version is None or shadow_version == served_version:
+            return
+        with self._lock:
+            # Shadow scoring must never queue up behind live traffic
+            if self._shadow_pending >= SHADOW_MAX_PENDING:
+                self.shadow_skipped += 1
+                return
+            self._shadow_pending += 1
+        self._shadow_pool.submit(self._compare_shadow, shadow_version, features_list, predictions)
+
+    def _compare_shadow(self, shadow_version: str, features_list: List[Dict[str, Any]], predictions: np.ndarray):
+        try:
+            loader = self.versions.get(shadow_version)
+            if loader is None:
+                return
+            shadow_predictions, _ = loader.predict_batch(features_list)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                differences = np.abs(shadow_predictions - predictions) / np.abs(predictions)
+            for difference in differences[np.isfinite(differences)]:
+                SHADOW_DIFFERENCE.observe(shadow_version, float(difference))
+        except Exception as e:
+            logger.warning("Shadow prediction with %s failed: %s", shadow_version, e)
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def preload(self):
+        """Load every resident version completely, e.g. before forking workers."""
+        for loader in list(self.versions.values()):
+            loader.preload()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current version, routing, and load latency of every resident version."""
+        with self._lock:
+            return {
+                "current_version": self.current_version,
+                "canary_version": self.canary_version,
+                "canary_fraction": self.canary_fraction,
+                "shadow_version": self.shadow_version,
+                "shadow_skipped": self.shadow_skipped,
+                "loading": self.loading is not None,
+                "last_load_error": self.last_load_error,
+                "versions": {version: dict(stats) for version, stats in self.load_stats.items()},
+            }
+
+    def shutdown(self):
+        """Stop the background load and shadow threads."""
+        self._load_pool.shutdown(wait=False)
+        self._shadow_pool.shutdown(wait=True)
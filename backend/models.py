@@ -1,18 +1,79 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional
+from pydantic import BaseModel, Field, ValidationError, validator, model_validator
+from typing import Any, Dict, List, Literal, Optional
 import re
-import pandas as pd
+import time
+import logging
+from metrics import STAGE_LATENCY
+from artifact_bundle import read_table
 
-# Load city data from city_center_coords.csv
-city_data = pd.read_csv('city_center_coords.csv')
-valid_cities = city_data['City_en'].tolist()
+logger = logging.getLogger(__name__)
 
-# Create a mapping of cities to their regions
-city_region_map = dict(zip(city_data['City_en'], city_data['Region']))
+# Tables the city lookups were built from, and the lookups
+_city_lookups = (None, None, None)
 
-# Load region capitals
-region_capitals = pd.read_csv('Regions_capitals.csv')
-region_capital_map = dict(zip(region_capitals['Region'], region_capitals['Capital']))
+
+def city_lookups() -> tuple:
+    """
+    Build the city lookups from the reference tables shared with the preprocessor, on first
+    use so that importing this module does not read them, and again once read_table returns
+    other tables, e.g. after a model reload.
+
+    Returns:
+        tuple: (valid_cities, city_region_map, region_capital_map)
+    """
+    global _city_lookups
+    # Load city data from city_center_coords.csv and the region capitals
+    city_data = read_table('city_center_coords')
+    region_capitals = read_table('Regions_capitals')
+    built_from_city_data, built_from_capitals, lookups = _city_lookups
+    if city_data is built_from_city_data and region_capitals is built_from_capitals:
+        return lookups
+
+    valid_cities = frozenset(city_data['City_en'])
+
+    # Create a mapping of cities to their regions
+    city_region_map = dict(zip(city_data['City_en'], city_data['Region']))
+
+    region_capital_map = dict(zip(region_capitals['Region'], region_capitals['Capital']))
+    lookups = (valid_cities, city_region_map, region_capital_map)
+    _city_lookups = (city_data, region_capitals, lookups)
+    return lookups
+
+# Allowed categorical values, built once; tuples keep the order used in error messages
+VALID_REGIONS = (
+    "Riyadh",
+    "Makkah",
+    "Madinah",
+    "Eastern Province",
+    "Asir",
+    "Tabuk",
+    "Hail",
+    "Northern Borders",
+    "Jazan",
+    "Najran",
+    "Al Baha",
+    "Al Jawf",
+    "Al Qassim"
+)
+# Spellings used by the region encoder and sent by the frontend
+REGION_ALIASES = ("Bahah", "Jawf", "Qassim")
+VALID_ASSET_LEVELS = ('A', 'B', 'C', 'D')
+VALID_ASSET_TYPES = (
+    "Housing Land",
+    "Commercial Land",
+    "Raw Land",
+    "Farming Land"
+)
+
+# Border categories assigned from border descriptions
+BORDER_TYPES = ('Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space', 'Other')
+
+valid_region_set = frozenset(VALID_REGIONS + REGION_ALIASES)
+valid_asset_level_set = frozenset(VALID_ASSET_LEVELS)
+valid_asset_type_set = frozenset(VALID_ASSET_TYPES)
+
+# Arabic letters, English letters, numbers, spaces, hyphens and periods
+text_field_pattern = re.compile(r'^[\u0600-\u06FF\u0750-\u077Fa-zA-Z0-9\s\-\.]+$')
 
 class PredictionInput(BaseModel):
     """
@@ -36,16 +97,26 @@ class PredictionInput(BaseModel):
     EvaluationAssetTypeName: str = Field(..., description="Asset type")
     AssetLevelId: str = Field(..., description="Asset level")
 
+    @model_validator(mode='wrap')
+    def time_validation(cls, values, handler):
+        """Record how long validation of the whole input takes"""
+        start = time.perf_counter()
+        try:
+            return handler(values)
+        finally:
+            STAGE_LATENCY.observe('validation', time.perf_counter() - start)
+
     @validator('PropAssetCityName')
     def validate_city(cls, v, values):
         """Validate that the city exists in our database or use region capital as fallback"""
+        valid_cities, _, region_capital_map = city_lookups()
         if v not in valid_cities:
             # If city not found, try to use region capital
             if 'PropAssetRegionName' in values:
                 region = values['PropAssetRegionName']
                 capital = region_capital_map.get(region)
                 if capital and capital in valid_cities:
-                    print(f"City '{v}' not found. Using region capital '{capital}' instead.")
+                    logger.info("City '%s' not found. Using region capital '%s' instead.", v, capital)
                     return capital
                 else:
                     raise ValueError(f'City {v} not found and no valid capital found for region {region}')
@@ -57,27 +128,13 @@ class PredictionInput(BaseModel):
     @validator('PropAssetRegionName', pre=True)
     def validate_region(cls, v, values):
         """Validate property asset region and ensure it matches the city"""
-        valid_regions = [
-            "Riyadh",
-            "Makkah",
-            "Madinah",
-            "Eastern Province",
-            "Asir",
-            "Tabuk",
-            "Hail",
-            "Northern Borders",
-            "Jazan",
-            "Najran",
-            "Al Baha",
-            "Al Jawf",
-            "Al Qassim"
-        ]
-        if v not in valid_regions:
-            raise ValueError(f'PropAssetRegionName must be one of: {", ".join(valid_regions)}')
+        if not isinstance(v, str) or v not in valid_region_set:
+            raise ValueError(f'PropAssetRegionName must be one of: {", ".join(VALID_REGIONS)}')
         
         # Check if city is provided and validate city-region match
         if 'PropAssetCityName' in values:
             city = values['PropAssetCityName']
+            _, city_region_map, _ = city_lookups()
             expected_region = city_region_map.get(city)
             if expected_region != v:
                 raise ValueError(f'City {city} belongs to region {expected_region}, but {v} was provided')
@@ -89,7 +146,7 @@ class PredictionInput(BaseModel):
         """Validate string fields to ensure they don't contain only whitespace or special characters"""
         if not v.strip():
             raise ValueError("Field cannot be empty or contain only whitespace")
-        if not re.match(r'^[\u0600-\u06FF\u0750-\u077Fa-zA-Z0-9\s\-\.]+$', v):
+        if not text_field_pattern.match(v):
             raise ValueError("Field can only contain Arabic letters, English letters, numbers, spaces, hyphens, and periods")
         return v.strip()
 
@@ -108,22 +165,15 @@ class PredictionInput(BaseModel):
     @validator('AssetLevelId')
     def validate_asset_level(cls, v):
         """Validate asset level"""
-        valid_levels = ['A', 'B', 'C', 'D']
-        if v not in valid_levels:
-            raise ValueError(f'AssetLevelId must be one of: {", ".join(valid_levels)}')
+        if v not in valid_asset_level_set:
+            raise ValueError(f'AssetLevelId must be one of: {", ".join(VALID_ASSET_LEVELS)}')
         return v
 
     @validator('EvaluationAssetTypeName')
     def validate_asset_type(cls, v):
         """Validate evaluation asset type"""
-        valid_types = [
-            "Housing Land",
-            "Commercial Land",
-            "Raw Land",
-            "Farming Land"
-        ]
-        if v not in valid_types:
-            raise ValueError(f'EvaluationAssetTypeName must be one of: {", ".join(valid_types)}')
+        if v not in valid_asset_type_set:
+            raise ValueError(f'EvaluationAssetTypeName must be one of: {", ".join(VALID_ASSET_TYPES)}')
         return v
 
     class Config:
@@ -149,8 +199,106 @@ class PredictionInput(BaseModel):
 }
         }
 
+def validate_records(records: List[Any]) -> tuple:
+    """
+    Validate records individually, so one invalid row does not reject the rest.
+
+    Args:
+        records (List[Any]): Raw input records
+
+    Returns:
+        tuple: (valid_indices, valid_records, errors) - the positions and validated dicts of the
+            valid records, and for every record None or its list of {loc, msg, type} errors
+    """
+    valid_indices = []
+    valid_records = []
+    errors = [None] * len(records)
+    for i, record in enumerate(records):
+        try:
+            valid_records.append(PredictionInput.model_validate(record).model_dump())
+            valid_indices.append(i)
+        except ValidationError as e:
+            errors[i] = [{"loc": error["loc"], "msg": error["msg"], "type": error["type"]} for error in e.errors()]
+    return valid_indices, valid_records, errors
+
 class PredictionResponse(BaseModel):
     """
     Model for prediction response.
     """
-    prediction: float 
\ No newline at end of file
+    prediction: float
+
+class GridRequest(BaseModel):
+    """
+    Model for valuing one plot over a latitude/longitude grid.
+    """
+    template: PredictionInput = Field(..., description="Plot valued at every grid point; its coordinates are replaced")
+    min_latitude: float = Field(..., ge=-90, le=90, description="Southern edge of the grid")
+    max_latitude: float = Field(..., ge=-90, le=90, description="Northern edge of the grid")
+    min_longitude: float = Field(..., ge=-180, le=180, description="Western edge of the grid")
+    max_longitude: float = Field(..., ge=-180, le=180, description="Eastern edge of the grid")
+    rows: int = Field(..., ge=1, description="Grid points from south to north, edges included")
+    cols: int = Field(..., ge=1, description="Grid points from west to east, edges included")
+    value: Literal['price', 'price_per_m2'] = Field('price_per_m2', description="Value returned per point")
+
+    @model_validator(mode='after')
+    def validate_bounds(self):
+        """Validate that the bounding box is not inverted"""
+        if self.min_latitude > self.max_latitude or self.min_longitude > self.max_longitude:
+            raise ValueError("min_latitude/min_longitude must not exceed max_latitude/max_longitude")
+        return self
+
+class Perturbation(BaseModel):
+    """
+    Model for a sweep over the values of one input field.
+    """
+    field: Literal['StreetWidth', 'Area', 'NorthBorder', 'SouthBorder', 'East_order', 'WestBorder', 'AssetLevelId'] = Field(
+        ..., description="Input field to vary")
+    values: List[Any] = Field(..., min_length=1, description="Numbers for StreetWidth and Area, border types "
+                              "for the borders, levels for AssetLevelId")
+
+    @model_validator(mode='after')
+    def validate_values(self):
+        """Validate the values like the base input's field"""
+        if self.field in ('StreetWidth', 'Area'):
+            try:
+                values = [float(value) for value in self.values]
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.field} values must be numbers")
+            if any(not value > 0 for value in values):
+                raise ValueError(f"{self.field} values must be greater than 0")
+            self.values = [round(value, 2) for value in values]
+        elif self.field == 'AssetLevelId':
+            if any(value not in valid_asset_level_set for value in self.values):
+                raise ValueError(f'AssetLevelId values must be one of: {", ".join(VALID_ASSET_LEVELS)}')
+        elif any(value not in BORDER_TYPES for value in self.values):
+            raise ValueError(f'{self.field} values must be border types: {", ".join(BORDER_TYPES)}')
+        return self
+
+class SensitivityRequest(BaseModel):
+    """
+    Model for valuing a plot together with variants that each change one field.
+    """
+    base: PredictionInput = Field(..., description="Plot the variants are derived from")
+    perturbations: List[Perturbation] = Field(..., min_length=1, description="Sweeps to value")
+
+class ModelLoadRequest(BaseModel):
+    """
+    Model for loading a new model version; unset paths keep those of the running version.
+    """
+    bundle_path: Optional[str] = Field(None, description="Artifact bundle directory")
+    model_path: Optional[str] = Field(None, description="Pickled GradientBoostingRegressor")
+    target_scaler_path: Optional[str] = Field(None, description="Pickled target scaler")
+    standard_scaler_path: Optional[str] = Field(None, description="Pickled feature scaler")
+    activate: bool = Field(True, description="Serve the version once it is warmed up")
+
+    class Config:
+        # Allow the model_path field
+        protected_namespaces = ()
+
+class ModelRoutingRequest(BaseModel):
+    """
+    Model for splitting traffic between resident model versions.
+    """
+    canary_version: Optional[str] = Field(None, description="Version receiving a share of the requests")
+    canary_fraction: float = Field(0.0, ge=0, le=1, description="Share of requests sent to the canary")
+    shadow_version: Optional[str] = Field(None, description="Version scored alongside every request for comparison")
@@ -0,0 +1,174 @@
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Bins between the training quantiles of every monitored feature
+SKETCH_BINS = 20
+
+# Rows after which an observation weighs half as much in the sketches
+DRIFT_HALF_LIFE_ROWS = 10000
+
+# Floor of a bin's share in the population stability index, so an empty bin does not make it infinite
+PSI_FLOOR = 1e-4
+
+# Quantiles reported per feature
+REPORT_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _bin_indexes(X: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Bin every value of X by the edges of its column: 0 below the first edge, i for values in
+    [edges[i-1], edges[i]) (the last inner bin includes the top edge), len(edges) above the last.
+    """
+    inner = (X[:, :, None] >= edges[None, :, :-1]).sum(axis=2)
+    return inner + (X > edges[None, :, -1])
+
+
+def _bin_counts(X: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Count the values of every column of X per bin of _bin_indexes, in one bincount."""
+    n_features, n_edges = edges.shape
+    flat = _bin_indexes(X, edges) + np.arange(n_features) * (n_edges + 1)
+    return np.bincount(flat.ravel(), minlength=n_features * (n_edges + 1)).reshape(n_features, n_edges + 1)
+
+
+def reference_distributions(X: np.ndarray, columns: List[str], bins: int = SKETCH_BINS) -> Dict[str, Dict[str, List[float]]]:
+    """
+    Summarize the training distribution of some features as the reference of FeatureMonitor.
+
+    Args:
+        X (np.ndarray): Training values of shape (n_rows, len(columns)), as fed to the model
+        columns (List[str]): Feature names
+        bins (int, optional): Number of bins between quantiles. Defaults to SKETCH_BINS.
+
+    Returns:
+        Dict[str, Dict[str, List[float]]]: Per feature, 'edges' (the quantiles at 0, 1/bins, ..., 1)
+            and 'fractions', the share of training rows in each of the bins + 2 bins of _bin_indexes
+    """
+    X = np.asarray(X, dtype=np.float64)
+    edges = np.quantile(X, np.linspace(0, 1, bins + 1), axis=0).T
+    counts = _bin_counts(X, edges)
+    fractions = counts / max(len(X), 1)
+    return {
+        col: {'edges': edges[i].tolist(), 'fractions': fractions[i].tolist()}
+        for i, col in enumerate(columns)
+    }
+
+
+class FeatureMonitor:
+    def __init__(self, columns: List[str], positions: Sequence[int],
+                 reference: Optional[Dict[str, Dict[str, List[float]]]] = None,
+                 half_life_rows: float = DRIFT_HALF_LIFE_ROWS):
+        """
+        Streaming sketches of the model's numeric inputs, compared to their training distribution.
+
+        Every feature keeps a histogram with fixed bins at its training quantiles, plus one bin
+        below and one above the training range. Counts decay exponentially so the sketches follow
+        recent traffic, and quantiles and drift scores are read from them at any time.
+
+        Args:
+            columns (List[str]): Names of the monitored features
+            positions (Sequence[int]): Their columns in the model input rows
+            reference (Dict[str, Dict[str, List[float]]], optional): Output of reference_distributions
+                for these columns, e.g. from the feature schema. Without it, e.g. for artifacts older
+                than the schema's feature_reference, nothing is sketched and drift is unavailable.
+            half_life_rows (float, optional): Rows after which an observation counts half. Defaults
+                to DRIFT_HALF_LIFE_ROWS.
+        """
+        self.columns = list(columns)
+        self.positions = np.asarray(positions, dtype=np.intp)
+        self.half_life_rows = float(half_life_rows)
+        self.available = reference is not None and all(col in reference for col in self.columns)
+        if self.available:
+            self.edges = np.array([reference[col]['edges'] for col in self.columns], dtype=np.float64)
+            self.reference_fractions = np.array([reference[col]['fractions'] for col in self.columns])
+        else:
+            self.edges = self.reference_fractions = None
+
+        self._counts = np.zeros((len(self.columns), self.edges.shape[1] + 1 if self.available else 0))
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def observe(self, X: np.ndarray):
+        """
+        Add model input rows to the sketches.
+
+        Args:
+            X (np.ndarray): Rows of shape (n_rows, n_model_features)
+        """
+        if not len(X) or not len(self.columns) or not self.available:
+            return
+        counts = _bin_counts(np.asarray(X, dtype=np.float64)[:, self.positions], self.edges)
+        decay = 0.5 ** (len(X) / self.half_life_rows)
+        with self._lock:
+            self._counts *= decay
+            self._counts += counts
+            self._rows += len(X)
+
+    def _snapshot(self) -> tuple:
+        with self._lock:
+            return self._counts.copy(), self._rows
+
+    def _quantiles(self, fractions: np.ndarray, qs: Sequence[float]) -> np.ndarray:
+        """Interpolate quantiles within the bins of each feature; the outer bins map to the range ends."""
+        cumulative = np.cumsum(fractions, axis=1)
+        result = np.empty((len(self.columns), len(qs)))
+        for i in range(len(self.columns)):
+            # Bin b covers [edges[b-1], edges[b]]; the outer bins are collapsed onto the range ends
+            lower = np.concatenate([[self.edges[i, 0]], self.edges[i]])
+            upper = np.concatenate([self.edges[i], [self.edges[i, -1]]])
+            for j, q in enumerate(qs):
+                b = min(int(np.searchsorted(cumulative[i], q * cumulative[i, -1])), len(lower) - 1)
+                start = cumulative[i, b] - fractions[i, b]
+                share = (q * cumulative[i, -1] - start) / fractions[i, b] if fractions[i, b] > 0 else 0.0
+                result[i, j] = lower[b] + share * (upper[b] - lower[b])
+        return result
+
+    def drift(self) -> Optional[Dict[str, float]]:
+        """
+        Population stability index of the sketched inputs against the reference, per feature:
+        sum((observed - expected) * ln(observed / expected)) over the bins. Below 0.1 is
+        commonly read as stable and above 0.25 as a significant shift.
+
+        Returns:
+            Optional[Dict[str, float]]: PSI by feature name, empty before any row was observed, or
+                None without a training reference
+        """
+        if not self.available:
+            return None
+        counts, rows = self._snapshot()
+        if not rows:
+            return {}
+        observed = np.maximum(counts / counts.sum(axis=1, keepdims=True), PSI_FLOOR)
+        expected = np.maximum(self.reference_fractions, PSI_FLOOR)
+        psi = ((observed - expected) * np.log(observed / expected)).sum(axis=1)
+        return {col: float(value) for col, value in zip(self.columns, psi)}
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Summarize the sketches for the monitoring endpoint.
+
+        Returns:
+            Dict[str, Any]: rows observed, whether the training reference is available, and per
+                feature its PSI, the share of recent values outside the training range and
+                REPORT_QUANTILES of the recent and the reference distribution, all None without
+                a reference
+        """
+        counts, rows = self._snapshot()
+        drift = self.drift() or {}
+        features = {}
+        if rows:
+            observed = counts / counts.sum(axis=1, keepdims=True)
+            recent = self._quantiles(observed, REPORT_QUANTILES)
+        if self.available:
+            reference = self._quantiles(self.reference_fractions, REPORT_QUANTILES)
+        names = [f'p{q * 100:g}' for q in REPORT_QUANTILES]
+        for i, col in enumerate(self.columns):
+            features[col] = {
+                'psi': drift.get(col),
+                'out_of_range': float(observed[i, 0] + observed[i, -1]) if rows else None,
+                'recent': dict(zip(names, recent[i].tolist())) if rows else None,
+                'reference': dict(zip(names, reference[i].tolist())) if self.available else None,
+            }
+        return {'rows': rows, 'reference_available': self.available, 'half_life_rows': self.half_life_rows,
+                'features': features}
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Rounding applied by the models.PredictionInput validators
+ROUNDED_FIELDS = {
+    'Area': 2,
+    'LengthFromNorth': 2,
+    'LengthFromSouth': 2,
+    'LengthFromEast': 2,
+    'LengthFromWest': 2,
+    'StreetWidth': 2,
+    'Latitude': 6,
+    'Longitude': 6,
+}
+
+# String fields stripped by the models.PredictionInput validators
+STRIPPED_FIELDS = {'PropAssetNeighborhoodName', 'NorthBorder', 'SouthBorder', 'East_order', 'WestBorder'}
+
+
+def canonical_key(features: Dict[str, Any]) -> tuple:
+    """
+    Build a hashable cache key from an input record, normalized the same way
+    PredictionInput normalizes it, so inputs differing only by float noise match.
+
+    Args:
+        features (Dict[str, Any]): Dictionary containing feature values
+
+    Returns:
+        tuple: Sorted (field, value) pairs
+    """
+    key = []
+    for name in sorted(features):
+        value = features[name]
+        if name in ROUNDED_FIELDS and value is not None:
+            value = round(float(value), ROUNDED_FIELDS[name])
+        elif name in STRIPPED_FIELDS and isinstance(value, str):
+            value = value.strip()
+        key.append((name, value))
+    return tuple(key)
+
+
+def artifact_fingerprint(*paths: Optional[str]) -> tuple:
+    """
+    Identify a set of artifact files by path, size and modification time.
+
+    Args:
+        *paths (str): Artifact paths; None entries are ignored
+
+    Returns:
+        tuple: Fingerprint that changes whenever any artifact changes
+    """
+    fingerprint = []
+    for path in paths:
+        if path is None:
+            continue
+        try:
+            stat = os.stat(path)
+            fingerprint.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            fingerprint.append((os.path.abspath(path), None, None))
+    return tuple(fingerprint)
+
+
+class PredictionCache:
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 3600.0):
+        """
+        Bounded, thread-safe LRU cache of predictions with an optional TTL.
+
+        Entries are not tied to the artifacts they were made with: every ModelLoader owns its own
+        cache, and loading new artifacts creates a new loader, hence an empty cache.
+
+        Args:
+            max_size (int, optional): Maximum number of entries; 0 disables the cache. Defaults to 10000.
+            ttl_seconds (float, optional): Entry lifetime in seconds; 0 or None keeps entries until evicted. Defaults to 3600.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: tuple) -> Optional[float]:
+        """
+        Look up a prediction.
+
+        Args:
+            key (tuple): Key from canonical_key
+
+        Returns:
+            Optional[float]: Cached prediction, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: float):
+        """
+        Store a prediction, evicting the least recently used entry when full.
+
+        Args:
+            key (tuple): Key from canonical_key
+            value (float): Prediction to cache
+        """
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import gc
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict
+
+# Model loader owned by a process-pool worker
+_worker_loader = None
+
+
+def _init_worker(loader_kwargs: Dict[str, Any]):
+    """Load the model once in each process-pool worker."""
+    global _worker_loader
+    from model_loader import ModelRegistry
+    _worker_loader = ModelRegistry(loader_kwargs)
+
+
+def _call_worker(method: str, args: tuple, kwargs: Dict[str, Any]):
+    """Run a ModelRegistry method in a process-pool worker."""
+    return getattr(_worker_loader, method)(*args, **kwargs)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the prediction queue is full."""
+
+
+class PredictionExecutor:
+    def __init__(self, model_registry, mode: str = 'thread', workers: int = 4, queue_depth: int = 64,
+                 loader_kwargs: Dict[str, Any] = None, preload: bool = False):
+        """
+        Run CPU-bound ModelLoader calls off the event loop with bounded queueing.
+
+        Args:
+            model_registry (ModelRegistry): Models used directly by thread workers and inherited by
+                preloaded process workers; other process workers load their own
+            mode (str, optional): 'thread' to share model_registry across a thread pool, 'process' to
+                load a separate ModelLoader in every worker process. Defaults to 'thread'.
+            workers (int, optional): Number of pool workers. Defaults to 4.
+            queue_depth (int, optional): Calls allowed to wait for a free worker before new ones are
+                rejected. Defaults to 64.
+            loader_kwargs (Dict[str, Any], optional): ModelLoader arguments of the model each process
+                worker loads; process workers only ever serve this one version
+            preload (bool, optional): In 'process' mode, fork the workers from this process so they
+                share model_registry copy-on-write instead of each loading their own. Defaults to False.
+        """
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.model_registry = model_registry
+        self.mode = mode
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.capacity = workers + queue_depth
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+        self.preload = preload and mode == 'process'
+        if self.preload:
+            self._pool = self._fork_preloaded_pool(model_registry, workers)
+        elif mode == 'process':
+            self._pool = self._spawn_pool(loader_kwargs or {}, workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prediction')
+
+    @staticmethod
+    def _fork_preloaded_pool(model_registry, workers: int) -> ProcessPoolExecutor:
+        """Fork process workers that inherit the already loaded models."""
+        global _worker_loader
+        model_registry.preload()
+        _worker_loader = model_registry
+
+        # Keep the collector from writing to inherited objects, which would copy their pages
+        gc.freeze()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+
+        # A fork pool starts all its workers on the first submit; do it now, before the
+        # event loop and its threads exist
+        pool.submit(int).result()
+        return pool
+
+    @staticmethod
+    def _spawn_pool(loader_kwargs: Dict[str, Any], workers: int) -> ProcessPoolExecutor:
+        """Start process workers that each load their own model, in fresh interpreters."""
+        # Forking once the event loop and the registry's threads run could copy a held lock into
+        # a worker; spawned workers do not inherit any of the parent's state
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(loader_kwargs,))
+
+        # A spawn pool starts a worker per submit that finds none idle; start them all now so
+        # their models are loaded before the first request
+        for future in [pool.submit(int) for _ in range(workers)]:
+            future.result()
+        return pool
+
+    async def run(self, method: str, *args, **kwargs):
+        """
+        Run a ModelRegistry method in the pool.
+
+        Args:
+            method (str): ModelRegistry method name, e.g. 'predict'
+            *args: Positional arguments for the method
+            **kwargs: Keyword arguments for the method
+
+        Returns:
+            The method's return value
+
+        Raises:
+            ExecutorSaturated: If workers and queue are all occupied
+        """
+        with self._lock:
+            if self.in_flight >= self.capacity:
+                self.rejected += 1
+                raise ExecutorSaturated(f"Prediction queue is full ({self.capacity} calls in flight)")
+            self.in_flight += 1
+
+        try:
+            if self.mode == 'process':
+                future = self._pool.submit(_call_worker, method, args, kwargs)
+            else:
+                future = self._pool.submit(functools.partial(getattr(self.model_registry, method), *args, **kwargs))
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+            raise
+
+        # Release the slot when the work finishes, even if the caller has gone away
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool configuration and queue counters."""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "preload": self.preload,
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        """Stop the pool, waiting for running calls to finish."""
+        self._pool.shutdown(wait=True)
+        if self.preload:
+            # The forked workers are gone; let the collector manage the inherited objects again
+            gc.unfreeze()
@@ -1,16 +1,107 @@
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from sklearn.neighbors import BallTree
 from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 import pickle
+import os
+import re
+import json
+import logging
+from functools import lru_cache
+from metrics import FEATURE_FALLBACKS, STAGE_LATENCY
+from artifact_bundle import ArtifactBundle, read_table
+
+# Arabic letter variants folded together when normalizing names
+_ARABIC_NORMALIZATION = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+    'ـ': None,  # tatweel
+    **{chr(code): None for code in range(0x064B, 0x0660)},  # harakat
+    '\u0670': None,  # superscript alef
+})
+_WHITESPACE = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+# Column layout and encoder categories written by train_model.py next to the model it trained
+FEATURE_SCHEMA_FILE = 'feature_schema.json'
+
+# Nearest-center queries over fewer plot/center pairs than this scan every center instead of the BallTree
+NEAREST_BRUTE_FORCE_PAIRS = 4096
+
+
+def normalize_name(name: Any) -> str:
+    """
+    Normalize a city or neighborhood name for lookups: trims and collapses
+    whitespace, lowercases, and unifies Arabic letter variants.
+    
+    Args:
+        name (Any): Raw name
+        
+    Returns:
+        str: Normalized name
+    """
+    if not isinstance(name, str):
+        return ''
+    return _WHITESPACE.sub(' ', name.translate(_ARABIC_NORMALIZATION)).strip().lower()
+
 
 class FeaturePreprocessor:
-    def __init__(self):
+    # Scaled columns that only depend on the neighborhood/city pair
+    LOCATION_SCALED_COLUMNS = ['Encoded_Hood', 'Encoded_City']
+    
+    # Layout of location_values: raw encodings, scaled encodings and the city center
+    LOCATION_COLUMNS = ['Encoded_Hood', 'Encoded_City', 'Encoded_Hood_scaled', 'Encoded_City_scaled',
+                        'City_Center_Lat', 'City_Center_Lon']
+    
+    # Fallbacks counted in FEATURE_FALLBACKS for every looked up location table row: the names
+    # only matched after normalization, the neighborhood is unknown and the city's encoding is
+    # used for both, the city is unknown too, a missing encoding is scaled as 0, and the city has
+    # no center so the distance is measured to the nearest one
+    LOCATION_FALLBACKS = ('normalized_name', 'hood_to_city', 'unknown_location', 'encoding_nan_to_zero',
+                          'nearest_city_center')
+    
+    # Input fields build_sensitivity_matrix can vary
+    SENSITIVITY_FIELDS = ('StreetWidth', 'Area', 'NorthBorder', 'SouthBorder', 'East_order', 'WestBorder',
+                          'AssetLevelId')
+    
+    # Numeric model inputs, ahead of the one-hot columns in training_columns
+    MODEL_NUMERIC_COLUMNS = ['Area', 'LengthFromNorth', 'LengthFromSouth', 'LengthFromEast',
+                             'LengthFromWest', 'StreetWidth', 'distance_from_center_km', 'Perimeter',
+                             'Street_Frontage', 'Num_Street_Fronts', 'Encoded_Hood', 'Encoded_City',
+                             'Latitude', 'Longitude']
+    
+    # Categories of the one-hot encoded columns, in training_columns order, when no schema is given
+    DEFAULT_ENCODER_CATEGORIES = {
+        'PropAssetRegionName': ['Riyadh', 'Makkah', 'Madinah', 'Eastern Province', 'Asir', 'Tabuk', 'Hail',
+                                'Northern Borders', 'Jazan', 'Najran', 'Bahah', 'Jawf', 'Qassim'],
+        'EvaluationAssetTypeName': ['Housing Land', 'Commercial Land', 'Raw Land', 'Farming Land'],
+        **{f'{col}_Type': ['Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space', 'Other']
+           for col in ('NorthBorder', 'SouthBorder', 'East_order', 'WestBorder')},
+        'AssetLevelId': ['A', 'B', 'C', 'D'],
+    }
+    
+    def __init__(self, bundle: Optional[ArtifactBundle] = None, scaler: Optional[StandardScaler] = None,
+                 schema: Optional[Dict[str, Any]] = None, tables: Optional[Dict[str, pd.DataFrame]] = None):
         """
         Initialize the feature preprocessor.
         This will be extended with specific preprocessing steps.
+        
+        Args:
+            bundle (ArtifactBundle, optional): Compiled artifacts to take encoders, scaler, column layout and
+                tables from. If None, encoders are fitted here and tables read from the CSVs.
+            scaler (StandardScaler, optional): Already loaded feature scaler; read from standard_scaler.pkl if None
+            schema (Dict[str, Any], optional): training_columns and encoder_categories, as written by
+                train_model.py, and optionally the feature_reference distributions; read from
+                FEATURE_SCHEMA_FILE if None and the file exists, else the layout of the original model is used
+            tables (Dict[str, pd.DataFrame], optional): Reference tables by CSV file stem that replace
+                the files, e.g. a freshly fitted 'encoded_neighb_city'
+            
+        Raises:
+            ValueError: If the schema's numeric transforms differ from this code's
         """
         self.categorical_columns = [
             'PropAssetCityName',
@@ -37,70 +128,34 @@ class FeaturePreprocessor:
             'Num_Street_Fronts'
         ]
         
-        # Initialize encoders with known categories
-        self.encoders = {}
+        if bundle is not None:
+            # Fitted encoders, scaler and reference tables compiled by artifact_bundle.build_bundle
+            self.encoders = dict(bundle.encoders)
+            self.scaler = bundle.standard_scaler
+        else:
+            if schema is None and os.path.exists(FEATURE_SCHEMA_FILE):
+                with open(FEATURE_SCHEMA_FILE, encoding='utf-8') as f:
+                    schema = json.load(f)
+            self._fit_encoders(schema['encoder_categories'] if schema is not None else self.DEFAULT_ENCODER_CATEGORIES)
+            if scaler is None:
+                # Load the pre-trained scaler
+                with open('standard_scaler.pkl', 'rb') as f:
+                    scaler = pickle.load(f)
+            self.scaler = scaler
         
-        # Initialize and fit AssetLevelId encoder
-        asset_level_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        asset_level_encoder.fit(pd.DataFrame({'AssetLevelId': ['A', 'B', 'C', 'D']}))
-        self.encoders['AssetLevelId'] = asset_level_encoder
-        
-        # Initialize and fit EvaluationAssetTypeName encoder
-        asset_type_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        asset_type_encoder.fit(pd.DataFrame({'EvaluationAssetTypeName': [
-            'Housing Land', 'Commercial Land', 'Raw Land', 'Farming Land'
-        ]}))
-        self.encoders['EvaluationAssetTypeName'] = asset_type_encoder
-
-
-        # Initialize and fit Border_typ encoder
-        NorthBorder_Type_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        NorthBorder_Type_encoder.fit(pd.DataFrame({'NorthBorder_Type': [
-            'Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space','Other'
-        ]}))
-        self.encoders['NorthBorder_Type'] = NorthBorder_Type_encoder
-
-        SouthBorder_Type_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        SouthBorder_Type_encoder.fit(pd.DataFrame({'SouthBorder_Type': [
-            'Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space', 'Other'
-        ]}))
-        self.encoders['SouthBorder_Type'] = SouthBorder_Type_encoder
-
-        East_order_Type_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        East_order_Type_encoder.fit(pd.DataFrame({'East_order_Type': [
-            'Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space', 'Other'
-        ]}))
-        self.encoders['East_order_Type'] = East_order_Type_encoder
-
-        WestBorder_Type_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        WestBorder_Type_encoder.fit(pd.DataFrame({'WestBorder_Type': [
-            'Street', 'Building', 'Empty_Plot', 'Alley', 'Parking', 'Public_space', 'Other'
-        ]}))
-        self.encoders['WestBorder_Type'] = WestBorder_Type_encoder
-
-
-        # Initialize and fit PropAssetRegionName encoder
-        region_encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-        region_encoder.fit(pd.DataFrame({'PropAssetRegionName': [
-            'Riyadh', 'Makkah', 'Madinah', 'Eastern Province', 
-            'Asir', 'Tabuk', 'Hail', 'Northern Borders', 
-            'Jazan', 'Najran', 'Bahah', 'Jawf', 'Qassim'
-        ]}))
-        self.encoders['PropAssetRegionName'] = region_encoder
-        
-        # Load the pre-trained scaler
-        with open('standard_scaler.pkl', 'rb') as f:
-            self.scaler = pickle.load(f)
+        def load_table(name):
+            if tables is not None and name in tables:
+                return tables[name]
+            return bundle.table(name) if bundle is not None else read_table(name)
         
         # Load city center coordinates
-        self.city_centers = pd.read_csv('city_center_coords.csv')
-        self.city_centers = self.city_centers.rename(columns={
+        self.city_centers = load_table('city_center_coords').rename(columns={
             'Latitude': 'City_Center_Lat',
             'Longitude': 'City_Center_Lon'
         })
         
         # Load encoded neighborhood/city values
-        self.encoded_neighb_city = pd.read_csv('encoded_neighb_city.csv')
+        self.encoded_neighb_city = load_table('encoded_neighb_city')
         
         # Define border keywords for categorization
         self.border_keywords = {
@@ -114,6 +169,20 @@ class FeaturePreprocessor:
         
         self.border_columns = ['NorthBorder', 'SouthBorder', 'East_order', 'WestBorder']
         
+        # Compile the border keywords into a single matcher
+        self._compile_border_matcher()
+        
+        # Define the numeric columns seen by the pre-trained scaler, in scaler order
+        self.scaled_columns = [
+            'Area', 'LengthFromNorth', 'LengthFromSouth', 'LengthFromEast',
+            'LengthFromWest', 'StreetWidth', 'Latitude', 'Longitude',
+            'distance_from_center_km', 'SARm2', 'Perimeter', 'Street_Frontage',
+            'Num_Street_Fronts', 'Encoded_Hood', 'Encoded_City',
+        ]
+        self.log_columns = ['Area', 'LengthFromNorth', 'LengthFromSouth', 'LengthFromEast',
+            'LengthFromWest', 'Perimeter', 'distance_from_center_km']
+        self.sqrt_columns = ['Encoded_Hood', 'StreetWidth']
+        
         # Define mapping from border type to length columns
         self.border_to_length_map = {
             'NorthBorder_Type': 'LengthFromNorth',
@@ -153,6 +222,477 @@ class FeaturePreprocessor:
             'WestBorder_Type_Street', 'AssetLevelId_A', 'AssetLevelId_B',
             'AssetLevelId_C', 'AssetLevelId_D'
         ]
+        # Training distributions of the numeric model inputs, see monitoring.reference_distributions
+        self.feature_reference = None
+        if bundle is not None:
+            self.training_columns = list(bundle.training_columns)
+            self.feature_reference = bundle.manifest.get('feature_reference')
+        elif schema is not None:
+            self._check_schema(schema)
+            self.training_columns = list(schema['training_columns'])
+            self.feature_reference = schema.get('feature_reference')
+        
+        # Build O(1) lookups over the city center and encoding tables
+        self._build_lookup_indexes()
+        
+        # Index the city centers spatially for plots whose city is not found
+        self._build_spatial_index()
+
+        # Precompute the layout used by the single-row fast path
+        self._compile_feature_layout()
+
+        # Precompute the features that only depend on the neighborhood/city pair
+        if bundle is not None and bundle.location_table is not None:
+            self._load_location_table(bundle.location_table)
+        else:
+            self._compile_location_table()
+    
+    def _fit_encoders(self, categories: Dict[str, List[str]]):
+        """
+        Fit one-hot encoders over the known categories of every categorical column.
+        
+        Args:
+            categories (Dict[str, List[str]]): Categories by column, e.g. DEFAULT_ENCODER_CATEGORIES
+        """
+        self.encoders = {}
+        for col, values in categories.items():
+            encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+            encoder.fit(pd.DataFrame({col: values}))
+            self.encoders[col] = encoder
+    
+    @classmethod
+    def schema_for(cls, encoder_categories: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Lay out the model columns for a set of encoder categories: the numeric inputs, then
+        one column per category in the order of DEFAULT_ENCODER_CATEGORIES.
+        
+        Args:
+            encoder_categories (Dict[str, List[str]]): Categories by one-hot encoded column
+            
+        Returns:
+            Dict[str, Any]: training_columns and encoder_categories, the schema argument of __init__
+        """
+        categories = {col: sorted(str(value) for value in encoder_categories[col])
+                      for col in cls.DEFAULT_ENCODER_CATEGORIES}
+        return {
+            'training_columns': cls.MODEL_NUMERIC_COLUMNS + [
+                f'{col}_{value}' for col, values in categories.items() for value in values
+            ],
+            'encoder_categories': categories,
+        }
+    
+    def feature_schema(self) -> Dict[str, Any]:
+        """
+        Describe the model input layout and numeric transforms of this preprocessor, as written
+        to FEATURE_SCHEMA_FILE.
+        
+        Returns:
+            Dict[str, Any]: training_columns, scaled/log/sqrt columns and encoder categories
+        """
+        return {
+            'training_columns': list(self.training_columns),
+            'scaled_columns': list(self.scaled_columns),
+            'log_columns': list(self.log_columns),
+            'sqrt_columns': list(self.sqrt_columns),
+            'encoder_categories': {col: [str(value) for value in encoder.categories_[0]]
+                                   for col, encoder in self.encoders.items()},
+        }
+    
+    def _check_schema(self, schema: Dict[str, Any]):
+        """
+        Refuse a schema written for numeric transforms other than the ones this code applies.
+        
+        Args:
+            schema (Dict[str, Any]): Schema passed to __init__ or read from FEATURE_SCHEMA_FILE
+            
+        Raises:
+            ValueError: If a transform differs or a training column cannot be produced
+        """
+        for key in ('scaled_columns', 'log_columns', 'sqrt_columns'):
+            if key in schema and list(schema[key]) != getattr(self, key):
+                raise ValueError(f"Feature schema {key} {schema[key]} differ from the preprocessing code's "
+                                 f"{getattr(self, key)}")
+        produced = set(self.MODEL_NUMERIC_COLUMNS) | {
+            f'{col}_{cat}' for col, encoder in self.encoders.items() for cat in encoder.categories_[0]
+        }
+        unknown = [col for col in schema['training_columns'] if col not in produced]
+        if unknown:
+            raise ValueError(f"Feature schema training columns {unknown} are not produced by the preprocessing code")
+    
+    def _build_lookup_indexes(self):
+        """
+        Index city centers and neighborhood/city encodings by exact and normalized keys.
+        The first row wins for duplicate keys, matching the original table scans.
+        """
+        self.city_center_index = {}
+        self.normalized_city_center_index = {}
+        for city, lat, lon in zip(self.city_centers['City_en'],
+                                  self.city_centers['City_Center_Lat'],
+                                  self.city_centers['City_Center_Lon']):
+            self.city_center_index.setdefault(city, (lat, lon))
+            self.normalized_city_center_index.setdefault(normalize_name(city), (lat, lon))
+        
+        self.pair_encoding_index = {}
+        self.city_encoding_index = {}
+        self.normalized_pair_encoding_index = {}
+        self.normalized_city_encoding_index = {}
+        for hood, city, encoded_hood, encoded_city in zip(self.encoded_neighb_city['PropAssetNeighborhoodName'],
+                                                          self.encoded_neighb_city['PropAssetCityName'],
+                                                          self.encoded_neighb_city['Encoded_Hood'],
+                                                          self.encoded_neighb_city['Encoded_City']):
+            self.pair_encoding_index.setdefault((hood, city), (encoded_hood, encoded_city))
+            self.city_encoding_index.setdefault(city, encoded_city)
+            normalized_key = (normalize_name(hood), normalize_name(city))
+            self.normalized_pair_encoding_index.setdefault(normalized_key, (encoded_hood, encoded_city))
+            self.normalized_city_encoding_index.setdefault(normalized_key[1], encoded_city)
+    
+    def _build_spatial_index(self):
+        """
+        Build a haversine BallTree over the city centers for nearest-center lookups.
+        """
+        self._center_coords = self.city_centers[['City_Center_Lat', 'City_Center_Lon']].to_numpy(dtype=np.float64)
+        self._center_tree = BallTree(np.radians(self._center_coords), metric='haversine')
+    
+    def nearest_city_centers(self, latitude, longitude) -> tuple:
+        """
+        Find the nearest city center of every plot in O(log N) per plot.
+        
+        Args:
+            latitude (array-like): Plot latitudes
+            longitude (array-like): Plot longitudes
+            
+        Returns:
+            tuple: (row of city_centers, distance in kilometers) as arrays; -1 and NaN
+                for plots without finite coordinates
+        """
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        rows = np.full(latitude.shape, -1, dtype=np.intp)
+        distances = np.full(latitude.shape, np.nan)
+        
+        finite = np.isfinite(latitude) & np.isfinite(longitude)
+        if not finite.any() or not len(self._center_coords):
+            return rows, distances
+        
+        latitude, longitude = latitude[finite], longitude[finite]
+        if len(latitude) * len(self._center_coords) <= NEAREST_BRUTE_FORCE_PAIRS:
+            # A few plots: scanning every center is cheaper than the tree query's fixed overhead
+            nearest = np.argmin(self.haversine(latitude[:, None], longitude[:, None],
+                                               self._center_coords[:, 0], self._center_coords[:, 1]), axis=1)
+        else:
+            nearest = self._center_tree.query(
+                np.radians(np.column_stack([latitude, longitude])), k=1, return_distance=False
+            )[:, 0]
+        rows[finite] = nearest
+        # Same kernel as the city center distance, so both kinds of distance agree
+        distances[finite] = self.haversine(latitude, longitude,
+                                           self._center_coords[nearest, 0], self._center_coords[nearest, 1])
+        return rows, distances
+    
+    def _center_distances(self, latitude: np.ndarray, longitude: np.ndarray,
+                          center_lat: np.ndarray, center_lon: np.ndarray) -> np.ndarray:
+        """
+        Distance from each plot to its city center, or to the nearest city center when
+        its city was not found.
+        
+        Args:
+            latitude (np.ndarray): Plot latitudes
+            longitude (np.ndarray): Plot longitudes
+            center_lat (np.ndarray): City center latitudes, NaN for unknown cities
+            center_lon (np.ndarray): City center longitudes, NaN for unknown cities
+            
+        Returns:
+            np.ndarray: Distances in kilometers
+        """
+        distances = self.haversine(latitude, longitude, center_lat, center_lon)
+        missing = np.isnan(center_lat)
+        if missing.any():
+            distances[missing] = self.nearest_city_centers(latitude[missing], longitude[missing])[1]
+        return distances
+    
+    def lookup_city_center(self, city: str) -> tuple:
+        """
+        Find the center coordinates of a city.
+        
+        Args:
+            city (str): City name
+            
+        Returns:
+            tuple: (latitude, longitude), or None if the city is unknown
+        """
+        center = self.city_center_index.get(city)
+        if center is None:
+            center = self.normalized_city_center_index.get(normalize_name(city))
+        return center
+    
+    def lookup_encodings(self, hood: str, city: str) -> tuple:
+        """
+        Find the target encodings of a neighborhood/city pair.
+        Falls back to the city encoding for both values when the neighborhood is unknown.
+        
+        Args:
+            hood (str): Neighborhood name
+            city (str): City name
+            
+        Returns:
+            tuple: (Encoded_Hood, Encoded_City), NaN for both if the city is unknown too
+        """
+        encoded = self.pair_encoding_index.get((hood, city))
+        if encoded is not None:
+            return encoded
+        
+        normalized_city = normalize_name(city)
+        encoded = self.normalized_pair_encoding_index.get((normalize_name(hood), normalized_city))
+        if encoded is not None:
+            return encoded
+        
+        city_encoding = self.city_encoding_index.get(city)
+        if city_encoding is None:
+            city_encoding = self.normalized_city_encoding_index.get(normalized_city, np.nan)
+        return city_encoding, city_encoding
+    
+    def _compile_feature_layout(self):
+        """
+        Precompute lookups, column offsets and scaler parameters so that
+        build_feature_vector can fill a row without going through pandas.
+        """
+        column_index = {col: i for i, col in enumerate(self.training_columns)}
+        self._column_index = column_index
+        
+        # Column offset of every one-hot category that survives reindexing to training_columns
+        self._one_hot_offsets = {}
+        for col, encoder in self.encoders.items():
+            self._one_hot_offsets[col] = {
+                cat: column_index[f"{col}_{cat}"]
+                for cat in encoder.categories_[0]
+                if f"{col}_{cat}" in column_index
+            }
+        self._encoder_categories = {col: set(encoder.categories_[0]) for col, encoder in self.encoders.items()}
+        
+        # Scaler parameters in scaler order, and where each scaled column lands in the row
+        n_scaled = len(self.scaled_columns)
+        self._scaler_mean = (np.asarray(self.scaler.mean_, dtype=np.float64)
+                             if self.scaler.with_mean else np.zeros(n_scaled))
+        self._scaler_scale = (np.asarray(self.scaler.scale_, dtype=np.float64)
+                              if self.scaler.with_std else np.ones(n_scaled))
+
+        # Plot columns are transformed per request; location columns come from the location table
+        self._plot_columns = [col for col in self.scaled_columns if col not in self.LOCATION_SCALED_COLUMNS]
+        self._plot_layout = self._scaling_layout(self._plot_columns)
+        self._plot_targets = np.array([column_index.get(col, -1) for col in self._plot_columns], dtype=np.intp)
+        self._plot_kept = np.flatnonzero(self._plot_targets >= 0)
+        self._plot_targets = self._plot_targets[self._plot_kept]
+        self._location_targets = np.array(
+            [column_index[col] for col in self.LOCATION_SCALED_COLUMNS], dtype=np.intp
+        )
+        
+        # Columns that vary when one plot is moved around a grid
+        self._grid_columns = [col for col in self.scaled_columns
+                              if col in ('Latitude', 'Longitude', 'distance_from_center_km')]
+        self._grid_layout = self._scaling_layout(self._grid_columns)
+        self._grid_targets = np.array([column_index[col] for col in self._grid_columns], dtype=np.intp)
+
+        self._row_template = np.zeros((1, len(self.training_columns)), dtype=np.float64)
+        
+        # Input field every training column is credited to in explanations: one-hot columns to
+        # their categorical field, target encodings to the names they were looked up by;
+        # engineered features keep their own name
+        credited = {'Encoded_Hood': 'PropAssetNeighborhoodName', 'Encoded_City': 'PropAssetCityName'}
+        for col, offsets in self._one_hot_offsets.items():
+            field = col[:-len('_Type')] if col.endswith('_Type') else col
+            credited.update({self.training_columns[offset]: field for offset in offsets.values()})
+        fields = [credited.get(col, col) for col in self.training_columns]
+        self.explanation_fields = list(dict.fromkeys(fields))
+        self._explanation_matrix = np.zeros((len(self.training_columns), len(self.explanation_fields)))
+        self._explanation_matrix[np.arange(len(fields)), [self.explanation_fields.index(f) for f in fields]] = 1.0
+
+    def _scaling_layout(self, columns: List[str]) -> tuple:
+        """
+        Return the positions to log and sqrt transform and the scaler mean and scale for a subset of scaled_columns.
+
+        Args:
+            columns (List[str]): Scaled columns, in the order values will be laid out
+
+        Returns:
+            tuple: (log positions, sqrt positions, mean, scale)
+        """
+        positions = [self.scaled_columns.index(col) for col in columns]
+        return (
+            [i for i, col in enumerate(columns) if col in self.log_columns],
+            [i for i, col in enumerate(columns) if col in self.sqrt_columns],
+            self._scaler_mean[positions],
+            self._scaler_scale[positions],
+        )
+
+    @staticmethod
+    def _transform_scaled(values: np.ndarray, layout: tuple) -> np.ndarray:
+        """
+        Apply the log/sqrt transforms, with NaN filled as 0, and standard scaling in place.
+        Same arithmetic as _preprocess_numeric_features, so results are bit-identical.
+
+        Args:
+            values (np.ndarray): Values laid out by the columns the layout was built for, one row per record
+            layout (tuple): Layout from _scaling_layout
+
+        Returns:
+            np.ndarray: values
+        """
+        log_positions, sqrt_positions, mean, scale = layout
+        values[np.isnan(values)] = 0
+        values[..., log_positions] = np.log1p(values[..., log_positions])
+        values[..., sqrt_positions] = np.sqrt(values[..., sqrt_positions])
+        values[np.isnan(values)] = 0
+        values -= mean
+        values /= scale
+        return values
+
+    def _compile_location_table(self):
+        """
+        Precompute the raw and scaled encodings and the city center of every known
+        neighborhood/city pair, of every city on its own (the neighborhood fallback)
+        and of an unknown location, so a request needs a single lookup for all of them.
+        """
+        keys = []
+        rows = []
+
+        def add(kind, key, encoded, center):
+            keys.append([kind, *key] if isinstance(key, tuple) else [kind, key])
+            rows.append([encoded[0], encoded[1], *(center or (np.nan, np.nan))])
+
+        # Rows resolve exactly like lookup_encodings and lookup_city_center would for the key
+        for hood, city in self.pair_encoding_index:
+            add('pair', (hood, city), self.lookup_encodings(hood, city), self.lookup_city_center(city))
+        for hood, city in self.normalized_pair_encoding_index:
+            add('normalized_pair', (hood, city), self.normalized_pair_encoding_index[(hood, city)],
+                self.normalized_city_center_index.get(city))
+        for city in dict.fromkeys(list(self.city_encoding_index) + list(self.city_center_index)):
+            encoded = self.city_encoding_index.get(city)
+            if encoded is None:
+                encoded = self.normalized_city_encoding_index.get(normalize_name(city), np.nan)
+            add('city', city, (encoded, encoded), self.lookup_city_center(city))
+        for city in dict.fromkeys(list(self.normalized_city_encoding_index) + list(self.normalized_city_center_index)):
+            encoded = self.normalized_city_encoding_index.get(city, np.nan)
+            add('normalized_city', city, (encoded, encoded), self.normalized_city_center_index.get(city))
+        add('unknown', '', (np.nan, np.nan), None)
+
+        raw = np.array(rows, dtype=np.float64)
+        scaled = self._transform_scaled(raw[:, :2].copy(), self._scaling_layout(self.LOCATION_SCALED_COLUMNS))
+        self._load_location_table({'keys': keys, 'values': np.column_stack([raw[:, :2], scaled, raw[:, 2:]])})
+
+    def _load_location_table(self, table: Dict[str, Any]):
+        """
+        Index a location table built by _compile_location_table.
+
+        Args:
+            table (Dict[str, Any]): 'keys', a [kind, *names] list per row, and 'values', an
+                array with one row per key laid out by LOCATION_COLUMNS
+        """
+        self.location_table = table
+        self.location_values = np.asarray(table['values'], dtype=np.float64)
+        indexes = {'pair': {}, 'normalized_pair': {}, 'city': {}, 'normalized_city': {}, 'unknown': {}}
+        for row, (kind, *names) in enumerate(table['keys']):
+            indexes[kind][tuple(names) if len(names) > 1 else names[0]] = row
+        self._pair_locations = indexes['pair']
+        self._normalized_pair_locations = indexes['normalized_pair']
+        self._city_locations = indexes['city']
+        self._normalized_city_locations = indexes['normalized_city']
+        self._unknown_location = indexes['unknown']['']
+        
+        kinds = np.array([key[0] for key in table['keys']])
+        fallbacks = np.column_stack([
+            np.isin(kinds, ['normalized_pair', 'normalized_city']),
+            np.isin(kinds, ['city', 'normalized_city']),
+            kinds == 'unknown',
+            np.isnan(self.location_values[:, 0]) | np.isnan(self.location_values[:, 1]),
+            np.isnan(self.location_values[:, 4]),
+        ])
+        self._location_fallbacks = fallbacks.astype(np.int64)
+        self._location_fallback_names = [
+            [name for name, hit in zip(self.LOCATION_FALLBACKS, row) if hit] for row in fallbacks
+        ]
+
+    def lookup_location(self, hood: str, city: str) -> int:
+        """
+        Find the location table row of a neighborhood/city pair, with the same exact, normalized
+        and city fallbacks as lookup_encodings and lookup_city_center.
+
+        Args:
+            hood (str): Neighborhood name
+            city (str): City name
+
+        Returns:
+            int: Row of location_values
+        """
+        row = self._pair_locations.get((hood, city))
+        if row is not None:
+            return row
+
+        normalized_city = normalize_name(city)
+        row = self._normalized_pair_locations.get((normalize_name(hood), normalized_city))
+        if row is None:
+            row = self._city_locations.get(city)
+        if row is None:
+            row = self._normalized_city_locations.get(normalized_city, self._unknown_location)
+        return row
+    
+    def _record_location_fallbacks(self, rows: List[int]):
+        """Count the fallbacks behind looked up location table rows in FEATURE_FALLBACKS."""
+        counts = self._location_fallbacks[rows].sum(axis=0)
+        for name, count in zip(self.LOCATION_FALLBACKS, counts):
+            if count:
+                FEATURE_FALLBACKS.inc(name, int(count))
+    
+    def _record_category_misses(self, misses: Dict[tuple, int]):
+        """
+        Count categorical values without a model column in FEATURE_FALLBACKS: values the encoder
+        never saw ('unseen_category.<column>', e.g. 'Al Baha' for 'Bahah'), and values it knows
+        that have no training column ('untrained_category.<column>', e.g. 'Jazan' where the model
+        was trained on 'Jizan'). Either way all the column's one-hot features stay 0.
+        
+        Args:
+            misses (Dict[tuple, int]): Number of rows per (column, value)
+        """
+        for (col, value), count in misses.items():
+            kind = 'untrained_category' if value in self._encoder_categories[col] else 'unseen_category'
+            FEATURE_FALLBACKS.inc(f'{kind}.{col}', count)
+    
+    def aggregate_contributions(self, contributions: np.ndarray) -> np.ndarray:
+        """
+        Sum per-column contributions into explanation_fields, e.g. all AssetLevelId_* columns into AssetLevelId.
+        
+        Args:
+            contributions (np.ndarray): Array of shape (n_rows, len(training_columns))
+            
+        Returns:
+            np.ndarray: Array of shape (n_rows, len(explanation_fields))
+        """
+        return contributions @ self._explanation_matrix
+    
+    def _compile_border_matcher(self):
+        """
+        Compile border_keywords into one regex per border type, kept in
+        priority order so the earliest matching type still wins.
+        """
+        self._border_patterns = [
+            (type_name, re.compile('|'.join(re.escape(keyword) for keyword in keywords)))
+            for type_name, keywords in self.border_keywords.items()
+        ]
+        self._classify_border = lru_cache(maxsize=4096)(self._match_border_type)
+    
+    def _match_border_type(self, border_description_lower: str) -> str:
+        """
+        Return the first border type with a keyword in the text.
+        
+        Args:
+            border_description_lower (str): Lowercased border description
+            
+        Returns:
+            str: Category of the border
+        """
+        for type_name, pattern in self._border_patterns:
+            if pattern.search(border_description_lower):
+                return type_name
+        return 'Other'
     
     def get_border_type(self, border_description: str) -> str:
         """
@@ -168,25 +708,69 @@ class FeaturePreprocessor:
         if pd.isna(border_description):
             return 'Other'
         
-        border_description_lower = str(border_description).lower()
-        for type_name, keywords in self.border_keywords.items():
-            if any(keyword in border_description_lower for keyword in keywords):
-                return type_name
-        return 'Other'  # Default if no keywords match
+        return self._classify_border(str(border_description).lower())
     
-    def haversine(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    def synthetic_inputs(self, size: int = 64, seed: int = 0) -> List[Dict[str, Any]]:
+        """
+        Generate plausible input records from the reference tables, e.g. to warm up a model.
+        
+        Args:
+            size (int, optional): Number of records. Defaults to 64.
+            seed (int, optional): Random seed. Defaults to 0.
+            
+        Returns:
+            List[Dict[str, Any]]: Records shaped like PredictionInput
+        """
+        rng = np.random.default_rng(seed)
+        pairs = self.encoded_neighb_city[['PropAssetNeighborhoodName', 'PropAssetCityName']].to_numpy()
+        centers = {city: (lat, lon, region) for city, lat, lon, region in zip(
+            self.city_centers['City_en'], self.city_centers['City_Center_Lat'],
+            self.city_centers['City_Center_Lon'], self.city_centers.get('Region', self.city_centers['City_en']))}
+        borders = [keywords[0] for keywords in self.border_keywords.values()] + ['-']
+        asset_types = list(self.encoders['EvaluationAssetTypeName'].categories_[0])
+        asset_levels = list(self.encoders['AssetLevelId'].categories_[0])
+        
+        records = []
+        for _ in range(size):
+            hood, city = pairs[rng.integers(len(pairs))]
+            lat, lon, region = centers.get(city, (24.7136, 46.6753, 'Riyadh'))
+            lengths = rng.uniform(10, 60, size=4).round(2)
+            records.append({
+                'PropAssetNeighborhoodName': str(hood),
+                'PropAssetCityName': str(city),
+                'PropAssetRegionName': str(region),
+                'Area': round(float(lengths[0] * lengths[2]), 2),
+                'LengthFromNorth': float(lengths[0]),
+                'LengthFromSouth': float(lengths[1]),
+                'LengthFromEast': float(lengths[2]),
+                'LengthFromWest': float(lengths[3]),
+                'NorthBorder': str(rng.choice(borders)),
+                'SouthBorder': str(rng.choice(borders)),
+                'East_order': str(rng.choice(borders)),
+                'WestBorder': str(rng.choice(borders)),
+                'StreetWidth': float(rng.choice([10.0, 15.0, 20.0, 30.0])),
+                'Latitude': round(float(lat + rng.normal(scale=0.05)), 6),
+                'Longitude': round(float(lon + rng.normal(scale=0.05)), 6),
+                'EvaluationAssetTypeName': str(rng.choice(asset_types)),
+                'AssetLevelId': str(rng.choice(asset_levels)),
+            })
+        return records
+    
+    @staticmethod
+    def haversine(lat1, lon1, lat2, lon2):
         """
         Calculate the great circle distance in kilometers between two points
-        on the earth (specified in decimal degrees)
+        on the earth (specified in decimal degrees). Vectorized: pass arrays
+        of plots and centers to compute a whole batch in one call.
         
         Args:
-            lat1 (float): Latitude of first point
-            lon1 (float): Longitude of first point
-            lat2 (float): Latitude of second point
-            lon2 (float): Longitude of second point
+            lat1 (float or np.ndarray): Latitude of first point
+            lon1 (float or np.ndarray): Longitude of first point
+            lat2 (float or np.ndarray): Latitude of second point
+            lon2 (float or np.ndarray): Longitude of second point
             
         Returns:
-            float: Distance in kilometers
+            float or np.ndarray: Distance in kilometers, broadcast over the inputs
         """
         # Convert decimal degrees to radians
         lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
@@ -199,46 +783,329 @@ class FeaturePreprocessor:
         r = 6371  # Radius of earth in kilometers
         return c * r
     
-    def preprocess_features(self, features: Dict[str, Any]) -> np.ndarray:
+    def preprocess_features(self, features: Dict[str, Any], trace: Optional[Dict[str, Any]] = None) -> np.ndarray:
         """
         Preprocess the input features.
         
         Args:
             features (Dict[str, Any]): Dictionary containing feature values
+            trace (Dict[str, Any], optional): If given, the output of every stage is recorded in it
             
         Returns:
             np.ndarray: Preprocessed features ready for model prediction
         """
-        print("\n=== Starting Preprocessing ===")
-        print("Input features:", features)
+        logger.debug("Starting preprocessing for input: %s", features)
         
         # Convert input dictionary to DataFrame
         df = pd.DataFrame([features])
-        print("\n=== After DataFrame Conversion ===")
-        print(df)
+        self._trace_stage(trace, 'input', df)
         
         # Apply feature engineering
-        df = self._apply_feature_engineering(df)
-        print("\n=== After Feature Engineering ===")
-        print(df)
+        with STAGE_LATENCY.time('feature_engineering'):
+            df = self._apply_feature_engineering(df)
+        self._trace_stage(trace, 'feature_engineering', df)
         
         # Preprocess categorical features
-        df = self._preprocess_categorical_features(df)
-        print("\n=== After Categorical Preprocessing ===")
-        print(df)
+        with STAGE_LATENCY.time('categorical'):
+            df = self._preprocess_categorical_features(df)
+        self._trace_stage(trace, 'categorical', df)
         
         # Preprocess numeric features
-        df = self._preprocess_numeric_features(df)
-        print("\n=== After Numeric Preprocessing ===")
-        print(df)
+        with STAGE_LATENCY.time('numeric'):
+            df = self._preprocess_numeric_features(df)
+        self._trace_stage(trace, 'numeric', df)
         
         # Combine all features
-        processed_features = self._combine_features(df)
-        print("\n=== Final Processed Features ===")
-        print(processed_features)
+        with STAGE_LATENCY.time('combine'):
+            processed_features = self._combine_features(df)
+        self._trace_stage(trace, 'combined', processed_features)
         
         return processed_features
     
+    def _trace_stage(self, trace: Optional[Dict[str, Any]], stage: str, df: pd.DataFrame):
+        """
+        Record a stage's intermediate features in the request trace and the debug log.
+        Nothing is formatted unless a trace was requested or DEBUG logging is on.
+        
+        Args:
+            trace (Dict[str, Any], optional): Request trace to record into
+            stage (str): Stage name
+            df (pd.DataFrame): Stage output
+        """
+        if trace is not None:
+            trace[stage] = json.loads(df.to_json(orient='records'))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("After %s:\n%s", stage, df.to_string())
+    
+    def build_feature_vector(self, features: Dict[str, Any]) -> np.ndarray:
+        """
+        Build the model input row for a single record without pandas.
+        Produces the same values as preprocess_features, laid out by training_columns.
+        
+        Args:
+            features (Dict[str, Any]): Dictionary containing feature values
+            
+        Returns:
+            np.ndarray: Array of shape (1, len(training_columns))
+        """
+        with STAGE_LATENCY.time('fast_path'):
+            return self._build_feature_vector(features)
+    
+    def _build_feature_vector(self, features: Dict[str, Any]) -> np.ndarray:
+        row = self._row_template.copy()
+        latitude = float(features['Latitude'])
+        longitude = float(features['Longitude'])
+        
+        # Scaled encodings and city center, precomputed per neighborhood/city pair
+        location_row = self.lookup_location(features['PropAssetNeighborhoodName'], features['PropAssetCityName'])
+        for name in self._location_fallback_names[location_row]:
+            FEATURE_FALLBACKS.inc(name)
+        location = self.location_values[location_row]
+        row[0, self._location_targets] = location[2:4]
+        
+        # Distance from city center, or from the nearest one if the city is unknown
+        distance = self._center_distances(np.array([latitude]), np.array([longitude]),
+                                          location[4:5], location[5:6])[0]
+        
+        # Border types, perimeter and street frontage
+        lengths = {col: float(features[col]) for col in self.border_to_length_map.values()}
+        perimeter = (lengths['LengthFromNorth'] + lengths['LengthFromSouth'] +
+                     lengths['LengthFromEast'] + lengths['LengthFromWest'])
+        street_frontage = 0.0
+        num_street_fronts = 0
+        categories = {}
+        for col in self.border_columns:
+            border_type = self.get_border_type(features[col])
+            categories[f'{col}_Type'] = border_type
+            if border_type == 'Street':
+                street_frontage += lengths[self.border_to_length_map[f'{col}_Type']]
+                num_street_fronts += 1
+        
+        values = {
+            'Area': float(features['Area']),
+            'StreetWidth': float(features['StreetWidth']),
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'distance_from_center_km': distance,
+            'SARm2': 0.0,
+            'Perimeter': perimeter,
+            'Street_Frontage': street_frontage,
+            'Num_Street_Fronts': num_street_fronts,
+        }
+        values.update(lengths)
+        numeric = np.array([values[col] for col in self._plot_columns], dtype=np.float64)
+        
+        # Log/sqrt transforms with NaN filled as 0, then standard scaling
+        self._transform_scaled(numeric, self._plot_layout)
+        row[0, self._plot_targets] = numeric[self._plot_kept]
+        
+        # One-hot categories
+        for col in ('PropAssetRegionName', 'EvaluationAssetTypeName', 'AssetLevelId'):
+            categories[col] = features[col]
+        for col, value in categories.items():
+            offset = self._one_hot_offsets[col].get(value)
+            if offset is not None:
+                row[0, offset] = 1.0
+            else:
+                self._record_category_misses({(col, value): 1})
+        
+        return row
+    
+    def build_feature_matrix(self, features_list: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Build the model input rows for a batch of records without pandas, in vectorized passes
+        over the location table. Produces the same values as build_feature_vector for every row.
+
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+
+        Returns:
+            np.ndarray: Array of shape (len(features_list), len(training_columns))
+        """
+        with STAGE_LATENCY.time('fast_path'):
+            return self._build_feature_matrix(features_list)
+
+    def _build_feature_matrix(self, features_list: List[Dict[str, Any]]) -> np.ndarray:
+        matrix = np.zeros((len(features_list), len(self.training_columns)), dtype=np.float64)
+        if not features_list:
+            return matrix
+
+        location_rows = [
+            self.lookup_location(features['PropAssetNeighborhoodName'], features['PropAssetCityName'])
+            for features in features_list
+        ]
+        self._record_location_fallbacks(location_rows)
+        locations = self.location_values[location_rows]
+        matrix[:, self._location_targets] = locations[:, 2:4]
+
+        length_columns = list(self.border_to_length_map.values())
+        lengths = np.array([[float(features[col]) for col in length_columns] for features in features_list])
+        border_types = [[self.get_border_type(features[col]) for col in self.border_columns]
+                        for features in features_list]
+        is_street = np.array([[border_type == 'Street' for border_type in types] for types in border_types])
+
+        # Same summation order as the single-row builder
+        perimeter = lengths[:, 0] + lengths[:, 1] + lengths[:, 2] + lengths[:, 3]
+        street_frontage = np.zeros(len(features_list))
+        for i in range(len(length_columns)):
+            street_frontage += np.where(is_street[:, i], lengths[:, i], 0.0)
+
+        latitude = np.array([float(features['Latitude']) for features in features_list])
+        longitude = np.array([float(features['Longitude']) for features in features_list])
+        values = {
+            'Area': np.array([float(features['Area']) for features in features_list]),
+            'StreetWidth': np.array([float(features['StreetWidth']) for features in features_list]),
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'distance_from_center_km': self._center_distances(latitude, longitude, locations[:, 4], locations[:, 5]),
+            'SARm2': np.zeros(len(features_list)),
+            'Perimeter': perimeter,
+            'Street_Frontage': street_frontage,
+            'Num_Street_Fronts': is_street.sum(axis=1).astype(np.float64),
+        }
+        values.update({col: lengths[:, i] for i, col in enumerate(length_columns)})
+        numeric = np.column_stack([values[col] for col in self._plot_columns])
+
+        self._transform_scaled(numeric, self._plot_layout)
+        matrix[:, self._plot_targets] = numeric[:, self._plot_kept]
+
+        # One-hot categories
+        offsets = self._one_hot_offsets
+        misses = {}
+        for i, (features, types) in enumerate(zip(features_list, border_types)):
+            for col, border_type in zip(self.border_columns, types):
+                offset = offsets[f'{col}_Type'].get(border_type)
+                if offset is not None:
+                    matrix[i, offset] = 1.0
+                else:
+                    misses[(f'{col}_Type', border_type)] = misses.get((f'{col}_Type', border_type), 0) + 1
+            for col in ('PropAssetRegionName', 'EvaluationAssetTypeName', 'AssetLevelId'):
+                offset = offsets[col].get(features[col])
+                if offset is not None:
+                    matrix[i, offset] = 1.0
+                else:
+                    misses[(col, features[col])] = misses.get((col, features[col]), 0) + 1
+        self._record_category_misses(misses)
+
+        return matrix
+
+    def build_grid_matrix(self, template: Dict[str, Any], latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+        """
+        Build the model input rows for one plot placed at many coordinates. The template's row,
+        including its location table slice, is built once; only the coordinates and the
+        distance from the city center are computed per point.
+        
+        Args:
+            template (Dict[str, Any]): Plot features; Latitude and Longitude are ignored
+            latitude (np.ndarray): Latitude of every point
+            longitude (np.ndarray): Longitude of every point
+            
+        Returns:
+            np.ndarray: Array of shape (len(latitude), len(training_columns)), the same rows as
+                build_feature_matrix over copies of the template at each point
+        """
+        with STAGE_LATENCY.time('fast_path'):
+            latitude = np.asarray(latitude, dtype=np.float64)
+            longitude = np.asarray(longitude, dtype=np.float64)
+            matrix = np.repeat(self._build_feature_vector(template), len(latitude), axis=0)
+            
+            location = self.location_values[
+                self.lookup_location(template['PropAssetNeighborhoodName'], template['PropAssetCityName'])
+            ]
+            values = {
+                'Latitude': latitude,
+                'Longitude': longitude,
+                'distance_from_center_km': self._center_distances(
+                    latitude, longitude, np.full(len(latitude), location[4]), np.full(len(latitude), location[5])
+                ),
+            }
+            numeric = np.column_stack([values[col] for col in self._grid_columns])
+            self._transform_scaled(numeric, self._grid_layout)
+            matrix[:, self._grid_targets] = numeric
+            return matrix
+    
+    def build_sensitivity_matrix(self, base: Dict[str, Any], field: str, values: List[Any],
+                                 base_row: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Build the model input rows for variants of one plot that differ in a single field.
+        The base row is repeated and only the columns the field affects are patched.
+        
+        Args:
+            base (Dict[str, Any]): Plot features
+            field (str): One of SENSITIVITY_FIELDS
+            values (List[Any]): Numbers for StreetWidth and Area, border types (as in
+                border_keywords, or 'Other') for the borders, levels for AssetLevelId
+            base_row (np.ndarray, optional): build_feature_vector(base), for callers sweeping
+                several fields of the same plot. Built here when omitted.
+            
+        Returns:
+            np.ndarray: Array of shape (len(values), len(training_columns)), the same rows as
+                build_feature_matrix over copies of the base with the field changed
+        """
+        with STAGE_LATENCY.time('fast_path'):
+            if base_row is None:
+                base_row = self._build_feature_vector(base)
+            matrix = np.repeat(base_row, len(values), axis=0)
+            if field in ('StreetWidth', 'Area'):
+                self._patch_scaled(matrix, {field: np.array(values, dtype=np.float64)})
+            elif field in self.border_columns:
+                # The border's street status changes the street frontage features
+                types = {col: self.get_border_type(base[col]) for col in self.border_columns}
+                street_frontage = np.zeros(len(values))
+                num_street_fronts = np.zeros(len(values))
+                for i, border_type in enumerate(values):
+                    types[field] = border_type
+                    for col in self.border_columns:
+                        if types[col] == 'Street':
+                            street_frontage[i] += float(base[self.border_to_length_map[f'{col}_Type']])
+                            num_street_fronts[i] += 1
+                self._patch_scaled(matrix, {'Street_Frontage': street_frontage, 'Num_Street_Fronts': num_street_fronts})
+                self._patch_one_hot(matrix, f'{field}_Type', values)
+            elif field == 'AssetLevelId':
+                self._patch_one_hot(matrix, field, values)
+            else:
+                raise ValueError(f"Cannot vary {field}; expected one of {', '.join(self.SENSITIVITY_FIELDS)}")
+            return matrix
+    
+    def _patch_scaled(self, matrix: np.ndarray, columns: Dict[str, np.ndarray]):
+        """Transform and scale raw values of some scaled columns into their matrix columns."""
+        names = [col for col in self.scaled_columns if col in columns]
+        numeric = np.column_stack([columns[col] for col in names])
+        self._transform_scaled(numeric, self._scaling_layout(names))
+        matrix[:, [self._column_index[col] for col in names]] = numeric
+    
+    def _patch_one_hot(self, matrix: np.ndarray, col: str, values: List[Any]):
+        """Replace the one-hot columns of a categorical column, one value per matrix row."""
+        offsets = self._one_hot_offsets[col]
+        matrix[:, list(offsets.values())] = 0.0
+        for i, value in enumerate(values):
+            offset = offsets.get(value)
+            if offset is not None:
+                matrix[i, offset] = 1.0
+    
+    def preprocess_batch(self, features_list: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        Preprocess a batch of input records in a single vectorized pass.
+        
+        Args:
+            features_list (List[Dict[str, Any]]): List of dictionaries containing feature values
+            
+        Returns:
+            pd.DataFrame: Preprocessed features, one row per input record in input order
+        """
+        # Convert all records to a single DataFrame
+        df = pd.DataFrame(features_list)
+        
+        # Run every stage once over the whole batch
+        with STAGE_LATENCY.time('feature_engineering'):
+            df = self._apply_feature_engineering(df)
+        with STAGE_LATENCY.time('categorical'):
+            df = self._preprocess_categorical_features(df)
+        with STAGE_LATENCY.time('numeric'):
+            df = self._preprocess_numeric_features(df)
+        with STAGE_LATENCY.time('combine'):
+            return self._combine_features(df)
+    
     def _apply_feature_engineering(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Apply feature engineering steps.
@@ -249,33 +1116,26 @@ class FeaturePreprocessor:
         Returns:
             pd.DataFrame: DataFrame with engineered features
         """
-        print("\n=== Starting Feature Engineering ===")
-        
-        # Get city center coordinates for the input city
-        city_center = self.city_centers[
-            self.city_centers['City_en'] == df['PropAssetCityName'].iloc[0]
+        # Look up the encodings and city center of every row in the location table
+        location_rows = [
+            self.lookup_location(hood, city)
+            for hood, city in zip(df['PropAssetNeighborhoodName'], df['PropAssetCityName'])
         ]
-        print("City center data:", city_center)
-        
-        if not city_center.empty:
-            # Calculate distance from city center
-            df['distance_from_center_km'] = self.haversine(
-                df['Latitude'].iloc[0],
-                df['Longitude'].iloc[0],
-                city_center['City_Center_Lat'].iloc[0],
-                city_center['City_Center_Lon'].iloc[0]
-            )
-            print("Distance from center calculated:", df['distance_from_center_km'].iloc[0])
-        else:
-            # If city not found, set distance to None
-            df['distance_from_center_km'] = None
-            print("City not found in city_centers, distance set to None")
+        self._record_location_fallbacks(location_rows)
+        locations = self.location_values[location_rows]
+        
+        # Calculate distance from city center, falling back to the nearest center for unknown cities
+        df['distance_from_center_km'] = self._center_distances(
+            df['Latitude'].to_numpy(dtype=float),
+            df['Longitude'].to_numpy(dtype=float),
+            locations[:, 4],
+            locations[:, 5]
+        )
         
         # Add border type features
         for col in self.border_columns:
             if col in df.columns:
                 df[f'{col}_Type'] = df[col].apply(self.get_border_type)
-                print(f"Border type for {col}:", df[f'{col}_Type'].iloc[0])
         
         # Calculate perimeter
         df['Perimeter'] = (
@@ -284,7 +1144,6 @@ class FeaturePreprocessor:
             df['LengthFromEast'] + 
             df['LengthFromWest']
         )
-        print("Perimeter calculated:", df['Perimeter'].iloc[0])
         
         # Initialize street frontage features
         df['Street_Frontage'] = 0.0
@@ -305,38 +1164,10 @@ class FeaturePreprocessor:
                     1,
                     0
                 )
-        print("Street frontage calculated:", df['Street_Frontage'].iloc[0])
-        print("Number of street fronts:", df['Num_Street_Fronts'].iloc[0])
-        
-        # Add Encoded_Hood and Encoded_City features
-        hood = df['PropAssetNeighborhoodName'].iloc[0]
-        city = df['PropAssetCityName'].iloc[0]
-        
-        # First try to find exact match for both neighborhood and city
-        match = self.encoded_neighb_city[
-            (self.encoded_neighb_city['PropAssetNeighborhoodName'] == hood) &
-            (self.encoded_neighb_city['PropAssetCityName'] == city)
-        ]
         
-        if not match.empty:
-            # Found exact match for both neighborhood and city
-            df['Encoded_Hood'] = match['Encoded_Hood'].iloc[0]
-            df['Encoded_City'] = match['Encoded_City'].iloc[0]
-        else:
-            # If no exact match, try to find city match and use its encoding
-            city_match = self.encoded_neighb_city[
-                self.encoded_neighb_city['PropAssetCityName'] == city
-            ]
-            if not city_match.empty:
-                # Use the city's encoding for both hood and city
-                df['Encoded_Hood'] = city_match['Encoded_City'].iloc[0]
-                df['Encoded_City'] = city_match['Encoded_City'].iloc[0]
-                print(f"Using city encoding as fallback for neighborhood: {hood} in city: {city}")
-            else:
-                # If no city match either, set both to NaN
-                df['Encoded_Hood'] = np.nan
-                df['Encoded_City'] = np.nan
-                print(f"No encoding found for neighborhood: {hood} or city: {city}")
+        # Add Encoded_Hood and Encoded_City features, falling back to the city encoding
+        df['Encoded_Hood'] = locations[:, 0]
+        df['Encoded_City'] = locations[:, 1]
         
         return df
     
@@ -350,17 +1181,21 @@ class FeaturePreprocessor:
         Returns:
             pd.DataFrame: DataFrame with preprocessed categorical features
         """
-        print("\n=== Starting Categorical Preprocessing ===")
-        
         # Process original categorical columns
         for col in self.categorical_columns:
             if col in df.columns:
-                print(f"\nProcessing categorical column: {col}")
                 if col not in self.encoders:
-                    print(f"Creating new encoder for {col}")
+                    logger.info("Creating new encoder for %s", col)
                     self.encoders[col] = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
                     self.encoders[col].fit(df[[col]])
                 
+                # Values without a training column are encoded as all zeros
+                if col in self._one_hot_offsets:
+                    missing = df[col][~df[col].isin(list(self._one_hot_offsets[col]))]
+                    self._record_category_misses(
+                        {(col, value): int(count) for value, count in missing.value_counts().items()}
+                    )
+                
                 # Transform the feature
                 encoded = self.encoders[col].transform(df[[col]])
                 encoded_df = pd.DataFrame(
@@ -368,7 +1203,6 @@ class FeaturePreprocessor:
                     columns=[f"{col}_{cat}" for cat in self.encoders[col].categories_[0]],
                     index=df.index
                 )
-                print(f"Encoded columns for {col}:", encoded_df.columns.tolist())
                 
                 # Drop original column and add encoded columns
                 df = df.drop(col, axis=1)
@@ -387,41 +1221,26 @@ class FeaturePreprocessor:
         Returns:
             pd.DataFrame: DataFrame with preprocessed numeric features
         """
-        print("\n=== Starting Numeric Preprocessing ===")
-        
-        # Apply log transformation to specified numeric columns
-        numeric_columns = [
-            'Area', 'LengthFromNorth', 'LengthFromSouth', 'LengthFromEast',
-            'LengthFromWest', 'StreetWidth', 'Latitude', 'Longitude',
-            'distance_from_center_km', 'SARm2', 'Perimeter', 'Street_Frontage',
-            'Num_Street_Fronts', 'Encoded_Hood', 'Encoded_City',
-        ]
-        columns_to_log = ['Area', 'LengthFromNorth', 'LengthFromSouth', 'LengthFromEast',
-            'LengthFromWest', 'Perimeter', 'distance_from_center_km']
-        
-        columns_to_sqrt = ['Encoded_Hood', 'StreetWidth']
+        # Columns seen by the pre-trained scaler and their transforms
+        numeric_columns = self.scaled_columns
+        columns_to_log = self.log_columns
+        columns_to_sqrt = self.sqrt_columns
 
         # Apply log transformation
         for col in columns_to_log:
             if col in df.columns:
-                print(f"\nProcessing numeric column with log transform: {col}")
-                print(f"Original value: {df[col].iloc[0]}")
                 # Fill None/NaN values with 0 before log transformation
                 df[col] = df[col].fillna(0)
                 # Apply log1p transformation
                 df[col] = np.log1p(df[col])
-                print(f"Transformed value: {df[col].iloc[0]}")
         
         # Apply sqrt transformation
         for col in columns_to_sqrt:
             if col in df.columns:
-                print(f"\nProcessing numeric column with sqrt transform: {col}")
-                print(f"Original value: {df[col].iloc[0]}")
                 # Fill None/NaN values with 0 before sqrt transformation
                 df[col] = df[col].fillna(0)
                 # Apply sqrt transformation
                 df[col] = np.sqrt(df[col])
-                print(f"Transformed value: {df[col].iloc[0]}")
         
         # Ensure all required columns exist
         for col in numeric_columns:
@@ -429,18 +1248,10 @@ class FeaturePreprocessor:
                 df[col] = 0
         
         # Apply standard scaling to all numeric columns using pre-trained scaler
-        print(f"\nScaling numeric column")
         numeric_data = df[numeric_columns].fillna(0)
         scaled_data = self.scaler.transform(numeric_data)
         df[numeric_columns] = scaled_data
         
-        # Set pandas display options to show all columns and rows
-        pd.set_option('display.max_columns', None)
-        pd.set_option('display.width', None)
-        pd.set_option('display.max_rows', None)
-        print("\nScaled data:")
-        print(df[numeric_columns].to_string())
-        
         return df
     
     def _combine_features(self, df: pd.DataFrame) -> np.ndarray:
@@ -453,14 +1264,8 @@ class FeaturePreprocessor:
         Returns:
             np.ndarray: Combined features ready for model prediction
         """
-        print("\n=== Starting Feature Combination ===")
-        print("Current columns:", df.columns.tolist())
-        
         # Reindex the DataFrame to match training columns
         df = df.reindex(columns=self.training_columns, fill_value=0)
         
-        print("Final columns after reindexing:", df.columns.tolist())
-        print("Final feature shape:", df.shape)
-        
         # Return DataFrame instead of numpy array to preserve feature names
         return df 
\ No newline at end of file
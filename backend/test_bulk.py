@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+import numpy as np
+import pytest
+from bulk import chunk_results, format_results, run_bulk
+from preprocessing import FeaturePreprocessor
+
+pytestmark = pytest.mark.usefixtures("artifact_dir")
+
+
+def score_by_area(records):
+    """Stands in for ModelLoader.predict_batch, scoring each record as its Area."""
+    return np.array([record["Area"] for record in records]), [None] * len(records)
+
+
+def test_ndjson_rows_keep_their_position_and_errors():
+    """Valid, invalid and unparseable lines each get one result, in input order, across chunks."""
+    records = FeaturePreprocessor().synthetic_inputs(5)
+    for i, record in enumerate(records):
+        record["plot_id"] = f"P{i}"
+    lines = [json.dumps(record) for record in records]
+    lines[1] = "{not json"
+    lines[3] = json.dumps({**records[3], "Area": "large"})
+    source = io.BytesIO(("\n".join(lines) + "\n").encode())
+
+    output = "".join(run_bulk(source, score_by_area, "ndjson", chunk_size=2, id_column="plot_id"))
+    results = [json.loads(line) for line in output.splitlines()]
+
+    assert [result["row"] for result in results] == [0, 1, 2, 3, 4]
+    assert [result["id"] for result in results] == ["P0", None, "P2", "P3", "P4"]
+    assert results[1]["error"][0]["type"] == "json_invalid"
+    assert results[3]["error"][0]["loc"] == ["Area"]
+    assert [result["prediction"] for result in results] == [
+        records[0]["Area"], None, records[2]["Area"], None, records[4]["Area"]]
+
+
+def test_csv_round_trip_writes_one_header():
+    """CSV input is coerced per row and CSV output has a single header across chunks."""
+    records = FeaturePreprocessor().synthetic_inputs(5)
+    header = list(records[0])
+    text = ",".join(header) + "\n" + "".join(",".join(str(record[col]) for col in header) + "\n" for record in records)
+
+    output = "".join(run_bulk(io.BytesIO(text.encode()), score_by_area, "csv", "csv", chunk_size=2))
+    lines = output.splitlines()
+
+    assert lines[0] == "row,prediction,error"
+    assert len(lines) == 6
+    assert [float(line.split(",")[1]) for line in lines[1:]] == [record["Area"] for record in records]
+
+
+def test_enrichment_changes_are_reported_per_row():
+    """Enrichment changes of the scored rows land on their results; CSV serializes them as JSON."""
+    changes = [{"PropAssetNeighborhoodName": "العزيزية"}, None]
+    results = chunk_results([{}, {}, {}], 10, [0, 2], [None, [{"loc": ["Area"]}], None], [1.0, 2.0], [None, None],
+                            enrichment=changes)
+    assert [result["enrichment"] for result in results] == [changes[0], None, None]
+
+    rows = list(csv.DictReader(io.StringIO(format_results(results, "csv", header=True, enrichment=True))))
+    assert list(rows[0]) == ["row", "prediction", "error", "enrichment"]
+    assert json.loads(rows[0]["enrichment"]) == changes[0]
+    assert rows[2]["enrichment"] == ""
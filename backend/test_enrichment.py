@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+import pandas as pd
+from enrichment import Gazetteer, GazetteerEnricher, ModelTablesEnricher
+
+PLACES = pd.DataFrame({
+    'City': ['Riyadh', 'Riyadh', 'Riyadh', 'Jeddah', 'Jeddah'],
+    'Neighborhood': ['', 'العزيزية', 'حي الشفا', '', 'الروضة'],
+    'Latitude': [24.7136, 24.59, float('nan'), 21.4858, 21.56],
+    'Longitude': [46.6753, 46.76, float('nan'), 39.1925, 39.15],
+})
+
+
+def make_record(city, hood, latitude, longitude):
+    return {'PropAssetCityName': city, 'PropAssetNeighborhoodName': hood, 'Latitude': latitude,
+            'Longitude': longitude, 'Area': 500.0}
+
+
+def test_names_and_coordinates_are_corrected_and_cached(tmp_path):
+    """Misspelled names get their gazetteer spelling, misplaced coordinates the place's, across restarts."""
+    cache_path = str(tmp_path / 'cache.sqlite3')
+    enricher = GazetteerEnricher(Gazetteer(PLACES), cache_path)
+    records = [
+        make_record('Riyadh', 'العزيزيه', 24.6, 46.75),   # spelling only
+        make_record('Riyadh', 'الشفاء', 0.0, 0.0),         # default coordinates, hood without coordinates
+        make_record('Riyadh', 'العزيزية', 21.56, 39.15),   # coordinates in another city
+        make_record('Jeddah', 'الروضة', 21.56, 39.15),     # correct
+        make_record('Jeddah', 'حي غير معروف', 21.5, 39.2),  # unknown hood, left to the city fallback
+    ]
+    enriched, changes = asyncio.run(enricher.enrich(records))
+    assert changes[0] == {'PropAssetNeighborhoodName': 'العزيزية'}
+    assert changes[1] == {'PropAssetNeighborhoodName': 'حي الشفا', 'Latitude': 24.7136, 'Longitude': 46.6753}
+    assert changes[2] == {'Latitude': 24.59, 'Longitude': 46.76}
+    assert changes[3] is None and changes[4] is None
+    assert enriched[1]['Area'] == 500.0 and records[1]['PropAssetNeighborhoodName'] == 'الشفاء'
+    enricher.close()
+
+    # A restarted enricher answers from the on-disk cache; a changed gazetteer starts over
+    restarted = GazetteerEnricher(Gazetteer(PLACES), cache_path)
+    assert restarted.enrich_records(records)[1] == changes
+    assert restarted.stats()['cache_hits'] == len(records) and restarted.stats()['cache_misses'] == 0
+    restarted.close()
+    changed = GazetteerEnricher(Gazetteer(PLACES.iloc[:4]), cache_path)
+    assert changed.stats()['cache_size'] == 0
+    changed.close()
+
+
+def test_table_gazetteer_follows_the_current_model_version():
+    """A gazetteer built from the model's tables is rebuilt from the new tables once another version is current."""
+    city_centers = pd.DataFrame({'City_en': ['Riyadh'], 'City_Center_Lat': [24.7136], 'City_Center_Lon': [46.6753]})
+
+    def loader(version, hoods):
+        tables = pd.DataFrame({'PropAssetCityName': 'Riyadh', 'PropAssetNeighborhoodName': hoods})
+        return SimpleNamespace(version=version, preprocessor=SimpleNamespace(city_centers=city_centers,
+                                                                             encoded_neighb_city=tables))
+
+    registry = SimpleNamespace(current_version='v1', current=loader('v1', ['العزيزية']))
+    enricher = ModelTablesEnricher(registry)
+    record = make_record('Riyadh', 'النرجس', 24.7, 46.7)
+    assert enricher.enrich_records([record])[1] == [None]
+
+    registry.current_version, registry.current = 'v2', loader('v2', ['العزيزية', 'حي النرجس'])
+    assert enricher.enrich_records([record])[1] == [{'PropAssetNeighborhoodName': 'حي النرجس'}]
+    assert enricher.stats()['model_version'] == 'v2'
+    enricher.close()
+
+
+def test_city_changes_must_pass_the_city_region_check(artifact_dir):
+    """A matched city replaces the sent one only if it is a known city of the record's region."""
+    places = pd.DataFrame({'City': ['Jeddah', 'Abhar'], 'Neighborhood': ['الروضة', ''],
+                           'Latitude': [21.56, 18.2], 'Longitude': [39.15, 42.5]})
+    enricher = GazetteerEnricher(Gazetteer(places))
+    records = [
+        dict(make_record('Jedda', 'الروضه', 21.56, 39.15), PropAssetRegionName='Makkah'),
+        dict(make_record('Jedda', 'الروضه', 21.56, 39.15), PropAssetRegionName='Riyadh'),
+        dict(make_record('Abha', '', 18.2, 42.5), PropAssetRegionName='Asir'),
+    ]
+    _, changes = enricher.enrich_records(records)
+    assert changes[0] == {'PropAssetCityName': 'Jeddah', 'PropAssetNeighborhoodName': 'الروضة'}
+    # Jeddah is in Makkah, and Abhar is not in the city list
+    assert changes[1] is None and changes[2] is None
+    enricher.close()
@@ -0,0 +1,36 @@
+import asyncio
+import numpy as np
+from micro_batcher import MicroBatcher
+
+
+class RecordingExecutor:
+    """Stands in for PredictionExecutor, scoring each record as its Area."""
+
+    def __init__(self):
+        self.batches = []
+
+    async def run(self, method, features_list):
+        assert method == "predict_batch"
+        self.batches.append(len(features_list))
+        predictions = np.array([features["Area"] for features in features_list], dtype=float)
+        errors = [None if area > 0 else "Error making prediction: bad area" for area in predictions]
+        return predictions, errors, "v1"
+
+
+def test_concurrent_requests_share_a_batch():
+    """Concurrent callers are scored in one batch and each gets its own result or error."""
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = MicroBatcher(executor, window_ms=20, max_size=8)
+        batcher.start()
+        results = await asyncio.gather(
+            *[batcher.predict({"Area": float(area)}) for area in range(-1, 11)], return_exceptions=True
+        )
+        await batcher.stop()
+        return executor.batches, results
+
+    batches, results = asyncio.run(scenario())
+    assert batches == [8, 4]
+    assert str(results[0]) == "Error making prediction: bad area"
+    assert isinstance(results[1], Exception)
+    assert results[2:] == [(float(area), "v1") for area in range(1, 11)]
@@ -0,0 +1,120 @@
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from artifact_bundle import DEFAULT_BUNDLE_DIR, build_bundle
+from conftest import LOADER_KWARGS, PROPERTY
+from model_loader import COMPILED_MAX_ROWS, ModelLoader, ModelRegistry, UnknownModelVersion
+
+pytestmark = pytest.mark.usefixtures("model_dir")
+
+
+def retrain_in_place(learning_rate_factor: float = 0.5):
+    """Stand in for train_model.py --output .: rewrite the model and rebuild the default bundle in place."""
+    with open(LOADER_KWARGS["model_path"], 'rb') as f:
+        model = pickle.load(f)
+    model.learning_rate *= learning_rate_factor
+    with open(LOADER_KWARGS["model_path"], 'wb') as f:
+        pickle.dump(model, f)
+    build_bundle(DEFAULT_BUNDLE_DIR)
+
+
+def test_versions_load_in_background_and_swap(tmp_path):
+    """New versions load beside the current one, can be pinned, activated and are evicted beyond the limit."""
+    registry = ModelRegistry(dict(LOADER_KWARGS, bundle_path=None), max_versions=2, warmup_rows=40)
+    first = registry.current_version
+    expected, _ = registry.predict(PROPERTY)
+
+    copies = []
+    for name in ("second.pkl", "third.pkl"):
+        copies.append(str(tmp_path / name))
+        shutil.copyfile(LOADER_KWARGS["model_path"], copies[-1])
+
+    second = registry.load_in_background(activate=False, model_path=copies[0]).result()
+    assert second != first and registry.current_version == first
+    assert registry.predict(PROPERTY, model_version=second) == (expected, second)
+    assert registry.stats()["versions"][second]["warmup_seconds"] > 0
+
+    registry.activate(second)
+    assert registry.predict(PROPERTY)[1] == second
+
+    # The oldest version nothing routes to is dropped
+    third = registry.load(activate=False, model_path=copies[1])
+    assert list(registry.versions) == [second, third]
+    with pytest.raises(UnknownModelVersion):
+        registry.predict(PROPERTY, model_version=first)
+    registry.shutdown()
+
+
+def test_quantile_models_load_lazily_and_bound_predictions(tmp_path):
+    """Quantile models load on the first interval request and score in the same pass as the point model."""
+    registry = ModelRegistry(LOADER_KWARGS, warmup_rows=8)
+    loader = registry.current
+    records = loader.preprocessor.synthetic_inputs(COMPILED_MAX_ROWS + 8, seed=1)
+    X = pd.DataFrame(loader.preprocessor.build_feature_matrix(records), columns=loader.preprocessor.training_columns)
+    y = loader.model.predict(X)
+    paths = []
+    for alpha in (0.9, 0.1):
+        model = GradientBoostingRegressor(loss='quantile', alpha=alpha, n_estimators=20, random_state=0).fit(X, y)
+        paths.append(str(tmp_path / f"p{int(alpha * 100)}.pkl"))
+        with open(paths[-1], 'wb') as f:
+            pickle.dump(model, f)
+
+    version = registry.load(quantile_model_paths=paths)
+    assert registry.current._quantiles is None
+    predictions, intervals, errors, served = registry.predict_intervals(records)
+    assert served == version and errors == [None] * len(records)
+    np.testing.assert_allclose(predictions, registry.predict_batch(records)[0])
+    assert all(list(interval) == ['p10', 'p90'] and interval['p10'] <= interval['p90'] for interval in intervals)
+    # Compiled single rows match the sklearn pass over the whole batch
+    _, single, _, _ = registry.predict_intervals(records[:1])
+    assert single[0] == pytest.approx(intervals[0])
+    registry.shutdown()
+
+
+def test_lazily_loaded_model_belongs_to_the_opened_bundle():
+    """A bundle rebuilt in place does not hand its model to a loader of the previous bundle."""
+    build_bundle(DEFAULT_BUNDLE_DIR)
+    loader = ModelLoader(**LOADER_KWARGS, bundle_path=DEFAULT_BUNDLE_DIR, cache_size=0)
+    records = loader.preprocessor.synthetic_inputs(COMPILED_MAX_ROWS + 8, seed=2)
+    retrain_in_place()
+
+    # Batches beyond COMPILED_MAX_ROWS unpickle the sklearn model; single rows use the mapped trees
+    batch, _ = loader.predict_batch(records)
+    single = [loader.predict(record)[0] for record in records]
+    np.testing.assert_allclose(batch, single, rtol=1e-9)
+
+
+def test_reloading_a_bundle_rebuilt_in_place_serves_the_new_version():
+    """Loading the served bundle path again after a rebuild opens the rebuilt bundle, not a cached one."""
+    build_bundle(DEFAULT_BUNDLE_DIR)
+    registry = ModelRegistry(dict(LOADER_KWARGS, bundle_path=DEFAULT_BUNDLE_DIR), warmup_rows=8)
+    first = registry.current_version
+    before, _ = registry.predict(PROPERTY)
+
+    retrain_in_place()
+    second = registry.load()
+    assert second != first and registry.current_version == second
+    after, served = registry.predict(PROPERTY)
+    assert served == second and after != before
+    assert after == ModelLoader(**LOADER_KWARGS, bundle_path=DEFAULT_BUNDLE_DIR).predict(PROPERTY)[0]
+    registry.shutdown()
+
+
+def test_rebuilt_bundle_gets_a_fresh_prediction_cache():
+    """Predictions cached for a bundle are not served once the bundle is rebuilt with other artifacts and reloaded."""
+    build_bundle(DEFAULT_BUNDLE_DIR)
+    registry = ModelRegistry(dict(LOADER_KWARGS, bundle_path=DEFAULT_BUNDLE_DIR), warmup_rows=8)
+    cached, _ = registry.predict(PROPERTY)
+    assert registry.predict(PROPERTY)[0] == cached
+    assert registry.current.cache.stats()['hits'] == 1
+
+    retrain_in_place()
+    registry.load()
+    stats = registry.current.cache.stats()
+    assert (stats['size'], stats['hits']) == (0, 0)
+    fresh, _ = registry.predict(PROPERTY)
+    assert fresh != cached and registry.current.cache.stats()['misses'] == stats['misses'] + 1
+    registry.shutdown()
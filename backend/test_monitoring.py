@@ -0,0 +1,36 @@
+import numpy as np
+from monitoring import FeatureMonitor, reference_distributions
+
+
+def test_drift_flags_only_the_shifted_feature():
+    """Recent inputs drawn like the training data stay stable; a shifted feature is flagged."""
+    rng = np.random.default_rng(0)
+    training = np.column_stack([rng.normal(size=20000), rng.integers(0, 4, 20000)])
+    monitor = FeatureMonitor(['continuous', 'discrete'], [1, 2],
+                             reference_distributions(training, ['continuous', 'discrete']), half_life_rows=5000)
+
+    recent = np.column_stack([rng.normal(size=5000), rng.integers(0, 4, 5000)])
+    monitor.observe(np.column_stack([np.zeros(5000), recent]))
+    drift = monitor.drift()
+    assert drift['continuous'] < 0.02 and drift['discrete'] < 0.02
+    quantiles = monitor.report()['features']['continuous']
+    assert abs(quantiles['recent']['p50'] - quantiles['reference']['p50']) < 0.1
+
+    for _ in range(10):
+        shifted = np.column_stack([rng.normal(1.0, size=1000), rng.integers(0, 4, 1000)])
+        monitor.observe(np.column_stack([np.zeros(1000), shifted]))
+    drift = monitor.drift()
+    assert drift['continuous'] > 0.25 and drift['discrete'] < 0.02
+    report = monitor.report()
+    assert report['reference_available'] and report['rows'] == 15000
+    assert report['features']['continuous']['recent']['p50'] > 0.5
+
+
+def test_drift_is_unavailable_without_a_reference():
+    """Without training distributions nothing is sketched and drift is reported as unavailable, not guessed."""
+    monitor = FeatureMonitor(['continuous'], [0], reference=None)
+    monitor.observe(np.random.default_rng(0).normal(size=(100, 1)))
+    assert monitor.drift() is None
+    report = monitor.report()
+    assert not report['reference_available'] and report['rows'] == 0
+    assert report['features']['continuous'] == {'psi': None, 'out_of_range': None, 'recent': None, 'reference': None}
@@ -0,0 +1,58 @@
+import prediction_cache
+from prediction_cache import PredictionCache, canonical_key
+
+RECORD = {
+    "PropAssetNeighborhoodName": " العزيزية ",
+    "PropAssetCityName": "Madinah",
+    "Area": 1050.0,
+    "StreetWidth": 12.0,
+    "Latitude": 24.32,
+    "Longitude": 39.25,
+}
+
+
+def test_canonical_key_matches_validated_inputs():
+    """Keys ignore field order, float noise below the validators' rounding and stripped whitespace."""
+    noisy = dict(reversed(list(RECORD.items())))
+    noisy.update(Area=1050.0000001, Latitude=24.3200000004, PropAssetNeighborhoodName="العزيزية")
+    assert canonical_key(noisy) == canonical_key(RECORD)
+    assert canonical_key(dict(RECORD, Area=1050.01)) != canonical_key(RECORD)
+    assert canonical_key(dict(RECORD, Latitude=24.320001)) != canonical_key(RECORD)
+
+
+def test_least_recently_used_entry_is_evicted():
+    """A full cache drops the entry read or written least recently, and counts the eviction."""
+    cache = PredictionCache(max_size=2, ttl_seconds=0)
+    cache.put(('a',), 1.0)
+    cache.put(('b',), 2.0)
+    assert cache.get(('a',)) == 1.0
+    cache.put(('c',), 3.0)
+    assert cache.get(('b',)) is None
+    assert cache.get(('a',)) == 1.0 and cache.get(('c',)) == 3.0
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    """Entries older than the TTL are misses and counted as expirations; a TTL of 0 keeps them."""
+    now = [100.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    cache = PredictionCache(max_size=10, ttl_seconds=5)
+    forever = PredictionCache(max_size=10, ttl_seconds=0)
+    cache.put(('a',), 1.0)
+    forever.put(('a',), 1.0)
+    now[0] += 4.9
+    assert cache.get(('a',)) == 1.0
+    now[0] += 0.2
+    assert cache.get(('a',)) is None
+    assert forever.get(('a',)) == 1.0
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['expirations']) == (0, 1, 1, 1)
+
+
+def test_disabled_cache_stores_nothing():
+    """max_size 0 disables the cache without counting lookups."""
+    cache = PredictionCache(max_size=0)
+    cache.put(('a',), 1.0)
+    assert cache.get(('a',)) is None
+    assert cache.stats()['size'] == 0 and cache.stats()['misses'] == 0
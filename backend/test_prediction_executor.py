@@ -0,0 +1,80 @@
+import asyncio
+import gc
+import multiprocessing
+import os
+import sys
+import threading
+import pytest
+from conftest import LOADER_KWARGS, PROPERTY
+from model_loader import ModelRegistry
+from prediction_executor import ExecutorSaturated, PredictionExecutor
+
+pytestmark = [
+    pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc/self/smaps_rollup and forks workers"),
+    pytest.mark.usefixtures("model_dir"),
+]
+
+
+def private_memory_kb(barrier) -> tuple:
+    """Return this worker's pid and the memory it does not share with other processes."""
+    # Hold the worker until every worker of the pool has picked up one call
+    barrier.wait(timeout=60)
+    with open("/proc/self/smaps_rollup") as f:
+        fields = dict(line.split(":", 1) for line in f if line.startswith("Private"))
+    return os.getpid(), sum(int(value.split()[0]) for value in fields.values())
+
+
+def worker_private_memory(executor: PredictionExecutor, workers: int) -> dict:
+    async def scenario(barrier):
+        # Score a row in every worker first so lazily loaded state is counted
+        await asyncio.gather(*[executor.run("predict_batch", [PROPERTY] * 64) for _ in range(workers)])
+        return await asyncio.gather(*[asyncio.wrap_future(executor._pool.submit(private_memory_kb, barrier))
+                                      for _ in range(workers)])
+    with multiprocessing.Manager() as manager:
+        return dict(asyncio.run(scenario(manager.Barrier(workers))))
+
+
+def test_preloaded_workers_share_model_memory():
+    """Forked, preloaded workers keep far less private memory than workers loading their own model."""
+    workers = 2
+    registry = ModelRegistry(LOADER_KWARGS)
+    private = {}
+    for preload in (False, True):
+        executor = PredictionExecutor(registry, mode="process", workers=workers, loader_kwargs=LOADER_KWARGS,
+                                      preload=preload)
+        try:
+            private[preload] = worker_private_memory(executor, workers)
+        finally:
+            executor.shutdown()
+        assert len(private[preload]) == workers
+
+    # Shutting the preloaded pool down hands the frozen objects back to the collector
+    assert gc.get_freeze_count() == 0
+    assert max(private[True].values()) < min(private[False].values()) / 2
+
+
+def test_full_queue_rejects_calls_until_a_slot_frees():
+    """Calls beyond the workers and the queue raise ExecutorSaturated and are counted; finished calls free their slot."""
+    registry = ModelRegistry(LOADER_KWARGS, warmup_rows=0)
+    release = threading.Event()
+    original = registry.predict
+    registry.predict = lambda *args, **kwargs: release.wait(timeout=60) and original(*args, **kwargs)
+    executor = PredictionExecutor(registry, mode="thread", workers=1, queue_depth=1)
+
+    async def scenario():
+        held = [asyncio.ensure_future(executor.run("predict", PROPERTY)) for _ in range(executor.capacity)]
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run("predict", PROPERTY)
+        release.set()
+        results = await asyncio.gather(*held)
+        return results, await executor.run("predict", PROPERTY)
+
+    try:
+        held, after = asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+    assert held == [after] * 2
+    stats = executor.stats()
+    assert (stats["in_flight"], stats["completed"], stats["rejected"]) == (0, 3, 1)
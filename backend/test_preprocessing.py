@@ -0,0 +1,168 @@
+import random
+import time
+import numpy as np
+import pytest
+from metrics import FEATURE_FALLBACKS
+from preprocessing import FeaturePreprocessor
+
+BORDERS = [
+    "شارع الرئيسي", "مبنى تجاري", "قطعة ارض", "حديقة عامة", "قطعة رقم بدون",
+    "قطعة رقم 162وشارع عرض 12 م", "ممر مشاة", "مواقف سيارات", "Street 20m", "جار", "غير محدد",
+]
+REGIONS = ["Riyadh", "Makkah", "Madinah", "Eastern Province", "Asir", "Tabuk", "Hail",
+           "Northern Borders", "Jazan", "Najran", "Bahah", "Al Baha", "Jawf", "Qassim"]
+ASSET_TYPES = ["Housing Land", "Commercial Land", "Raw Land", "Farming Land"]
+ASSET_LEVELS = ["A", "B", "C", "D"]
+
+pytestmark = pytest.mark.usefixtures("artifact_dir")
+
+
+def make_corpus(preprocessor: FeaturePreprocessor, size: int = 500, seed: int = 0) -> list:
+    """Generate input records covering known, fallback and unknown lookups."""
+    rng = random.Random(seed)
+    cities = preprocessor.city_centers['City_en'].tolist() + ["Unknown City"]
+    hoods = preprocessor.encoded_neighb_city['PropAssetNeighborhoodName'].tolist() + ["حي غير معروف"]
+    records = []
+    for _ in range(size):
+        records.append({
+            "PropAssetNeighborhoodName": rng.choice(hoods),
+            "PropAssetCityName": rng.choice(cities),
+            "Area": rng.choice([0.0, rng.uniform(50, 50000)]),
+            "LengthFromNorth": rng.uniform(0, 200),
+            "LengthFromSouth": rng.uniform(0, 200),
+            "LengthFromEast": rng.uniform(0, 200),
+            "LengthFromWest": rng.uniform(0, 200),
+            "NorthBorder": rng.choice(BORDERS),
+            "SouthBorder": rng.choice(BORDERS),
+            "East_order": rng.choice(BORDERS),
+            "WestBorder": rng.choice(BORDERS),
+            "StreetWidth": rng.uniform(0, 80),
+            "Latitude": rng.uniform(16, 32),
+            "Longitude": rng.uniform(34, 56),
+            "PropAssetRegionName": rng.choice(REGIONS),
+            "EvaluationAssetTypeName": rng.choice(ASSET_TYPES),
+            "AssetLevelId": rng.choice(ASSET_LEVELS),
+        })
+    return records
+
+
+def test_fast_path_parity():
+    """build_feature_vector must be bit-identical to the DataFrame path."""
+    preprocessor = FeaturePreprocessor()
+    for record in make_corpus(preprocessor):
+        expected = preprocessor.preprocess_features(record)[preprocessor.training_columns].to_numpy(dtype=np.float64)
+        actual = preprocessor.build_feature_vector(record)
+        assert actual.shape == expected.shape
+        assert actual.tobytes() == expected.tobytes(), record
+
+
+def test_feature_matrix_parity():
+    """build_feature_matrix must match build_feature_vector row for row, including lookup fallbacks."""
+    preprocessor = FeaturePreprocessor()
+    corpus = make_corpus(preprocessor, seed=2)
+    expected = np.vstack([preprocessor.build_feature_vector(record) for record in corpus])
+    actual = preprocessor.build_feature_matrix(corpus)
+    assert actual.tobytes() == expected.tobytes()
+
+
+def _count_fallbacks(build) -> dict:
+    before = FEATURE_FALLBACKS.snapshot()
+    build()
+    return {event: count - before.get(event, 0) for event, count in FEATURE_FALLBACKS.snapshot().items()
+            if count != before.get(event, 0)}
+
+
+def test_every_builder_counts_the_same_fallbacks():
+    """Single rows, fast path batches and the DataFrame path must record the same fallback events."""
+    preprocessor = FeaturePreprocessor()
+    corpus = make_corpus(preprocessor, seed=4)
+    expected = _count_fallbacks(lambda: [preprocessor.build_feature_vector(record) for record in corpus])
+    assert _count_fallbacks(lambda: preprocessor.build_feature_matrix(corpus)) == expected
+    assert _count_fallbacks(lambda: preprocessor.preprocess_batch(corpus)) == expected
+
+    regions = [record['PropAssetRegionName'] for record in corpus]
+    # Jazan is a known category without a training column (the model has Jizan); Al Baha is unknown
+    assert expected['untrained_category.PropAssetRegionName'] == regions.count('Jazan')
+    assert expected['unseen_category.PropAssetRegionName'] == regions.count('Al Baha')
+    assert expected['unknown_location'] > 0 and expected['hood_to_city'] > 0
+
+
+def test_unknown_city_uses_nearest_center():
+    """Plots whose city is not found are measured from the nearest city center, matching a brute-force scan."""
+    preprocessor = FeaturePreprocessor()
+    rng = np.random.default_rng(3)
+    latitude, longitude = rng.uniform(16, 32, 200), rng.uniform(34, 56, 200)
+    centers = preprocessor.city_centers[['City_Center_Lat', 'City_Center_Lon']].to_numpy()
+    brute_force = preprocessor.haversine(latitude[:, None], longitude[:, None], centers[:, 0], centers[:, 1]).min(axis=1)
+    _, distances = preprocessor.nearest_city_centers(latitude, longitude)
+    assert np.allclose(distances, brute_force)
+
+    record = make_corpus(preprocessor, size=1)[0]
+    record.update(PropAssetCityName="Unknown City", Latitude=latitude[0], Longitude=longitude[0])
+    trace = {}
+    preprocessor.preprocess_features(record, trace=trace)
+    assert np.isclose(trace['feature_engineering'][0]['distance_from_center_km'], brute_force[0])
+
+
+def test_grid_matrix_parity():
+    """build_grid_matrix must match build_feature_matrix over copies of the template, for known and unknown cities."""
+    preprocessor = FeaturePreprocessor()
+    latitude, longitude = [a.ravel() for a in np.meshgrid(np.linspace(16, 32, 7), np.linspace(34, 56, 9), indexing='ij')]
+    for template in make_corpus(preprocessor, size=20, seed=4):
+        records = [dict(template, Latitude=lat, Longitude=lon) for lat, lon in zip(latitude, longitude)]
+        expected = preprocessor.build_feature_matrix(records)
+        assert preprocessor.build_grid_matrix(template, latitude, longitude).tobytes() == expected.tobytes()
+
+
+def test_sensitivity_matrix_parity():
+    """
+    build_sensitivity_matrix must match build_feature_matrix over copies of the base with the field changed,
+    and a base row passed in must not be built, nor its fallbacks counted, again.
+    """
+    preprocessor = FeaturePreprocessor()
+    descriptions = {border_type: keywords[0] for border_type, keywords in preprocessor.border_keywords.items()}
+    descriptions['Other'] = '-'
+    sweeps = {
+        'StreetWidth': [5.0, 12.0, 20.0, 40.0],
+        'Area': [150.0, 600.0, 2500.0],
+        'AssetLevelId': ['A', 'B', 'C', 'D'],
+        **{col: list(descriptions) for col in preprocessor.border_columns},
+    }
+    for base in make_corpus(preprocessor, size=20, seed=5):
+        for field, values in sweeps.items():
+            records = [dict(base, **{field: descriptions[value] if field in preprocessor.border_columns else value})
+                       for value in values]
+            expected = preprocessor.build_feature_matrix(records)
+            actual = preprocessor.build_sensitivity_matrix(base, field, values)
+            assert actual.tobytes() == expected.tobytes(), (field, base)
+            base_row = preprocessor.build_feature_vector(base)
+            fallbacks = _count_fallbacks(
+                lambda: preprocessor.build_sensitivity_matrix(base, field, values, base_row=base_row))
+            assert fallbacks == {}, (field, base)
+
+
+def test_explanation_fields_cover_every_column():
+    """Every training column is credited to exactly one field, one-hot groups to their input field."""
+    preprocessor = FeaturePreprocessor()
+    matrix = preprocessor._explanation_matrix
+    assert (matrix.sum(axis=1) == 1).all() and matrix.any(axis=0).all()
+    fields = preprocessor.explanation_fields
+    for field in ('AssetLevelId', 'NorthBorder', 'PropAssetCityName', 'PropAssetNeighborhoodName', 'Area'):
+        assert field in fields
+    assert not any(field.startswith('AssetLevelId_') for field in fields)
+    contributions = np.arange(len(preprocessor.training_columns), dtype=float)[None, :]
+    np.testing.assert_allclose(preprocessor.aggregate_contributions(contributions).sum(), contributions.sum())
+
+
+if __name__ == "__main__":
+    test_fast_path_parity()
+    print("Fast path parity: OK")
+
+    preprocessor = FeaturePreprocessor()
+    corpus = make_corpus(preprocessor, size=2000, seed=1)
+    timings = []
+    for record in corpus:
+        start = time.perf_counter()
+        preprocessor.build_feature_vector(record)
+        timings.append(time.perf_counter() - start)
+    print(f"Fast path p50: {np.percentile(timings, 50) * 1e6:.1f}us, p99: {np.percentile(timings, 99) * 1e6:.1f}us")
@@ -0,0 +1,35 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from artifact_bundle import TABLE_NAMES
+from model_loader import ModelLoader
+from preprocessing import FEATURE_SCHEMA_FILE, FeaturePreprocessor
+from train_model import check_serving_parity, load_dataset, train, write_artifacts
+
+
+def test_trained_artifacts_serve_the_training_predictions(artifact_dir):
+    """A retrained artifact set loads through ModelLoader and predicts what training predicted."""
+    records = FeaturePreprocessor().synthetic_inputs(400, seed=3)
+    df = pd.DataFrame(records)
+    df["Price"] = df["Area"] * np.where(df["NorthBorder"] == "شارع", 1500.0, 1000.0)
+    df.to_csv(artifact_dir / "plots.csv", index=False)
+
+    data = load_dataset(str(artifact_dir / "plots.csv"), "Price")
+    result = train(data, "Price", params={"n_estimators": 20, "max_depth": 3})
+    output = artifact_dir / "artifacts"
+    schema = write_artifacts(result, str(output), "Price", str(artifact_dir / "plots.csv"))
+    check_serving_parity(str(output), *result["validation"])
+
+    with open(output / FEATURE_SCHEMA_FILE, encoding="utf-8") as f:
+        assert json.load(f)["version"] == schema["version"]
+    # The tables training used are shipped, not whatever the working directory holds
+    for name in TABLE_NAMES:
+        pd.testing.assert_frame_equal(pd.read_csv(output / f"{name}.csv"), result["tables"][name].reset_index(drop=True))
+    loader = ModelLoader(bundle_path=str(output / "model_bundle"), cache_size=0)
+    assert loader.preprocessor.training_columns == schema["training_columns"]
+    assert loader.tree_engine is not None
+
+    # Serving refuses a schema whose transforms the code does not apply
+    with pytest.raises(ValueError):
+        FeaturePreprocessor(schema={**schema, "log_columns": schema["log_columns"][:-1]})
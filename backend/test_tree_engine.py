@@ -0,0 +1,79 @@
+import numpy as np
+from sklearn.ensemble import GradientBoostingRegressor
+from tree_engine import CompiledTreeEnsemble, StackedTreeEnsembles
+
+
+def make_data(n_samples: int = 500, n_features: int = 12, seed: int = 0) -> tuple:
+    """Mix continuous and one-hot style columns like the training matrix."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_samples, n_features))
+    X[:, n_features // 2:] = rng.random((n_samples, n_features - n_features // 2)) < 0.3
+    y = X[:, 0] * 0.5 + X[:, 1] ** 2 - X[:, -1] + rng.normal(scale=0.1, size=n_samples)
+    return X, y
+
+
+def test_compiled_trees_match_sklearn():
+    """The compiled engine must match model.predict to 1e-9 for single rows and batches."""
+    X, y = make_data()
+    X_test, _ = make_data(seed=1)
+    models = [
+        GradientBoostingRegressor(n_estimators=50, max_depth=4, random_state=0),
+        GradientBoostingRegressor(n_estimators=30, max_depth=6, subsample=0.8, init='zero', random_state=0),
+        GradientBoostingRegressor(n_estimators=30, loss='quantile', alpha=0.9, random_state=0),
+    ]
+    for model in models:
+        model.fit(X, y)
+        engine = CompiledTreeEnsemble(model)
+        np.testing.assert_allclose(engine.predict(X_test), model.predict(X_test), rtol=0, atol=1e-9)
+        for row in X_test[:20]:
+            np.testing.assert_allclose(engine.predict(row[None, :]), model.predict(row[None, :]), rtol=0, atol=1e-9)
+
+
+
+def test_engine_from_memory_mapped_arrays(tmp_path):
+    """An engine rebuilt from saved, memory-mapped node arrays predicts exactly like the original."""
+    X, y = make_data()
+    model = GradientBoostingRegressor(n_estimators=50, max_depth=4, random_state=0).fit(X, y)
+    engine = CompiledTreeEnsemble(model)
+    arrays = {}
+    for name, array in engine.arrays().items():
+        np.save(tmp_path / f"{name}.npy", array)
+        arrays[name] = np.load(tmp_path / f"{name}.npy", mmap_mode='r')
+    loaded = CompiledTreeEnsemble.from_arrays(arrays, engine.init_value, engine.max_depth, engine.n_features)
+    X_test, _ = make_data(seed=1)
+    np.testing.assert_array_equal(loaded.predict(X_test), engine.predict(X_test))
+    np.testing.assert_array_equal(loaded.predict(X_test[:1]), engine.predict(X_test[:1]))
+
+
+def test_contributions_add_up_to_predictions():
+    """Bias plus per-feature contributions reproduces predict, and unused features get nothing."""
+    X, y = make_data()
+    model = GradientBoostingRegressor(n_estimators=50, max_depth=4, random_state=0).fit(X, y)
+    engine = CompiledTreeEnsemble(model)
+    X_test, _ = make_data(seed=1)
+    bias, contributions = engine.contributions(X_test)
+    assert contributions.shape == X_test.shape
+    np.testing.assert_allclose(bias + contributions.sum(axis=1), model.predict(X_test), rtol=0, atol=1e-9)
+    unused = np.setdiff1d(np.arange(engine.n_features), engine.feature[engine.left != np.arange(len(engine.left))])
+    assert not contributions[:, unused].any()
+
+
+def test_stacked_ensembles_match_each_model():
+    """One stacked traversal predicts what every engine predicts on its own, in engine order."""
+    X, y = make_data()
+    models = [
+        GradientBoostingRegressor(n_estimators=50, max_depth=4, random_state=0),
+        GradientBoostingRegressor(n_estimators=30, loss='quantile', alpha=0.1, max_depth=3, random_state=0),
+        GradientBoostingRegressor(n_estimators=40, loss='quantile', alpha=0.9, max_depth=5, random_state=0),
+    ]
+    engines = [CompiledTreeEnsemble(model.fit(X, y)) for model in models]
+    stacked = StackedTreeEnsembles(engines)
+    X_test, _ = make_data(seed=1)
+    for rows in (X_test[:1], X_test):
+        expected = np.column_stack([engine.predict(rows) for engine in engines])
+        np.testing.assert_allclose(stacked.predict(rows), expected, rtol=0, atol=1e-9)
+
+
+if __name__ == "__main__":
+    test_compiled_trees_match_sklearn()
+    print("Compiled tree parity: OK")
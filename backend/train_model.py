@@ -0,0 +1,465 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.preprocessing import StandardScaler
+
+from artifact_bundle import DEFAULT_BUNDLE_DIR, TABLE_NAMES, build_bundle, read_table
+from logging_config import configure_logging
+from model_loader import ModelLoader
+from models import PredictionInput, validate_records
+from monitoring import reference_distributions
+from preprocessing import FEATURE_SCHEMA_FILE, FeaturePreprocessor
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of FEATURE_SCHEMA_FILE changes
+SCHEMA_FORMAT = 1
+
+# Hyperparameters of the shipped model, used unless --trials tunes them
+DEFAULT_PARAMS = {'n_estimators': 300, 'max_depth': 5, 'learning_rate': 0.1, 'subsample': 1.0}
+
+# Plots a neighborhood needs before its own mean SAR/m² outweighs its city's in Encoded_Hood
+ENCODING_SMOOTHING = 20
+
+# Records validated and built at a time, bounding the memory held in per-record dicts
+CHUNK_ROWS = 50000
+
+# Validation rows re-scored through ModelLoader to check the written artifacts reproduce training
+PARITY_ROWS = 1000
+
+# Fields of a plot, as the API receives them
+INPUT_COLUMNS = list(PredictionInput.model_fields)
+STRING_COLUMNS = [name for name, field in PredictionInput.model_fields.items() if field.annotation is str]
+
+
+def load_dataset(path: str, target: str, max_rows: Optional[int] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Read labelled plots and keep those the API would accept, validated exactly as requests are.
+
+    Args:
+        path (str): CSV or Parquet file with the PredictionInput fields and the target column
+        target (str): Column holding the plot's price in SAR
+        max_rows (int, optional): Train on a random sample of at most this many rows. Defaults to all.
+        seed (int, optional): Seed of the sample. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: Validated INPUT_COLUMNS plus the target, one row per accepted plot
+
+    Raises:
+        ValueError: If a required column is missing or no row is valid
+    """
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, dtype={col: str for col in STRING_COLUMNS})
+    missing = [col for col in INPUT_COLUMNS + [target] if col not in df.columns]
+    if missing:
+        raise ValueError(f"{path} is missing columns {missing}")
+
+    df = df[INPUT_COLUMNS + [target]]
+    prices = pd.to_numeric(df[target], errors='coerce')
+    df = df[np.isfinite(prices) & (prices > 0)]
+    if max_rows is not None and len(df) > max_rows:
+        df = df.sample(max_rows, random_state=seed)
+
+    frames = []
+    rejected = 0
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS]
+        valid_indices, valid_records, _ = validate_records(chunk[INPUT_COLUMNS].to_dict('records'))
+        rejected += len(chunk) - len(valid_indices)
+        if valid_records:
+            frame = pd.DataFrame(valid_records, columns=INPUT_COLUMNS)
+            frame[target] = pd.to_numeric(chunk[target].iloc[valid_indices], errors='coerce').to_numpy()
+            frames.append(frame)
+    if not frames:
+        raise ValueError(f"No valid rows in {path}")
+
+    logger.info("Loaded %d plots from %s, %d rejected by input validation", len(df) - rejected, path, rejected)
+    return pd.concat(frames, ignore_index=True)
+
+
+def fit_encoder_categories(df: pd.DataFrame) -> Dict[str, List[str]]:
+    """
+    Collect the categories of the one-hot encoded columns: the values seen in the data, and
+    every type the border classifier can assign.
+
+    Args:
+        df (pd.DataFrame): Training plots
+
+    Returns:
+        Dict[str, List[str]]: Categories by encoded column
+    """
+    categories = dict(FeaturePreprocessor.DEFAULT_ENCODER_CATEGORIES)
+    for col in ('PropAssetRegionName', 'EvaluationAssetTypeName', 'AssetLevelId'):
+        categories[col] = sorted(df[col].astype(str).unique())
+    return categories
+
+
+def fit_target_encodings(df: pd.DataFrame, target: str, smoothing: float = ENCODING_SMOOTHING) -> pd.DataFrame:
+    """
+    Fit the neighborhood and city target encodings, the mean price per m² of each, with
+    neighborhoods shrunk towards their city by smoothing plots.
+
+    Args:
+        df (pd.DataFrame): Training plots
+        target (str): Price column
+        smoothing (float, optional): Weight of the city mean in Encoded_Hood. Defaults to ENCODING_SMOOTHING.
+
+    Returns:
+        pd.DataFrame: The encoded_neighb_city table
+    """
+    frame = pd.DataFrame({
+        'hood': df['PropAssetNeighborhoodName'],
+        'city': df['PropAssetCityName'],
+        'sar_m2': df[target] / df['Area'],
+    })
+    city_means = frame.groupby('city')['sar_m2'].mean()
+    pairs = frame.groupby(['hood', 'city'], sort=True)['sar_m2'].agg(['sum', 'count']).reset_index()
+    prior = pairs['city'].map(city_means)
+    return pd.DataFrame({
+        'PropAssetNeighborhoodName': pairs['hood'],
+        'PropAssetCityName': pairs['city'],
+        'Encoded_Hood': (pairs['sum'] + smoothing * prior) / (pairs['count'] + smoothing),
+        'Encoded_City': prior,
+    })
+
+
+def build_matrix(preprocessor: FeaturePreprocessor, df: pd.DataFrame) -> np.ndarray:
+    """
+    Build the model input rows of plots with the serving feature builder, chunk by chunk.
+
+    Args:
+        preprocessor (FeaturePreprocessor): Preprocessor to build with
+        df (pd.DataFrame): Plots with INPUT_COLUMNS
+
+    Returns:
+        np.ndarray: Array of shape (len(df), len(preprocessor.training_columns))
+    """
+    matrix = np.empty((len(df), len(preprocessor.training_columns)))
+    for start in range(0, len(df), CHUNK_ROWS):
+        records = df.iloc[start:start + CHUNK_ROWS][INPUT_COLUMNS].to_dict('records')
+        matrix[start:start + len(records)] = preprocessor.build_feature_matrix(records)
+    return matrix
+
+
+def _search_space(optuna) -> Dict[str, Any]:
+    distributions = optuna.distributions
+    return {
+        'n_estimators': distributions.IntDistribution(100, 800, step=50),
+        'max_depth': distributions.IntDistribution(3, 8),
+        'learning_rate': distributions.FloatDistribution(0.02, 0.3, log=True),
+        'subsample': distributions.FloatDistribution(0.5, 1.0),
+        'min_samples_leaf': distributions.IntDistribution(1, 50, log=True),
+    }
+
+
+_trial_data = None
+
+
+def _init_trial_worker(X: np.ndarray, y: np.ndarray, X_val: np.ndarray, y_val: np.ndarray):
+    """Keep the tuning data in the worker process, so it is sent once rather than with every trial."""
+    global _trial_data
+    _trial_data = (X, y, X_val, y_val)
+
+
+def _score_params(params: Dict[str, Any]) -> float:
+    """Fit one trial in a worker and return its validation RMSE in the scaled target space."""
+    X, y, X_val, y_val = _trial_data
+    model = GradientBoostingRegressor(**params).fit(X, y)
+    return float(np.sqrt(np.mean((model.predict(X_val) - y_val) ** 2)))
+
+
+def tune(X: np.ndarray, y: np.ndarray, X_val: np.ndarray, y_val: np.ndarray, trials: int,
+         jobs: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Search GBM hyperparameters with Optuna, fitting up to jobs trials at a time in a process pool.
+    The study stays in this process and hands trials to the workers through its ask/tell interface.
+
+    Args:
+        X (np.ndarray): Training rows
+        y (np.ndarray): Scaled training targets
+        X_val (np.ndarray): Validation rows
+        y_val (np.ndarray): Scaled validation targets
+        trials (int): Number of trials
+        jobs (int): Trials fitted in parallel
+        seed (int, optional): Seed of the sampler and the models. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: Best hyperparameters
+
+    Raises:
+        ValueError: If optuna is not installed
+    """
+    try:
+        import optuna
+    except ImportError:
+        raise ValueError("Tuning requires optuna (pip install optuna)")
+
+    study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=seed))
+    search_space = _search_space(optuna)
+    running = {}
+    asked = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_trial_worker,
+                             initargs=(X, y, X_val, y_val)) as pool:
+        while asked < trials or running:
+            while asked < trials and len(running) < jobs:
+                trial = study.ask(search_space)
+                running[pool.submit(_score_params, {**trial.params, 'random_state': seed})] = trial
+                asked += 1
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial = running.pop(future)
+                try:
+                    score = future.result()
+                except Exception as e:
+                    logger.warning("Trial %d failed: %s", trial.number, e)
+                    study.tell(trial, state=optuna.trial.TrialState.FAIL)
+                    continue
+                study.tell(trial, score)
+                logger.info("Trial %d: RMSE %.4f with %s", trial.number, score, trial.params)
+
+    logger.info("Best trial %d: RMSE %.4f", study.best_trial.number, study.best_value)
+    return study.best_params
+
+
+def train(df: pd.DataFrame, target: str, params: Optional[Dict[str, Any]] = None, trials: int = 0,
+          jobs: int = 1, tune_rows: int = 100000, validation_fraction: float = 0.2, seed: int = 0,
+          smoothing: float = ENCODING_SMOOTHING) -> Dict[str, Any]:
+    """
+    Fit every serving artifact from labelled plots: encoder categories, target encodings, the
+    feature and target scalers and the GBM. Feature rows are built by FeaturePreprocessor's
+    serving builders over the fitted artifacts, so the model is trained on exactly the rows the
+    API will build.
+
+    Args:
+        df (pd.DataFrame): Plots from load_dataset
+        target (str): Price column
+        params (Dict[str, Any], optional): GBM hyperparameters. Defaults to DEFAULT_PARAMS.
+        trials (int, optional): Optuna trials tuning the hyperparameters instead; 0 skips tuning. Defaults to 0.
+        jobs (int, optional): Trials fitted in parallel. Defaults to 1.
+        tune_rows (int, optional): Training rows sampled for each trial. Defaults to 100000.
+        validation_fraction (float, optional): Plots held out from fitting for the metrics. Defaults to 0.2.
+        seed (int, optional): Seed of the split, the tuning and the model. Defaults to 0.
+        smoothing (float, optional): Weight of the city mean in Encoded_Hood. Defaults to ENCODING_SMOOTHING.
+
+    Returns:
+        Dict[str, Any]: model, target_scaler, standard_scaler, encoded_neighb_city, the reference
+            tables by CSV file stem, preprocessor, params, metrics, the feature_reference distributions of the numeric model inputs and the
+            held-out plots with their predictions
+    """
+    started = time.perf_counter()
+    order = np.random.default_rng(seed).permutation(len(df))
+    n_validation = int(len(df) * validation_fraction)
+    train_df = df.iloc[order[n_validation:]].reset_index(drop=True)
+    validation_df = df.iloc[order[:n_validation]].reset_index(drop=True)
+
+    # Encodings and categories come from the training split only
+    encodings = fit_target_encodings(train_df, target, smoothing)
+    schema = FeaturePreprocessor.schema_for(fit_encoder_categories(train_df))
+    # The geographic tables are inputs of training, read once and shipped unchanged
+    tables = {name: read_table(name) for name in TABLE_NAMES if name != 'encoded_neighb_city'}
+    tables['encoded_neighb_city'] = encodings
+
+    # Transformed but unscaled features, to fit the feature scaler on
+    unscaled = FeaturePreprocessor(scaler=StandardScaler(with_mean=False, with_std=False), schema=schema,
+                                   tables=tables)
+    X_unscaled = build_matrix(unscaled, train_df)
+    column_index = {col: i for i, col in enumerate(unscaled.training_columns)}
+    scaler_input = pd.DataFrame({
+        col: (train_df[target] / train_df['Area']).to_numpy() if col == 'SARm2' else X_unscaled[:, column_index[col]]
+        for col in unscaled.scaled_columns
+    })
+    standard_scaler = StandardScaler().fit(scaler_input)
+    del X_unscaled, scaler_input
+
+    # The rows the model is fitted on are built exactly as the API builds them
+    preprocessor = FeaturePreprocessor(scaler=standard_scaler, schema=schema, tables=tables)
+    X = build_matrix(preprocessor, train_df)
+    X_validation = build_matrix(preprocessor, validation_df)
+    logger.info("Built %d training and %d validation rows in %.1fs", len(X), len(X_validation),
+                time.perf_counter() - started)
+
+    target_scaler = StandardScaler().fit(np.log1p(train_df[target].to_numpy()).reshape(-1, 1))
+    y = target_scaler.transform(np.log1p(train_df[target].to_numpy()).reshape(-1, 1)).ravel()
+    y_validation = target_scaler.transform(np.log1p(validation_df[target].to_numpy()).reshape(-1, 1)).ravel()
+
+    params = dict(params or DEFAULT_PARAMS)
+    if trials:
+        if not len(X_validation):
+            raise ValueError("Tuning needs a validation split")
+        sample = np.random.default_rng(seed).permutation(len(X))[:tune_rows]
+        params = tune(X[sample], y[sample], X_validation, y_validation, trials, jobs, seed)
+
+    fit_started = time.perf_counter()
+    model = GradientBoostingRegressor(**params, random_state=seed)
+    model.fit(pd.DataFrame(X, columns=preprocessor.training_columns, copy=False), y)
+    logger.info("Fitted %s on %d rows in %.1fs", params, len(X), time.perf_counter() - fit_started)
+
+    raw_validation = model.predict(pd.DataFrame(X_validation, columns=preprocessor.training_columns, copy=False))
+    predictions = np.expm1(target_scaler.inverse_transform(raw_validation.reshape(-1, 1)).ravel())
+    # What the API's drift monitor compares its inputs with
+    numeric_columns = [col for col in preprocessor.MODEL_NUMERIC_COLUMNS if col in preprocessor.training_columns]
+    feature_reference = reference_distributions(
+        X[:, [preprocessor.training_columns.index(col) for col in numeric_columns]], numeric_columns
+    )
+    return {
+        'model': model,
+        'target_scaler': target_scaler,
+        'standard_scaler': standard_scaler,
+        'encoded_neighb_city': encodings,
+        'tables': tables,
+        'preprocessor': preprocessor,
+        'params': {**params, 'random_state': seed},
+        'metrics': evaluate(validation_df[target].to_numpy(), predictions, len(train_df)),
+        'feature_reference': feature_reference,
+        'validation': (validation_df, predictions),
+    }
+
+
+def evaluate(prices: np.ndarray, predictions: np.ndarray, training_rows: int) -> Dict[str, Any]:
+    """
+    Summarize held-out errors.
+
+    Args:
+        prices (np.ndarray): Actual prices
+        predictions (np.ndarray): Predicted prices
+        training_rows (int): Number of plots the model was fitted on
+
+    Returns:
+        Dict[str, Any]: Row counts, RMSE of log prices, and mean and median absolute percentage errors
+    """
+    metrics = {'training_rows': training_rows, 'validation_rows': len(prices)}
+    if len(prices):
+        errors = np.abs(predictions - prices) / prices
+        metrics.update({
+            'rmse_log': float(np.sqrt(np.mean((np.log1p(predictions) - np.log1p(prices)) ** 2))),
+            'mape': float(errors.mean()),
+            'median_ape': float(np.median(errors)),
+        })
+    return metrics
+
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def write_artifacts(result: Dict[str, Any], output_dir: str, target: str, data_path: str) -> Dict[str, Any]:
+    """
+    Write the artifact set the service loads, its FEATURE_SCHEMA_FILE, and compile it into an
+    artifact bundle in output_dir.
+
+    Args:
+        result (Dict[str, Any]): Output of train
+        output_dir (str): Directory of the artifacts, e.g. the backend directory to replace the served ones
+        target (str): Price column the model was trained on
+        data_path (str): Training data, recorded by its hash
+
+    Returns:
+        Dict[str, Any]: The written schema, including its version
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write(name, dump):
+        # Write beside the destination and swap, so a reader never sees a partial file
+        path = os.path.join(output_dir, name)
+        with open(f'{path}.tmp', 'wb') as f:
+            dump(f)
+        os.replace(f'{path}.tmp', path)
+
+    for name, key in (('gbm_optuna_model.pkl', 'model'), ('target_scaler.pkl', 'target_scaler'),
+                      ('standard_scaler.pkl', 'standard_scaler')):
+        write(name, lambda f, obj=result[key]: pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL))
+    # The tables the preprocessor was built over, independent of the working directory
+    for name in TABLE_NAMES:
+        write(f'{name}.csv', lambda f, table=result['tables'][name]: table.to_csv(f, index=False))
+
+    files = ['gbm_optuna_model.pkl', 'target_scaler.pkl', 'standard_scaler.pkl'] + [f'{name}.csv' for name in TABLE_NAMES]
+    schema = {
+        'format': SCHEMA_FORMAT,
+        **result['preprocessor'].feature_schema(),
+        'input_columns': INPUT_COLUMNS,
+        'target': {'column': target, 'transform': 'standard_scaled log1p'},
+        'params': result['params'],
+        'metrics': result['metrics'],
+        'feature_reference': result['feature_reference'],
+        'data': {'path': os.path.basename(data_path), 'sha256': _file_sha256(data_path)},
+        'files': {name: _file_sha256(os.path.join(output_dir, name)) for name in files},
+    }
+    # Same inputs, same version
+    schema['version'] = hashlib.sha256(json.dumps(schema, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+    schema['created_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    write(FEATURE_SCHEMA_FILE, lambda f: f.write(json.dumps(schema, ensure_ascii=False, indent=1).encode()))
+
+    # Compile the bundle from the files just written, through the same loader the service uses
+    with contextlib.chdir(output_dir):
+        read_table.cache_clear()
+        build_bundle(DEFAULT_BUNDLE_DIR)
+    read_table.cache_clear()
+    logger.info("Wrote artifacts version %s to %s", schema['version'], output_dir)
+    return schema
+
+
+def check_serving_parity(output_dir: str, validation_df: pd.DataFrame, predictions: np.ndarray):
+    """
+    Score held-out plots through ModelLoader over the written bundle and require the predictions
+    made during training.
+
+    Raises:
+        RuntimeError: If the service would predict differently
+    """
+    rows = min(PARITY_ROWS, len(validation_df))
+    if not rows:
+        return
+    loader = ModelLoader(bundle_path=os.path.join(output_dir, DEFAULT_BUNDLE_DIR), cache_size=0)
+    served, errors = loader.predict_batch(validation_df.iloc[:rows][INPUT_COLUMNS].to_dict('records'))
+    if any(error is not None for error in errors) or not np.allclose(served, predictions[:rows], rtol=1e-9, atol=0):
+        raise RuntimeError("The written artifacts do not reproduce the training predictions")
+    logger.info("Serving parity checked on %d held-out plots", rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the valuation model and regenerate every serving artifact")
+    parser.add_argument('data', help="CSV or Parquet file of plots with the PredictionInput fields and their price")
+    parser.add_argument('--target', default='Price', help="Price column, in SAR")
+    parser.add_argument('--output', default='.', help="Directory the artifacts and the bundle are written to")
+    parser.add_argument('--trials', type=int, default=0, help="Optuna trials tuning the GBM (requires optuna)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Trials fitted in parallel processes")
+    parser.add_argument('--tune-rows', type=int, default=100000, help="Training rows sampled for every trial")
+    parser.add_argument('--max-rows', type=int, help="Train on a random sample of at most this many plots")
+    parser.add_argument('--subsample', type=float, default=DEFAULT_PARAMS['subsample'],
+                        help="Fraction of the plots each untuned tree is fitted on")
+    parser.add_argument('--validation-fraction', type=float, default=0.2, help="Plots held out for the metrics")
+    parser.add_argument('--smoothing', type=float, default=ENCODING_SMOOTHING,
+                        help="Weight, in plots, of the city mean in each neighborhood encoding")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the split, the tuning and the model")
+    args = parser.parse_args(argv)
+
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+    # Train from the reference CSVs, not from a bundle that is about to be replaced
+    os.environ['ARTIFACT_BUNDLE'] = ''
+    read_table.cache_clear()
+
+    df = load_dataset(args.data, args.target, args.max_rows, args.seed)
+    result = train(df, args.target, params={**DEFAULT_PARAMS, 'subsample': args.subsample}, trials=args.trials,
+                   jobs=args.jobs, tune_rows=args.tune_rows, validation_fraction=args.validation_fraction,
+                   seed=args.seed, smoothing=args.smoothing)
+    schema = write_artifacts(result, args.output, args.target, args.data)
+    check_serving_parity(args.output, *result['validation'])
+    print(f"{args.output}: version {schema['version']}, {json.dumps(result['metrics'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import numpy as np
+from typing import Dict, List
+from sklearn.dummy import DummyRegressor
+from sklearn.ensemble import GradientBoostingRegressor
+
+
+class CompiledTreeEnsemble:
+    def __init__(self, model: GradientBoostingRegressor):
+        """
+        Flatten a fitted GradientBoostingRegressor into contiguous node arrays.
+
+        All trees share one set of arrays (feature, threshold, left, right, value);
+        leaves point to themselves so every tree can be advanced in lockstep.
+
+        Args:
+            model (GradientBoostingRegressor): Fitted model to compile
+
+        Raises:
+            ValueError: If the model's init estimator cannot be reproduced as a constant
+        """
+        if isinstance(model.init_, str) and model.init_ == "zero":
+            self.init_value = 0.0
+        elif isinstance(model.init_, DummyRegressor):
+            self.init_value = float(np.ravel(model.init_.constant_)[0])
+        else:
+            raise ValueError(f"Unsupported init estimator: {type(model.init_).__name__}")
+
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        node_counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+
+        self.n_features = model.n_features_in_
+        self.n_trees = len(trees)
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.roots = offsets.astype(np.intp)
+        self.feature = np.concatenate([np.maximum(tree.feature, 0) for tree in trees]).astype(np.intp)
+        self.threshold = np.concatenate([tree.threshold for tree in trees]).astype(np.float64)
+
+        left = []
+        right = []
+        for tree, offset in zip(trees, offsets):
+            is_leaf = tree.children_left == -1
+            own_index = np.arange(tree.node_count) + offset
+            left.append(np.where(is_leaf, own_index, tree.children_left + offset))
+            right.append(np.where(is_leaf, own_index, tree.children_right + offset))
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+
+        # Leaf values pre-multiplied by the learning rate
+        self.value = np.concatenate([tree.value[:, 0, 0] for tree in trees]) * model.learning_rate
+
+    ARRAY_NAMES = ('roots', 'feature', 'threshold', 'left', 'right', 'value')
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Return the node arrays by name, e.g. to save them with np.save."""
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], init_value: float, max_depth: int,
+                    n_features: int) -> 'CompiledTreeEnsemble':
+        """
+        Rebuild an engine from saved node arrays without the sklearn model.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): Arrays named as in ARRAY_NAMES; read-only memory maps work
+            init_value (float): Constant prediction of the init estimator
+            max_depth (int): Depth of the deepest tree
+            n_features (int): Number of model features
+
+        Returns:
+            CompiledTreeEnsemble: The engine
+        """
+        engine = cls.__new__(cls)
+        for name in cls.ARRAY_NAMES:
+            setattr(engine, name, arrays[name])
+        engine.init_value = float(init_value)
+        engine.max_depth = int(max_depth)
+        engine.n_features = int(n_features)
+        engine.n_trees = len(engine.roots)
+        return engine
+
+    def _check_input(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X has shape {X.shape}, expected (n_samples, {self.n_features})")
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+
+        # sklearn trees compare float32 features against their thresholds
+        return X.astype(np.float32).astype(np.float64)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict raw model outputs, equivalent to GradientBoostingRegressor.predict.
+
+        Args:
+            X (np.ndarray): Feature matrix of shape (n_samples, n_features)
+
+        Returns:
+            np.ndarray: Predictions of shape (n_samples,)
+        """
+        X = self._check_input(X)
+        if X.shape[0] == 1:
+            # Single row: advance all trees together over a 1-D node vector
+            row = X[0]
+            nodes = self.roots
+            for _ in range(self.max_depth):
+                goes_left = row[self.feature[nodes]] <= self.threshold[nodes]
+                nodes = np.where(goes_left, self.left[nodes], self.right[nodes])
+            return np.array([self.init_value + self.value[nodes].sum()])
+
+        # Batch: one (n_samples, n_trees) node matrix indexing into the flattened rows
+        flat = X.ravel()
+        row_offsets = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.max_depth):
+            goes_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(goes_left, self.left[nodes], self.right[nodes])
+
+        return self.init_value + self.value[nodes].sum(axis=1)
+
+    def contributions(self, X: np.ndarray) -> tuple:
+        """
+        Split raw predictions into per-feature contributions. Every split on a row's decision
+        path credits the change in node value it causes to its feature (Saabas' method over the
+        per-node values sklearn stores), so contributions add up exactly to the prediction.
+
+        Args:
+            X (np.ndarray): Feature matrix of shape (n_samples, n_features)
+
+        Returns:
+            tuple: (bias, contributions) - the prediction for an average input, and an array of
+                shape (n_samples, n_features); each row's prediction is bias + its sum
+        """
+        X = self._check_input(X)
+        n_samples = X.shape[0]
+        flat = X.ravel()
+        row_offsets = (np.arange(n_samples) * self.n_features)[:, None]
+        nodes = np.tile(self.roots, (n_samples, 1))
+        contributions = np.zeros(n_samples * self.n_features)
+        for _ in range(self.max_depth):
+            cells = row_offsets + self.feature[nodes]
+            goes_left = flat[cells] <= self.threshold[nodes]
+            children = np.where(goes_left, self.left[nodes], self.right[nodes])
+            # Leaves are their own children and contribute nothing
+            contributions += np.bincount(cells.ravel(), weights=(self.value[children] - self.value[nodes]).ravel(),
+                                         minlength=contributions.size)
+            nodes = children
+
+        bias = self.init_value + self.value[self.roots].sum()
+        return bias, contributions.reshape(n_samples, self.n_features)
+
+
+class StackedTreeEnsembles:
+    def __init__(self, engines: List[CompiledTreeEnsemble]):
+        """
+        Join compiled ensembles over the same features so that one traversal scores all of them.
+
+        The node arrays of every engine are concatenated with shifted child indices; each
+        row then walks all trees of all models in lockstep and the leaf values are summed per model.
+
+        Args:
+            engines (List[CompiledTreeEnsemble]): Engines with the same number of features
+        """
+        n_features = {engine.n_features for engine in engines}
+        if len(n_features) != 1:
+            raise ValueError(f"Engines disagree on the number of features: {sorted(n_features)}")
+        self.n_features = n_features.pop()
+        self.n_models = len(engines)
+        self.max_depth = max(engine.max_depth for engine in engines)
+        self.init_values = np.array([engine.init_value for engine in engines])
+
+        node_offsets = np.concatenate([[0], np.cumsum([len(engine.value) for engine in engines])[:-1]])
+        self.roots = np.concatenate([engine.roots + offset for engine, offset in zip(engines, node_offsets)])
+        self.left = np.concatenate([engine.left + offset for engine, offset in zip(engines, node_offsets)])
+        self.right = np.concatenate([engine.right + offset for engine, offset in zip(engines, node_offsets)])
+        self.feature = np.concatenate([engine.feature for engine in engines])
+        self.threshold = np.concatenate([engine.threshold for engine in engines])
+        self.value = np.concatenate([engine.value for engine in engines])
+        # Position of every model's first tree among the stacked roots
+        self.tree_starts = np.concatenate([[0], np.cumsum([engine.n_trees for engine in engines])[:-1]])
+        self._check_input = engines[0]._check_input
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict raw outputs of every model.
+
+        Args:
+            X (np.ndarray): Feature matrix of shape (n_samples, n_features)
+
+        Returns:
+            np.ndarray: Predictions of shape (n_samples, n_models), columns in engine order
+        """
+        X = self._check_input(X)
+        flat = X.ravel()
+        row_offsets = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        nodes = np.tile(self.roots, (X.shape[0], 1))
+        for _ in range(self.max_depth):
+            goes_left = flat[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(goes_left, self.left[nodes], self.right[nodes])
+
+        return self.init_values + np.add.reduceat(self.value[nodes], self.tree_starts, axis=1)